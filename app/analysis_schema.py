@@ -0,0 +1,85 @@
+import copy
+
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional
+
+
+class TickerAnalysis(BaseModel):
+    ticker: str = Field(
+        ...,
+        description="Тикер акції, наприклад 'AAPL'"
+    )
+    probability_value: int = Field(
+        ...,
+        ge=0,
+        le=100,
+        description="Ймовірність значного інтрадейного тренду після відкриття, ціле 0-100"
+    )
+    confidence: int = Field(
+        ...,
+        ge=1,
+        le=10,
+        description="Рівень впевненості від 1 до 10"
+    )
+    justification: str = Field(
+        ...,
+        description="Коротке пояснення з ключовими факторами"
+    )
+    fundamental_impact: str = Field(
+        ...,
+        description="Ключові слова щодо впливу фундаментальних даних"
+    )
+    extra: Optional[str] = Field(
+        None,
+        description="Додатковий короткий коментар або прогноз"
+    )
+
+    @field_validator("probability_value", mode="before")
+    @classmethod
+    def _strip_percent(cls, value: Any) -> Any:
+        # "75%" від моделей без жорсткої схеми
+        if isinstance(value, str):
+            return value.strip().rstrip("%")
+        return value
+
+
+class AnalysisResponse(BaseModel):
+    """Єдина форма відповіді для одного й кількох тикерів."""
+    analysis: List[TickerAnalysis]
+
+
+# Ключові слова JSON Schema, які не підтримує strict-режим OpenAI (обмеження перевіряє pydantic)
+_UNSUPPORTED_STRICT_KEYS = ("default", "minimum", "maximum", "title")
+
+
+def _strict(node: Any) -> Any:
+    if isinstance(node, dict):
+        node = {k: _strict(v) for k, v in node.items() if k not in _UNSUPPORTED_STRICT_KEYS}
+        if node.get("type") == "object":
+            node["additionalProperties"] = False
+            node["required"] = list(node.get("properties", {}))
+        return node
+    if isinstance(node, list):
+        return [_strict(v) for v in node]
+    return node
+
+
+def openai_response_format() -> Dict[str, Any]:
+    """response_format для OpenAI structured outputs (strict json_schema)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "analysis_response",
+            "strict": True,
+            "schema": _strict(copy.deepcopy(AnalysisResponse.model_json_schema())),
+        },
+    }
+
+
+def parse_analysis(text: str) -> List[Dict[str, Any]]:
+    """Перевіряє відповідь за схемою; повертає записи, відсортовані за probability_value DESC."""
+    records = [rec.model_dump() for rec in AnalysisResponse.model_validate_json(text).analysis]
+    if not records:
+        raise ValueError("No ticker records in response")
+    records.sort(key=lambda x: x["probability_value"], reverse=True)
+    return records
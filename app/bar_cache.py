@@ -0,0 +1,219 @@
+import threading
+
+import numpy as np
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.market_calendar import close_minute
+
+NY_TZ = ZoneInfo("America/New_York")
+
+MINUTE_MS = 60_000
+DAY_MS = 86_400_000
+# Регулярна сесія NYSE у хвилинах від півночі за Нью-Йорком (у скорочені дні закриття раніше)
+SESSION_OPEN_MIN = 9 * 60 + 30
+SESSION_CLOSE_MIN = 16 * 60
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Таймфрейми, які можна отримати з хвилинних свічок
+RESAMPLE_TIMESPANS = ("minute", "hour", "day", "week", "month")
+_INTRADAY_MINUTES = {"minute": 1, "hour": 60}
+
+# Верхня межа пам'яті під кеш (найдавніше використані тикери витісняються)
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def ny_offsets_ms(t_ms: np.ndarray) -> np.ndarray:
+    """Зміщення Нью-Йорка відносно UTC (мс) для кожної мітки; рахується раз на добу."""
+    days, inverse = np.unique(np.asarray(t_ms, dtype=np.int64) // DAY_MS, return_inverse=True)
+    offsets = np.array([
+        # Полудень UTC — завжди той самий календарний день у Нью-Йорку, далеко від переходу на DST
+        datetime.fromtimestamp(int(d) * 86_400 + 43_200, tz=timezone.utc).astimezone(NY_TZ).utcoffset().total_seconds() * 1000
+        for d in days
+    ], dtype=np.int64)
+    return offsets[inverse.reshape(-1)]
+
+
+def session_close_minutes(local_ms: np.ndarray) -> np.ndarray:
+    """Хвилина закриття регулярної сесії для кожної мітки (локальний час); календар — раз на добу."""
+    days, inverse = np.unique(np.asarray(local_ms, dtype=np.int64) // DAY_MS, return_inverse=True)
+    closes = np.array([close_minute(date.fromordinal(EPOCH_ORDINAL + int(d))) for d in days], dtype=np.int64)
+    return closes[inverse.reshape(-1)]
+
+
+def _bucket_keys(local_ms: np.ndarray, multiplier: int, timespan: str) -> np.ndarray:
+    """Початок кошика (локальний час Нью-Йорка, мс) для кожної хвилинної свічки."""
+    day_start = local_ms // DAY_MS * DAY_MS
+    if timespan in _INTRADAY_MINUTES:
+        # Кошики відраховуються від півночі, тож 30m/60m вирівняні на 09:30/10:00
+        step = _INTRADAY_MINUTES[timespan] * multiplier * MINUTE_MS
+        return day_start + (local_ms - day_start) // step * step
+
+    day_index = day_start // DAY_MS
+    if timespan == "day":
+        return day_index // multiplier * multiplier * DAY_MS
+    if timespan == "week":
+        # Тижні Polygon починаються з неділі; 1970-01-01 — четвер
+        week_start = day_index - (day_index + 4) % 7
+        return week_start * DAY_MS
+    if timespan == "month":
+        months = day_index.astype("datetime64[D]").astype("datetime64[M]")
+        return months.astype("datetime64[D]").astype(np.int64) * DAY_MS
+    raise ValueError(f"Непідтримуваний timespan: {timespan}")
+
+
+def align_up(t_ms: int, multiplier: int, timespan: str) -> int:
+    """Найближчий початок кошика не раніше t_ms (для day/week/month — північ за Нью-Йорком)."""
+    offset = int(ny_offsets_ms(np.array([t_ms]))[0])
+    local = t_ms + offset
+    day_start = local // DAY_MS * DAY_MS
+    step = _INTRADAY_MINUTES[timespan] * multiplier * MINUTE_MS if timespan in _INTRADAY_MINUTES else DAY_MS
+    aligned = day_start + -(-(local - day_start) // step) * step
+    return aligned - offset
+
+
+def resample(bars: np.ndarray, multiplier: int, timespan: str) -> np.ndarray:
+    """
+    Перетворює відсортовані хвилинні свічки (n, 6: t, o, h, l, c, v) на свічки
+    multiplier × timespan, вирівняні за часом Нью-Йорка.
+    Внутрішньоденні таймфрейми включають розширені години; day/week/month
+    будуються лише з регулярної сесії 09:30–16:00 (13:00 у скорочені дні), як денні свічки біржі.
+    """
+    if len(bars) == 0:
+        return bars.reshape(0, 6)
+
+    t = bars[:, 0].astype(np.int64)
+    local = t + ny_offsets_ms(t)
+    if timespan not in _INTRADAY_MINUTES:
+        minute_of_day = (local % DAY_MS) // MINUTE_MS
+        regular = (minute_of_day >= SESSION_OPEN_MIN) & (minute_of_day < session_close_minutes(local))
+        bars, local = bars[regular], local[regular]
+        if len(bars) == 0:
+            return bars.reshape(0, 6)
+
+    keys = _bucket_keys(local, multiplier, timespan)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.concatenate((starts[1:], [len(bars)])) - 1
+
+    out = np.empty((len(starts), 6), dtype=np.float64)
+    bucket_local = keys[starts]
+    out[:, 0] = bucket_local - ny_offsets_ms(bucket_local)
+    out[:, 1] = bars[starts, 1]
+    out[:, 2] = np.maximum.reduceat(bars[:, 2], starts)
+    out[:, 3] = np.minimum.reduceat(bars[:, 3], starts)
+    out[:, 4] = bars[ends, 4]
+    out[:, 5] = np.add.reduceat(bars[:, 5], starts)
+    return out
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + MINUTE_MS:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class _Series:
+    __slots__ = ("bars", "coverage")
+
+    def __init__(self):
+        self.bars = np.empty((0, 6), dtype=np.float64)
+        # Відрізки [start, end] (мс UTC), для яких хвилинні дані вже завантажені
+        self.coverage: List[Tuple[int, int]] = []
+
+
+class MinuteBarCache:
+    """
+    Кеш хвилинних свічок у пам'яті: на тикер — один відсортований масив
+    (n, 6) і список відрізків часу, які вже покриті завантаженнями.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._series: "OrderedDict[str, _Series]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def missing(self, ticker: str, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """Відрізки [start_ms, end_ms], яких ще немає в кеші."""
+        with self._lock:
+            series = self._series.get(ticker)
+            coverage = list(series.coverage) if series else []
+        gaps = []
+        cursor = start_ms
+        for start, end in coverage:
+            if end < cursor:
+                continue
+            if start > end_ms:
+                break
+            if start > cursor:
+                gaps.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+        if cursor <= end_ms:
+            gaps.append((cursor, end_ms))
+        return gaps
+
+    def covered_since(self, ticker: str, end_ms: int) -> Optional[int]:
+        """Початок суцільного покриття, що закінчується не раніше end_ms, або None."""
+        with self._lock:
+            series = self._series.get(ticker)
+            if not series:
+                return None
+            for start, end in series.coverage:
+                if start <= end_ms <= end:
+                    return start
+        return None
+
+    def put(self, ticker: str, bars: np.ndarray, start_ms: int, end_ms: int) -> None:
+        """
+        Додає свічки і позначає [start_ms, end_ms] як покритий (навіть якщо свічок немає).
+        Якщо end_ms < start_ms, покриття не змінюється.
+        """
+        with self._lock:
+            series = self._series.get(ticker)
+            if series is None:
+                series = self._series[ticker] = _Series()
+            self._bytes -= series.bars.nbytes
+
+            if len(bars):
+                combined = np.concatenate((bars, series.bars))
+                # Нові дані мають пріоритет над старими з тією ж міткою
+                _, first = np.unique(combined[:, 0], return_index=True)
+                series.bars = combined[first]
+            if end_ms >= start_ms:
+                series.coverage = _merge_ranges(series.coverage + [(start_ms, end_ms)])
+
+            self._bytes += series.bars.nbytes
+            self._series.move_to_end(ticker)
+            self._evict()
+
+    def get(self, ticker: str, start_ms: int, end_ms: int) -> np.ndarray:
+        """Свічки з t у [start_ms, end_ms]."""
+        with self._lock:
+            series = self._series.get(ticker)
+            if series is None:
+                return np.empty((0, 6), dtype=np.float64)
+            self._series.move_to_end(ticker)
+            t = series.bars[:, 0]
+            lo = np.searchsorted(t, start_ms, side="left")
+            hi = np.searchsorted(t, end_ms, side="right")
+            return series.bars[lo:hi].copy()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and len(self._series) > 1:
+            ticker, series = self._series.popitem(last=False)
+            self._bytes -= series.bars.nbytes
+            logger.debug(f"[bar-cache] Витіснено {ticker} ({series.bars.nbytes} байт)")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"tickers": len(self._series), "bytes": self._bytes}
+
+
+minute_cache = MinuteBarCache()
@@ -1,12 +1,18 @@
-import time, requests, random
+import random
 
+import numpy as np
 from dateutil import parser
 from loguru import logger
-from typing import Optional, List
+from typing import Iterator, Optional, List, Tuple, Union
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta, time as dtime
 
 from config import POLYGON_API_KEY
+from app import transport
+from app.singleflight import SingleFlight
+from app.indicator import adx_arrays
+from app.bar_cache import DAY_MS, RESAMPLE_TIMESPANS, align_up, minute_cache, resample
+from app import live_bars, market_calendar, warehouse
 
 MAX_RETRIES = 3
 INITIAL_BACKOFF = 1
@@ -15,24 +21,49 @@ NY_TZ = ZoneInfo("America/New_York")
 # Стандартний час для end_date, якщо передано лише дату
 DEFAULT_END_TIME = dtime(hour=9, minute=45)
 
+# Стовпці масиву свічок
+BAR_COLUMNS = ("t", "o", "h", "l", "c", "v")
+
+# Будувати 5m/1d/... локально з кешованих хвилинних свічок
+MINUTE_CACHE_ENABLED = True
+# Мінімальне вікно хвилинного запиту (днів): один запит покриває і 5m за кілька днів, і 1d за місяць
+MINUTE_WINDOW_DAYS = 30
+# Старіші діапазони запитуються у Polygon одразу в потрібному таймфреймі
+MINUTE_MAX_DAYS = 60
+# Денні свічки завершених днів читати з локального сховища (grouped daily)
+WAREHOUSE_ENABLED = True
+# Максимальний розмір сторінки агрегатів Polygon
+MAX_LIMIT = 50_000
+# Polygon віддає хвилинні свічки із затримкою — свіжіший хвіст не вважається покритим
+MINUTE_COVERAGE_LAG = timedelta(minutes=15)
+# Скільки сесій хвилинної історії засівається в живий буфер при підписці
+LIVE_SEED_SESSIONS = 3
+
+AGGS_URL = "https://api.polygon.io/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start}/{end}"
+
+_polygon_flight = SingleFlight("polygon-aggs")
+
 def _parse_date(end_date: Optional[str]) -> datetime:
     """
     Парсить рядок end_date. Якщо передано лише дату, додає час 09:45 за Нью-Йорком.
     Якщо рядок включає час, використовує його (локалізує в Нью-Йорк, якщо час без часової зони).
+    Дата без часу (або типова), що припала на вихідний чи свято, замінюється
+    закриттям останньої сесії перед нею.
     """
     if end_date is None:
         now_ny = datetime.now(NY_TZ)
         # встановлюємо сьогоднішній день із часом 09:45 New York
-        return now_ny.replace(hour=DEFAULT_END_TIME.hour,
-                              minute=DEFAULT_END_TIME.minute,
-                              second=0, microsecond=0)
+        return market_calendar.last_session_end(now_ny.replace(hour=DEFAULT_END_TIME.hour,
+                                                               minute=DEFAULT_END_TIME.minute,
+                                                               second=0, microsecond=0))
     try:
         dt = parser.isoparse(end_date)
     except (ValueError, TypeError):
         logger.error(f"Невірний формат дати: {end_date}")
         raise
     # Якщо час не вказано (тільки дата без 'T')
-    if 'T' not in end_date:
+    date_only = 'T' not in end_date
+    if date_only:
         dt = dt.replace(hour=DEFAULT_END_TIME.hour,
                         minute=DEFAULT_END_TIME.minute)
     # Локалізуємо час до New York, якщо без tzinfo
@@ -40,23 +71,20 @@ def _parse_date(end_date: Optional[str]) -> datetime:
         dt = dt.replace(tzinfo=NY_TZ)
     else:
         dt = dt.astimezone(NY_TZ)
-    return dt
+    return market_calendar.last_session_end(dt) if date_only else dt
 
-def _get_aggregates(ticker: str, multiplier: int, timespan: str,
-                    start: str, end: str) -> List[dict]:
-    url = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start}/{end}"
-    params = {"apiKey": POLYGON_API_KEY}
+def _request_page(url: str, params: dict) -> dict:
     backoff = INITIAL_BACKOFF
 
     for attempt in range(1, MAX_RETRIES + 1):
-        resp = requests.get(url, params=params, timeout=10)
+        resp = transport.http_get(url, params=params, timeout=10)
         logger.debug(f"Запит до Polygon API: {resp.url}")
         if resp.status_code == 200:
-            return resp.json().get("results", [])
+            return resp.json()
         elif resp.status_code == 429:
             sleep_time = backoff + random.uniform(0, backoff * 0.1)
             logger.warning(f"Rate limit hit, sleeping {sleep_time:.1f}s (attempt {attempt})")
-            time.sleep(sleep_time)
+            transport.sleep(sleep_time)
             backoff *= 2
         else:
             resp.raise_for_status()
@@ -64,54 +92,284 @@ def _get_aggregates(ticker: str, multiplier: int, timespan: str,
     raise RuntimeError(f"Не вдалося отримати дані за {MAX_RETRIES} спроб")
 
 
-def fetch_market_prompt(
-    ticker: str,
-    multiplier: int,
-    timespan: str,
-    days: int,
-    end_date: Optional[str] = None
-) -> str:
+def iter_aggregates(ticker: str, multiplier: int, timespan: str,
+                    start: Union[str, int], end: Union[str, int],
+                    limit: int = MAX_LIMIT) -> Iterator[np.ndarray]:
     """
-    Повертає компактні рядки для кожної свічки у форматі:
-    "timestamp|o:open|h:high|l:low|c:close|v:volume|<індикатори>" кожен у новому рядку.
-
-    end_date може бути ISO-строкою з датою або датою+часом. Якщо передано лише дату,
-    час автоматично встановлюється на 09:45 за Нью-Йорком.
-    Всі часи виводяться в Нью-Йоркській часовій зоні.
+    Генератор сторінок агрегатів: запитує максимальну сторінку і йде за next_url,
+    віддаючи кожну сторінку масивом (n, 6) — повний список свічок у пам'яті не збирається.
     """
-    if days < 0:
-        raise ValueError("Аргумент 'days' має бути невід’ємним")
+    url = AGGS_URL.format(ticker=ticker, multiplier=multiplier, timespan=timespan, start=start, end=end)
+    params = {"adjusted": "true", "sort": "asc", "limit": limit}
+    while url:
+        payload = _request_page(url, {**params, "apiKey": POLYGON_API_KEY})
+        yield bars_to_array(payload.get("results") or [])
+        # next_url вже містить курсор і параметри запиту, крім ключа
+        url, params = payload.get("next_url"), {}
 
-    end_dt = _parse_date(end_date)
-    start_dt = end_dt - timedelta(days=days)
-    # Для API передаємо тільки дати в форматі YYYY-MM-DD
-    s, e = start_dt.date().isoformat(), int(end_dt.timestamp())
 
-    data = _get_aggregates(ticker, multiplier, timespan, s, e)
-    if not data:
-        logger.info("Отримано порожній список даних")
+def _get_aggregates(ticker: str, multiplier: int, timespan: str,
+                    start: Union[str, int], end: Union[str, int]) -> np.ndarray:
+    """Усі сторінки агрегатів одним масивом (n, 6)."""
+    url = AGGS_URL.format(ticker=ticker, multiplier=multiplier, timespan=timespan, start=start, end=end)
+    # Одночасні запити на той самий URL виконуються один раз
+    return _polygon_flight.do(url, lambda: np.concatenate(
+        [bars_to_array([])] + list(iter_aggregates(ticker, multiplier, timespan, start, end))
+    ))
+
+
+def bars_to_array(data: List[dict]) -> np.ndarray:
+    """Перетворює відповідь Polygon на масив (n, 6) зі стовпцями BAR_COLUMNS."""
+    return np.array(
+        [[item.get(key, np.nan) for key in BAR_COLUMNS] for item in data],
+        dtype=np.float64
+    ).reshape(-1, len(BAR_COLUMNS))
+
+
+def _fmt(value: float) -> str:
+    if np.isnan(value):
         return ""
+    text = repr(round(float(value), 4))
+    return text[:-2] if text.endswith(".0") else text
 
-    lines = []
+
+def format_bars(bars: np.ndarray) -> str:
+    """
+    Чисте CPU-обчислення: свічки → індикатори → текст для промпту.
+    Рядок на свічку: "timestamp|o:open|h:high|l:low|c:close|v:volume|DI+:..|DI-:..|ADX:..".
+    """
+    if len(bars) == 0:
+        return ""
+
+    di_plus, di_minus, adx = adx_arrays(bars[:, 2], bars[:, 3], bars[:, 4])
+    indicators = (("DI+", di_plus), ("DI-", di_minus), ("ADX", adx))
     fields = ("o", "h", "l", "c", "v")
-    indicators = ("DI+", "DI-", "ADX")
 
-    for item in data:
-        # Конвертуємо timestamp (мс UTC) в New York
-        utc_dt = datetime.fromtimestamp(item["t"] / 1_000, tz=ZoneInfo("UTC"))
-        ny_dt = utc_dt.astimezone(NY_TZ)
-        # Форматуємо з врахуванням зміщення
-        ts_str = ny_dt.strftime("%Y-%m-%dT%H:%M:%S%z")
-        parts = [ts_str]
+    lines = []
+    for i, row in enumerate(bars):
+        # Конвертуємо timestamp (мс UTC) в New York і форматуємо з врахуванням зміщення
+        ny_dt = datetime.fromtimestamp(row[0] / 1_000, tz=NY_TZ)
+        parts = [ny_dt.strftime("%Y-%m-%dT%H:%M:%S%z")]
 
-        for key in fields:
-            parts.append(f"{key}:{item.get(key, '')}")
+        for key, value in zip(fields, row[1:].tolist()):
+            parts.append(f"{key}:{_fmt(value)}")
 
-        # Додаємо індикатори, якщо є
-        for ind in indicators:
-            if ind in item:
-                parts.append(f"{ind}:{item[ind]}")
+        # Додаємо індикатори, якщо вже визначені
+        for name, values in indicators:
+            if np.isfinite(values[i]):
+                parts.append(f"{name}:{values[i]:.2f}")
 
         lines.append("|".join(parts))
 
-    return "\n".join(lines)
\ No newline at end of file
+    return "\n".join(lines)
+
+
+def _to_ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _stream_minutes(ticker: str, start_ms: int, end_ms: int, covered_until: int) -> int:
+    """Посторінково пише хвилинні свічки [start_ms, end_ms] у кеш; повертає кількість свічок."""
+    count = 0
+    cursor = start_ms
+    for page in iter_aggregates(ticker, 1, 'minute', start_ms, end_ms):
+        count += len(page)
+        if not len(page):
+            continue
+        # Сторінки йдуть за зростанням часу: усе до останньої свічки сторінки вже отримано
+        page_end = min(int(page[-1, 0]), covered_until)
+        minute_cache.put(ticker, page, cursor, page_end)
+        cursor = max(cursor, page_end + 1)
+    minute_cache.put(ticker, bars_to_array([]), cursor, min(end_ms, covered_until))
+    return count
+
+
+def _ensure_minutes(ticker: str, start_ms: int, end_ms: int, covered_until: Optional[int] = None) -> int:
+    """
+    Довантажує в кеш хвилинні свічки для непокритих відрізків [start_ms, end_ms].
+    Покритим вважається лише час до covered_until: новіші свічки ще можуть з'явитися.
+    """
+    covered_until = end_ms if covered_until is None else covered_until
+    count = 0
+    for gap_start, gap_end in minute_cache.missing(ticker, start_ms, end_ms):
+        count += _polygon_flight.do(
+            ("minutes", ticker, gap_start, gap_end),
+            lambda: _stream_minutes(ticker, gap_start, gap_end, covered_until)
+        )
+    return count
+
+
+def backfill_minutes(ticker: str, start_date: str, end_date: Optional[str] = None) -> int:
+    """
+    Довантажує хвилинні свічки за [start_date, end_date] у кеш посторінково —
+    придатне для багатомісячних періодів. Повертає кількість отриманих свічок.
+    """
+    end_dt = _parse_date(end_date) if end_date else datetime.now(NY_TZ)
+    start_dt = datetime.combine(parser.isoparse(start_date).date(), dtime(0), tzinfo=NY_TZ)
+    fresh = _to_ms(datetime.now(NY_TZ) - MINUTE_COVERAGE_LAG)
+    count = _ensure_minutes(ticker, _to_ms(start_dt), _to_ms(end_dt), covered_until=fresh)
+    logger.info(f"[backfill] {ticker} {start_dt.date()}..{end_dt.date()}: {count} хвилинних свічок")
+    return count
+
+
+def live_seed(ticker: str, until_ms: int) -> Tuple[np.ndarray, int]:
+    """
+    Хвилинна історія для засіву живого буфера при підписці: останні LIVE_SEED_SESSIONS
+    сесій до until_ms (першої свічки потоку). Покрита частина береться з кешу, а хвіст,
+    свіжіший за MINUTE_COVERAGE_LAG, — одним запитом до Polygon без запису в кеш:
+    ці хвилини ще можуть уточнюватися. Повертає (bars, start_ms).
+    """
+    now = datetime.now(NY_TZ)
+    start_ms = _to_ms(market_calendar.window_start(now, LIVE_SEED_SESSIONS))
+    cover_end = min(until_ms - 1, _to_ms(now - MINUTE_COVERAGE_LAG))
+    _ensure_minutes(ticker, start_ms, cover_end, covered_until=cover_end)
+    bars = minute_cache.get(ticker, start_ms, cover_end)
+    if cover_end < until_ms - 1:
+        tail = _get_aggregates(ticker, 1, 'minute', cover_end + 1, until_ms - 1)
+        bars = np.concatenate((bars, tail[(tail[:, 0] > cover_end) & (tail[:, 0] < until_ms)]))
+    return bars, start_ms
+
+
+def _bars_from_minutes(ticker: str, multiplier: int, timespan: str,
+                       start_dt: datetime, end_dt: datetime) -> Optional[np.ndarray]:
+    """
+    Будує свічки multiplier × timespan з кешу хвилинних свічок. Частину діапазону,
+    яку кеш не покриває, запитує у Polygon у потрібному таймфреймі.
+    Повертає None, якщо хвилинних даних на кінець діапазону немає.
+    """
+    start_ms, end_ms = _to_ms(start_dt), _to_ms(end_dt)
+    live = live_bars.service
+    if live.running:
+        # Тикер, який аналізують, далі отримує свічки з живого потоку
+        live.watch([ticker])
+        bars = live.window(ticker, start_ms, end_ms)
+        if bars is not None:
+            return resample(bars, multiplier, timespan)
+
+    cover_end = min(end_ms, _to_ms(datetime.now(NY_TZ) - MINUTE_COVERAGE_LAG))
+    minute_start = max(start_ms, end_ms - MINUTE_MAX_DAYS * DAY_MS)
+
+    if minute_cache.missing(ticker, minute_start, cover_end):
+        # Відразу беремо ширше вікно, щоб наступні таймфрейми не потребували запитів
+        window_dt = datetime.combine((end_dt - timedelta(days=MINUTE_WINDOW_DAYS)).date(), dtime(0), tzinfo=NY_TZ)
+        _ensure_minutes(ticker, min(minute_start, _to_ms(window_dt)), end_ms, covered_until=cover_end)
+
+    covered_from = minute_cache.covered_since(ticker, cover_end)
+    if covered_from is None:
+        return None
+    if live.is_watched(ticker):
+        # Історія з REST перед живими свічками — наступні запити обійдуться без REST
+        live.seed(ticker, minute_cache.get(ticker, covered_from, cover_end), covered_from, cover_end)
+
+    boundary = max(start_ms, align_up(covered_from, multiplier, timespan))
+    if boundary > start_ms and timespan in ("week", "month"):
+        # Тиждень/місяць не склеюємо з двох джерел — беремо цілком з Polygon
+        return None
+    bars = resample(minute_cache.get(ticker, boundary, end_ms), multiplier, timespan)
+    if boundary > start_ms:
+        head = _get_aggregates(ticker, multiplier, timespan, start_ms, boundary - 1)
+        bars = np.concatenate((head[head[:, 0] < boundary], bars))
+    return bars
+
+
+def _daily_from_warehouse(ticker: str, start_dt: datetime, end_dt: datetime) -> np.ndarray:
+    """
+    Денні свічки: завершені дні — зі сховища, останній (неповний до end_dt) день —
+    з хвилинного кешу, або з Polygon, якщо хвилинних даних немає.
+    """
+    last_day_dt = datetime.combine(end_dt.date(), dtime(0), tzinfo=NY_TZ)
+    history = warehouse.daily_bars(ticker, start_dt.date(), end_dt.date() - timedelta(days=1))
+
+    last = None
+    if MINUTE_CACHE_ENABLED:
+        last = _bars_from_minutes(ticker, 1, 'day', last_day_dt, end_dt)
+    if last is None:
+        last = _get_aggregates(ticker, 1, 'day', _to_ms(last_day_dt), _to_ms(end_dt))
+    return np.concatenate((history, last))
+
+
+def _window_start(end_dt: datetime, days: Optional[int], sessions: Optional[int]) -> datetime:
+    """Північ першого дня вибірки: `sessions` торгових сесій або `days` календарних днів до end_dt."""
+    if sessions is not None:
+        if sessions < 1:
+            raise ValueError("Аргумент 'sessions' має бути додатним")
+        return market_calendar.window_start(end_dt, sessions)
+    if days is None or days < 0:
+        raise ValueError("Аргумент 'days' має бути невід’ємним")
+    # Діапазон починається з півночі першого дня (як дата YYYY-MM-DD в API)
+    return datetime.combine((end_dt - timedelta(days=days)).date(), dtime(0), tzinfo=NY_TZ)
+
+
+def daily_source_version(ticker: str, sessions: int, end_date: Optional[str] = None) -> str:
+    """
+    Відбиток сховища, з якого fetch_market_bars(ticker, 1, 'day', sessions=..., end_date=...)
+    бере завершені дні (див. warehouse.source_version); без сховища — порожній рядок.
+    """
+    if not WAREHOUSE_ENABLED:
+        return ""
+    end_dt = _parse_date(end_date)
+    start_dt = _window_start(end_dt, None, sessions)
+    return warehouse.source_version(ticker, start_dt.date(), end_dt.date() - timedelta(days=1))
+
+
+def fetch_market_bars(
+    ticker: str,
+    multiplier: int,
+    timespan: str,
+    days: Optional[int] = None,
+    end_date: Optional[str] = None,
+    sessions: Optional[int] = None
+) -> np.ndarray:
+    """
+    Завантажує свічки у вигляді масиву (n, 6) зі стовпцями BAR_COLUMNS.
+    Параметри такі ж, як у fetch_market_prompt. Денні свічки читаються зі сховища
+    grouped daily, таймфрейми з RESAMPLE_TIMESPANS будуються з кешу хвилинних
+    свічок, решта запитується у Polygon напряму.
+    """
+    end_dt = _parse_date(end_date)
+    start_dt = _window_start(end_dt, days, sessions)
+
+    if WAREHOUSE_ENABLED and timespan == 'day' and multiplier == 1:
+        try:
+            return _daily_from_warehouse(ticker, start_dt, end_dt)
+        except warehouse.WarehouseMissError as e:
+            # Сховище наповнюється у фоні; поки що — один запит денних агрегатів тикера
+            logger.info(f"{e}: денні свічки {ticker} беруться з Polygon")
+            return _get_aggregates(ticker, 1, 'day', _to_ms(start_dt), _to_ms(end_dt))
+        except Exception as e:
+            logger.warning(f"Не вдалося прочитати денні свічки {ticker} зі сховища: {e}")
+
+    if MINUTE_CACHE_ENABLED and timespan in RESAMPLE_TIMESPANS:
+        try:
+            bars = _bars_from_minutes(ticker, multiplier, timespan, start_dt, end_dt)
+            if bars is not None:
+                return bars
+        except Exception as e:
+            logger.warning(f"Не вдалося побудувати {multiplier}/{timespan} з хвилинних свічок {ticker}: {e}")
+
+    bars = _get_aggregates(ticker, multiplier, timespan, _to_ms(start_dt), _to_ms(end_dt))
+    if not len(bars):
+        logger.info("Отримано порожній список даних")
+    return bars
+
+
+def fetch_market_prompt(
+    ticker: str,
+    multiplier: int,
+    timespan: str,
+    days: Optional[int] = None,
+    end_date: Optional[str] = None,
+    sessions: Optional[int] = None
+) -> str:
+    """
+    Повертає компактні рядки для кожної свічки у форматі:
+    "timestamp|o:open|h:high|l:low|c:close|v:volume|<індикатори>" кожен у новому рядку.
+
+    end_date може бути ISO-строкою з датою або датою+часом. Якщо передано лише дату,
+    час автоматично встановлюється на 09:45 за Нью-Йорком.
+    Всі часи виводяться в Нью-Йоркській часовій зоні.
+
+    Замість `days` календарних днів можна задати `sessions` — кількість торгових
+    сесій NYSE (з урахуванням вихідних і свят), що закінчуються днем end_date.
+    """
+    return format_bars(fetch_market_bars(ticker, multiplier, timespan, days, end_date, sessions))
@@ -0,0 +1,104 @@
+import threading, time
+
+from collections import deque
+from loguru import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Провайдер тимчасово вимкнений запобіжником."""
+
+
+class CircuitBreaker:
+    """
+    Запобіжник провайдера за частками помилок і 429 у ковзному вікні.
+
+    closed    — запити проходять, результати пишуться у вікно;
+    open      — запити одразу відхиляються до завершення cooldown;
+    half_open — пропускається обмежена кількість пробних запитів:
+                успіх закриває запобіжник, помилка знову відкриває.
+    """
+
+    def __init__(self, name: str, window: float = 60.0, min_calls: int = 5,
+                 error_rate: float = 0.5, rate_limit_trip: int = 2,
+                 cooldown: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.rate_limit_trip = rate_limit_trip
+        self.cooldown = cooldown
+        self.half_open_probes = half_open_probes
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        # (час, успіх, rate_limited)
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info(f"[breaker:{self.name}] half-open, пропускаю пробний запит")
+
+    def _trim(self, now: float) -> None:
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+
+    def _open(self, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._events.clear()
+        logger.warning(f"[breaker:{self.name}] відкрито: {reason}")
+
+    def allow(self) -> bool:
+        """Чи можна зараз надіслати запит провайдеру."""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._events.clear()
+                logger.info(f"[breaker:{self.name}] закрито після успішної проби")
+                return
+            now = time.monotonic()
+            self._events.append((now, True, False))
+            self._trim(now)
+
+    def record_failure(self, rate_limited: bool = False) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open("проба невдала")
+                return
+            if self._state == OPEN:
+                return
+
+            now = time.monotonic()
+            self._events.append((now, False, rate_limited))
+            self._trim(now)
+
+            limited = sum(1 for _, _, rl in self._events if rl)
+            failures = sum(1 for _, ok, _ in self._events if not ok)
+            if limited >= self.rate_limit_trip:
+                self._open(f"{limited} відповідей 429 за {self.window:.0f}s")
+            elif len(self._events) >= self.min_calls and failures / len(self._events) >= self.error_rate:
+                self._open(f"{failures}/{len(self._events)} помилок за {self.window:.0f}s")
@@ -0,0 +1,300 @@
+import asyncio, json
+
+from loguru import logger
+from datetime import datetime
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ParseMode
+from telegram.ext import (
+    ContextTypes
+)
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.utils_ai import validate_date, update_history, update_feedback, load_tickers, analysis_key
+from app.chart_data import daily_source_version, fetch_market_bars, format_bars
+from app.compute_pool import build_sections
+from app.feature_store import get_store as get_feature_store
+from app.financial_data import fetch_financial_prompt
+from app.llm_provider import analyze_ticker, analyze_tickers, check_analysis_budget
+from app.session_features import features_for, format_features
+from app.usage_manager import BudgetExceededError
+from app.singleflight import AsyncSingleFlight
+from app.scheduler import scheduler, BULK, INTERACTIVE, QueueFullError
+
+_analysis_flight = AsyncSingleFlight("analysis")
+
+# Вікна даних у торгових сесіях NYSE (вихідні й свята не з'їдають вибірку)
+INTRADAY_SESSIONS = 3
+MULTI_INTRADAY_SESSIONS = 2
+DAILY_SESSIONS = 21
+
+# Частини сховища ознак (вікно входить у назву: одиночний і масовий аналіз беруть різні вікна)
+FUNDAMENTALS_PART = "fundamentals"
+
+
+def _bars_part(timespan: str, sessions: int) -> str:
+    return f"{timespan}:{sessions}"
+
+
+def _daily_part_name(ticker: str, date_str: str, sessions: int) -> str:
+    """Назва частини денних свічок з відбитком сховища: переналиті дні й нові спліти дають нову назву."""
+    return f"{_bars_part('1d', sessions)}@{daily_source_version(ticker, sessions, end_date=date_str)}"
+
+
+def _daily_part(bars: np.ndarray) -> Dict[str, Any]:
+    """Текст денних свічок з індикаторами та кількість сесій, що в них потрапили."""
+    return {"text": format_bars(bars), "sessions": len(bars)}
+
+
+def _daily_complete(value: Dict[str, Any]) -> bool:
+    """Вікно без пропущених сесій (порожній grouped daily, відсутня партиція) — лише таке зберігається."""
+    return value["sessions"] == DAILY_SESSIONS
+
+
+def _intraday_part(ticker: str, bars: np.ndarray) -> Dict[str, str]:
+    """Текст 5-хвилинних свічок з індикаторами та ознаки сесії — так вони зберігаються у сховищі."""
+    return {"text": format_bars(bars), "session": format_features(features_for(ticker, bars))}
+
+
+def _run_analysis(provider: str, command: str, ticker: str, date_str: str, user_id: int):
+    """Блокуючий конвеєр аналізу одного тикера; виконується в окремому потоці."""
+    store = get_feature_store()
+    intraday = store.get_or_compute(ticker, date_str, _bars_part("5m", INTRADAY_SESSIONS), lambda: _intraday_part(
+        ticker, fetch_market_bars(ticker, 5, 'minute', sessions=INTRADAY_SESSIONS, end_date=date_str)
+    ))
+    part_1d = _daily_part_name(ticker, date_str, DAILY_SESSIONS)
+    daily = store.get_or_compute(ticker, date_str, part_1d, lambda: _daily_part(
+        fetch_market_bars(ticker, 1, 'day', sessions=DAILY_SESSIONS, end_date=date_str)
+    ), storable=_daily_complete)
+    fundamental_data = store.get_or_compute(ticker, date_str, FUNDAMENTALS_PART, lambda: fetch_financial_prompt(
+        ticker, filing_date_to=date_str
+    ))
+
+    outcome = analyze_ticker(provider, ticker, intraday["text"], daily["text"], fundamental_data,
+                             user_id=user_id, command=command, session_data=intraday["session"])
+    update_history(ticker, outcome.result, date_str, outcome)
+    return outcome.result
+
+
+def _fetch_ticker_data(ticker: str, date_str: str) -> Tuple[Any, Any, str]:
+    """
+    Блокуюче завантаження свічок 5m, 1d та фундаментальних даних одного тикера.
+    Для свічок, уже готових у сховищі ознак, повертається збережене значення замість масиву.
+    """
+    store = get_feature_store()
+    bars_5m = store.get(ticker, date_str, _bars_part("5m", MULTI_INTRADAY_SESSIONS))
+    if bars_5m is None:
+        bars_5m = fetch_market_bars(
+            ticker, multiplier=5, timespan='minute', sessions=MULTI_INTRADAY_SESSIONS,
+            end_date=date_str
+        )
+    bars_1d = store.get(ticker, date_str, _daily_part_name(ticker, date_str, DAILY_SESSIONS))
+    if bars_1d is None:
+        bars_1d = fetch_market_bars(
+            ticker, multiplier=1, timespan='day', sessions=DAILY_SESSIONS,
+            end_date=date_str
+        )
+    fundamental_data = store.get_or_compute(ticker, date_str, FUNDAMENTALS_PART, lambda: fetch_financial_prompt(
+        ticker, filing_date_to=date_str
+    ))
+    return bars_5m, bars_1d, fundamental_data
+
+
+def _store_multi_results(outcome, date_str: str) -> None:
+    for rec in outcome.result:
+        try:
+            update_history(rec["ticker"], rec, date_str, outcome)
+        except Exception:
+            logger.warning(f"Не вдалося оновити історію для {rec['ticker']}")
+
+
+async def _run_multi_analysis(provider: str, command: str, tickers: List[str], date_str: str, user_id: int):
+    """
+    Масовий аналіз: завантаження кожного тикера — окрема задача bulk-смуги
+    планувальника, потім одна задача LLM для всіх тикерів.
+    """
+    # 4) Збираємо дані для кожного тикера
+    bars: Dict[Tuple[str, str], Any] = {}
+    fundamental_map: Dict[str, str] = {}
+
+    fetched = await scheduler.submit_many(user_id, BULK, [
+        (lambda tk=tk: asyncio.to_thread(_fetch_ticker_data, tk, date_str)) for tk in tickers
+    ])
+    for tk, data in zip(list(tickers), fetched):
+        if isinstance(data, QueueFullError):
+            raise data
+        if isinstance(data, Exception):
+            logger.error(f"Error fetching data for {tk}: {data}")
+            # Якщо не вдалося отримати дані для цього тикера — виключаємо його
+            tickers.remove(tk)
+            continue
+        bars[(tk, "5m")], bars[(tk, "1d")], fundamental_map[tk] = data
+
+    # 5) Індикатори й текст секцій (пул процесів, якщо увімкнено), аналіз усіх одразу й ранжування
+    def analyze():
+        store = get_feature_store()
+        # Рахуються лише частини, яких не було у сховищі
+        jobs = {key: value for key, value in bars.items() if isinstance(value, np.ndarray)}
+        sections = build_sections(jobs)
+        for (tk, timespan), text in sections.items():
+            if timespan == "5m":
+                value = {"text": text, "session": format_features(features_for(tk, bars[(tk, timespan)]))}
+                store.put(tk, date_str, _bars_part(timespan, MULTI_INTRADAY_SESSIONS), value)
+            else:
+                value = {"text": text, "sessions": len(bars[(tk, timespan)])}
+                if _daily_complete(value):
+                    store.put(tk, date_str, _daily_part_name(tk, date_str, DAILY_SESSIONS), value)
+            bars[(tk, timespan)] = value
+        data_5m_map = {tk: bars[(tk, "5m")]["text"] for tk in tickers}
+        data_1d_map = {tk: bars[(tk, "1d")]["text"] for tk in tickers}
+        session_map = {tk: bars[(tk, "5m")]["session"] for tk in tickers}
+        outcome = analyze_tickers(provider, tickers, data_5m_map, data_1d_map, fundamental_map,
+                                  user_id=user_id, command=command, session_data_map=session_map)
+        _store_multi_results(outcome, date_str)
+        return outcome.result
+
+    return await scheduler.submit(user_id, BULK, lambda: asyncio.to_thread(analyze))
+
+
+def _feedback_markup(ticker: str, date_str: str) -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton("Успіх", callback_data=f"feedback:success:{ticker}:{date_str}"),
+            InlineKeyboardButton("Невдалий", callback_data=f"feedback:failure:{ticker}:{date_str}")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def make_analyze_command(provider: str, command: str):
+    """Створює обробник /<command> TICKER [YYYY-MM-DD] для провайдера."""
+
+    async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        args = context.args
+        if len(args) < 1 or len(args) > 2:
+            await update.message.reply_text(f"Будь ласка, використовуйте /{command} <TICKER> [YYYY-MM-DD]")
+            return
+
+        ticker = args[0].upper()
+
+        # Визначаємо дату аналізу
+        target_date = datetime.now()
+        if len(args) == 2:
+            dt = validate_date(args[1])
+            if not dt:
+                await update.message.reply_text("Невірний формат дати. Використовуйте YYYY-MM-DD.")
+                return
+            target_date = dt
+
+        date_str = target_date.strftime('%Y-%m-%d')
+        await update.message.reply_text(
+            f"Починаю аналіз тикера {ticker} за дату {date_str}..."
+        )
+        try:
+            # Однакові одночасні запити (тикер, дата, промпт, ваги) виконуються один раз
+            user_id = update.effective_user.id
+            # Бюджет перевіряється і для тих, хто приєднується до чужого аналізу
+            await asyncio.to_thread(check_analysis_budget, provider, user_id)
+            # Хеші промпту й ваг читаються зі сховища стану — не в event loop
+            key = await asyncio.to_thread(analysis_key, ticker, date_str, provider, user_id)
+            result = await _analysis_flight.do(
+                key,
+                lambda: scheduler.submit(user_id, INTERACTIVE, lambda: asyncio.to_thread(
+                    _run_analysis, provider, command, ticker, date_str, user_id
+                ))
+            )
+
+            pretty = json.dumps(result, ensure_ascii=False, indent=2)
+            await update.message.reply_text(f"<pre>{pretty}</pre>", parse_mode=ParseMode.HTML)
+        except (BudgetExceededError, QueueFullError) as e:
+            await update.message.reply_text(str(e))
+        except Exception as e:
+            logger.error(f"Error analyzing {ticker}: {e}")
+            await update.message.reply_text(f"Помилка під час аналізу {ticker}.")
+
+    analyze.__name__ = command
+    return analyze
+
+
+def make_analyze_all_command(provider: str, command: str):
+    """Створює обробник /<command> [TICKER ...] [YYYY-MM-DD] для провайдера."""
+
+    async def analyze_all(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        args = context.args[:]  # копія списка аргументів
+        # 1) Визначаємо дату, якщо передано останнім аргументом
+        target_date = datetime.now()
+        ticker_args: List[str] = []
+        if args:
+            dt = validate_date(args[-1])
+            if dt:
+                target_date = dt
+                args = args[:-1]
+            # Якщо після видалення дати є інші args — це тикери
+            if args:
+                # розбиваємо усі передані токени за пробілами
+                for token in args:
+                    ticker_args += [t.strip().upper() for t in token.split(' ') if t.strip()]
+
+        # 2) Якщо тикери не передали — завантажуємо усі з CSV
+        if ticker_args:
+            tickers = ticker_args
+        else:
+            tickers = load_tickers()
+
+        date_str = target_date.strftime('%Y-%m-%d')
+
+        # 3) Сповіщаємо користувача про початок
+        await update.message.reply_text(
+            f"Починаю аналіз тикерів на {date_str}: {', '.join(tickers)}"
+        )
+
+        # 4-5) Збираємо дані й аналізуємо (однакові одночасні запити виконуються один раз)
+        user_id = update.effective_user.id
+        try:
+            await asyncio.to_thread(check_analysis_budget, provider, user_id, len(tickers))
+            key = await asyncio.to_thread(analysis_key, tuple(tickers), date_str, provider, user_id)
+            ranked_results = await _analysis_flight.do(
+                key,
+                lambda: _run_multi_analysis(provider, command, list(tickers), date_str, user_id)
+            )
+        except (BudgetExceededError, QueueFullError) as e:
+            await update.message.reply_text(str(e))
+            return
+        except Exception as e:
+            logger.error(f"Error in multi-ticker analysis: {e}")
+            await update.message.reply_text("Не вдалося виконати масовий аналіз. Спробуйте пізніше.")
+            return
+
+        # 6) Надсилаємо відсортований результат
+        for rec in ranked_results:
+            tk = rec["ticker"]
+            pretty = json.dumps(rec, ensure_ascii=False, indent=2)
+            await update.message.reply_text(
+                f"<b>[{tk}] {date_str}</b>\n<pre>{pretty}</pre>",
+                parse_mode=ParseMode.HTML,
+                reply_markup=_feedback_markup(tk, date_str)
+            )
+
+    analyze_all.__name__ = command
+    return analyze_all
+
+
+async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+
+    # Parse callback data: "feedback:result:ticker:date"
+    _, result, ticker, date = query.data.split(':')
+
+    # Update history with feedback
+    if update_feedback(ticker, date, result):
+        await query.edit_message_text(
+            text=f"{query.message.text}\n\n✅ Відгук збережено: {result}",
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await query.edit_message_text(
+            text=f"{query.message.text}\n\n❌ Не вдалося зберегти відгук",
+            parse_mode=ParseMode.HTML
+        )
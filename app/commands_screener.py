@@ -0,0 +1,57 @@
+import asyncio
+
+from loguru import logger
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from app.scheduler import scheduler, BULK, QueueFullError
+from app.screener import screen, SORT_KEYS, TOP_N
+from app.warehouse import WarehouseMissError
+
+
+async def screener(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Command: /screener [score|gap|rvol|atr] [N]"""
+    sort, top = "score", TOP_N
+    for arg in context.args:
+        if arg.isdigit():
+            top = max(1, min(int(arg), 100))
+        elif arg.lower() in SORT_KEYS:
+            sort = arg.lower()
+        else:
+            await update.message.reply_text(f"Використання: /screener [{'|'.join(SORT_KEYS)}] [N]")
+            return
+
+    await update.message.reply_text("Сканую ринок...")
+    try:
+        candidates = await scheduler.submit(
+            update.effective_user.id, BULK, lambda: asyncio.to_thread(screen, sort, top)
+        )
+    except QueueFullError as e:
+        await update.message.reply_text(str(e))
+        return
+    except WarehouseMissError as e:
+        logger.info(f"Screener: {e}")
+        await update.message.reply_text("Історія денних свічок ще завантажується. Спробуйте за кілька хвилин.")
+        return
+    except Exception as e:
+        logger.error(f"Screener failed: {e}")
+        await update.message.reply_text("Не вдалося виконати сканування. Спробуйте пізніше.")
+        return
+
+    if not candidates:
+        await update.message.reply_text("Кандидатів не знайдено.")
+        return
+
+    lines = [f"{'ticker':<6} {'price':>9} {'gap%':>7} {'rvol':>6} {'atr':>6} {'score':>6}"]
+    for row in candidates:
+        lines.append(
+            f"{row['ticker']:<6} {row['price']:>9} {row['gap']:>7} {row['rvol']:>6} {row['atr']:>6} {row['score']:>6}"
+        )
+    tickers = " ".join(row["ticker"] for row in candidates)
+
+    await update.message.reply_text(
+        f"🔎 <b>Кандидати ({sort}):</b>\n<pre>" + "\n".join(lines) + "</pre>\n"
+        f"Для аналізу:\n<code>/analyze_all_gpt {tickers}</code>",
+        parse_mode=ParseMode.HTML
+    )
@@ -0,0 +1,31 @@
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from app.llm_provider import get_provider
+from app.usage_manager import get_usage_report
+
+
+async def usage(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Command: /usage"""
+    report = get_usage_report(update.effective_user.id)
+
+    response = (
+        "📊 <b>Використання токенів:</b>\n\n"
+        f"Сьогодні: {report['daily']} / {report['daily_budget']}\n"
+        f"Цей місяць: {report['monthly']} / {report['monthly_budget']}\n"
+    )
+    if report["breakdown"]:
+        response += "\n<b>За командами (місяць):</b>\n"
+        for name, row in sorted(report["breakdown"].items(), key=lambda kv: -kv[1]["tokens"]):
+            response += f"  - {name}: {row['tokens']} токенів, {row['calls']} запитів\n"
+
+    cache = get_provider("gemini").context_cache_stats()
+    if cache["cached"] or cache["skipped"]:
+        response += (
+            f"\n<b>Кеш контексту Gemini:</b> {cache['cached']} запитів з кешем "
+            f"({cache['cached_tokens']} токенів), {cache['skipped']} без кешу — "
+            f"префікс коротший за мінімум моделі\n"
+        )
+
+    await update.message.reply_text(response, parse_mode=ParseMode.HTML)
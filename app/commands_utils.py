@@ -1,25 +1,122 @@
-from telegram import Update
+import asyncio, html
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
 from telegram.ext import (
     ContextTypes
 )
-from app.utils_ai import load_history
+from typing import Dict, List, Optional, Tuple
+from app.history_store import get_store
+from app.llm_provider import HEDGE_PARTNERS
+from app.utils_ai import validate_date
+from app.scheduler import scheduler
+
+HISTORY_USAGE = "Використання: /history [TICKER] [FROM] [TO] [provider]"
+FEEDBACK_MARKS = {"success": "✅", "failure": "❌"}
+
+
+def _parse_history_args(args: List[str]) -> Optional[Dict[str, Optional[str]]]:
+    filters = {"ticker": None, "date_from": None, "date_to": None, "provider": None}
+    for arg in args:
+        if validate_date(arg):
+            key = "date_from" if filters["date_from"] is None else "date_to"
+            if filters[key] is not None:
+                return None
+            filters[key] = arg
+        elif arg.lower() in HEDGE_PARTNERS:
+            filters["provider"] = arg.lower()
+        elif arg.replace(".", "").isalpha() and filters["ticker"] is None:
+            filters["ticker"] = arg.upper()
+        else:
+            return None
+    return filters
+
+
+# callback_data обмежена 64 байтами: дати без дефісів, фільтри через "|"
+def _pack(filters: Dict[str, Optional[str]], cursor: str) -> str:
+    dates = [(filters[k] or "").replace("-", "") for k in ("date_from", "date_to")]
+    return "|".join(["history", filters["ticker"] or "", *dates, filters["provider"] or "",
+                     cursor.replace("-", "")])
+
+
+def _unpack(data: str) -> Tuple[Dict[str, Optional[str]], str]:
+    _, ticker, date_from, date_to, provider, cursor = data.split("|")
+    undash = lambda d: f"{d[:4]}-{d[4:6]}-{d[6:8]}" if d else None
+    date, _, row_id = cursor.partition("/")
+    filters = {"ticker": ticker or None, "date_from": undash(date_from), "date_to": undash(date_to),
+               "provider": provider or None}
+    return filters, f"{undash(date)}/{row_id}"
+
+
+def _render_history(filters: Dict[str, Optional[str]], cursor: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Текст сторінки історії та курсор наступної сторінки (блокуючий запит до SQLite)."""
+    store = get_store()
+    rows, next_cursor = store.query(cursor=cursor, **filters)
+    if not rows and cursor is None:
+        return "Історія аналізів порожня.", None
+
+    label = ", ".join(v for v in (filters["ticker"], filters["date_from"], filters["date_to"],
+                                   filters["provider"]) if v)
+    response = f"📜 <b>Історія аналізів</b>{f' ({html.escape(label)})' if label else ''}:\n\n"
+
+    if cursor is None:
+        lines = [f"{'ticker':<7}{'n':>5}{'avg%':>7}{'hit':>9}"]
+        for agg in store.aggregates(**filters):
+            mean = f"{agg['mean_probability']:.1f}" if agg["mean_probability"] is not None else "-"
+            hits = f"{agg['hit_rate'] * agg['feedback']:.0f}/{agg['feedback']}" if agg["feedback"] else "-"
+            lines.append(f"{agg['ticker']:<7}{agg['count']:>5}{mean:>7}{hits:>9}")
+        response += "<pre>" + html.escape("\n".join(lines)) + "</pre>\n"
+
+    lines = []
+    for row in rows:
+        prob = f"{row['probability']}%" if row["probability"] is not None else "N/A"
+        conf = f"{row['confidence']}/10" if row["confidence"] is not None else ""
+        mark = FEEDBACK_MARKS.get(row["feedback"], "")
+        lines.append(f"{row['date']} {row['ticker']:<6}{prob:>5} {conf:>5} {row['provider'] or '':<6} {mark}")
+    response += "<pre>" + html.escape("\n".join(lines)) + "</pre>"
+    return response, next_cursor
+
+
+def _next_page_markup(filters: Dict[str, Optional[str]], next_cursor: Optional[str]) -> Optional[InlineKeyboardMarkup]:
+    if next_cursor is None:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Далі ▶", callback_data=_pack(filters, next_cursor))]])
+
 
 async def history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_id = update.effective_user.id
-    history_data = load_history()
-    
-    if not history_data:
-        await update.message.reply_text("Історія аналізів порожня.")
+    """Command: /history [TICKER] [FROM] [TO] [provider]"""
+    filters = _parse_history_args(context.args)
+    if filters is None:
+        await update.message.reply_text(HISTORY_USAGE)
         return
-    
-    response = "📜 <b>Історія аналізів:</b>\n\n"
-    for ticker, dates in history_data.items():
-        response += f"<b>{ticker}</b>:\n"
-        for date, analysis in dates.items():
-            result = analysis.get("result", {})
-            prob = result.get("intraday_trend_movement_probability", {}).get("probability_value", "N/A")
-            response += f"  - {date}: {prob}\n"
-        response += "\n"
-    
-    await update.message.reply_text(response, parse_mode=ParseMode.HTML)
\ No newline at end of file
+
+    response, next_cursor = await asyncio.to_thread(_render_history, filters, None)
+    await update.message.reply_text(response, parse_mode=ParseMode.HTML,
+                                    reply_markup=_next_page_markup(filters, next_cursor))
+
+
+async def history_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопка "Далі" під /history: наступна сторінка замість поточної."""
+    query = update.callback_query
+    await query.answer()
+    filters, cursor = _unpack(query.data)
+    response, next_cursor = await asyncio.to_thread(_render_history, filters, cursor)
+    await query.edit_message_text(text=response, parse_mode=ParseMode.HTML,
+                                  reply_markup=_next_page_markup(filters, next_cursor))
+
+async def queue_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Command: /queue"""
+    stats = scheduler.stats()
+
+    response = (
+        "⏳ <b>Черга задач:</b>\n\n"
+        f"У черзі: {stats['queued']} / {stats['max_queue']}\n"
+        f"Виконується: {stats['running']} / {stats['max_workers']}\n"
+    )
+    for lane, info in stats["lanes"].items():
+        response += (
+            f"\n<b>{lane}</b>: {info['queued']} задач від {info['users']} користувачів, "
+            f"очікування avg {info['wait_avg']:.1f}s, p95 {info['wait_p95']:.1f}s"
+        )
+
+    await update.message.reply_text(response, parse_mode=ParseMode.HTML)
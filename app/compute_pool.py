@@ -0,0 +1,96 @@
+import atexit, os, threading
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from multiprocessing import get_context, shared_memory
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from app.chart_data import BAR_COLUMNS, format_bars
+
+# Кількість процесів для етапу свічки → індикатори → текст; 0 — рахувати в поточному процесі
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "0"))
+# Менше задач дешевше порахувати на місці, ніж передавати в пул
+POOL_MIN_JOBS = 8
+# Скільки шматків задач припадає на один процес (для рівномірного навантаження)
+CHUNKS_PER_WORKER = 4
+
+_COLS = len(BAR_COLUMNS)
+_ITEM = np.dtype(np.float64).itemsize
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: fork процесу з потоками бота небезпечний
+            _pool = ProcessPoolExecutor(max_workers=COMPUTE_WORKERS, mp_context=get_context("spawn"))
+            logger.info(f"[compute] Запущено пул із {COMPUTE_WORKERS} процесів")
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def _format_chunk(shm_name: str, slices: List[Tuple[int, int]]) -> List[str]:
+    """Виконується у воркері: форматує свічки за (зміщення в рядках, кількість рядків)."""
+    # Воркери пулу спільно використовують resource_tracker батьківського процесу,
+    # тож блок видаляється лише батьком після збирання результатів
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        texts = []
+        for offset, rows in slices:
+            bars = np.ndarray((rows, _COLS), dtype=np.float64, buffer=shm.buf, offset=offset * _COLS * _ITEM)
+            texts.append(format_bars(bars))
+            del bars
+        return texts
+    finally:
+        shm.close()
+
+
+def build_sections(jobs: Dict[Hashable, np.ndarray]) -> Dict[Hashable, str]:
+    """
+    Рахує індикатори і текст промпту для кожного масиву свічок (n, 6).
+    Якщо пул увімкнено і задач достатньо, усі масиви пакуються в один блок
+    спільної пам'яті, а воркери отримують лише його ім'я та зміщення.
+    """
+    if COMPUTE_WORKERS <= 0 or len(jobs) < POOL_MIN_JOBS:
+        return {key: format_bars(bars) for key, bars in jobs.items()}
+
+    keys = list(jobs)
+    total = sum(len(jobs[key]) for key in keys)
+    shm = shared_memory.SharedMemory(create=True, size=max(total * _COLS * _ITEM, 1))
+    try:
+        packed = np.ndarray((total, _COLS), dtype=np.float64, buffer=shm.buf)
+        slices = []
+        offset = 0
+        for key in keys:
+            rows = len(jobs[key])
+            packed[offset:offset + rows] = jobs[key]
+            slices.append((offset, rows))
+            offset += rows
+        del packed
+
+        step = max(1, -(-len(slices) // (COMPUTE_WORKERS * CHUNKS_PER_WORKER)))
+        chunks = [slices[i:i + step] for i in range(0, len(slices), step)]
+        pool = _get_pool()
+        futures = [pool.submit(_format_chunk, shm.name, chunk) for chunk in chunks]
+
+        texts: List[str] = []
+        for fut in futures:
+            texts.extend(fut.result())
+        return dict(zip(keys, texts))
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,253 @@
+"""
+Експорт історії аналізів у колонкові набори даних (Parquet або Arrow IPC) для аналітики.
+
+Таблиці в EXPORT_DIR, розбиті на партиції month=YYYY-MM (за датою аналізу):
+  predictions/ — ticker, date, provider, model, prompt_hash, weights_hash, probability, confidence;
+  feedback/    — відгуки (success/failure) до аналізів, по одному рядку на кожне проставлення;
+  bars/        — денні свічки з локального сховища, які бачив аналіз (DAILY_LOOKBACK_SESSIONS
+                 сесій до дати аналізу), разом зі значеннями DI+, DI-, ADX на кожній свічці;
+  bars_5m/     — 5-хвилинні свічки, які бачив аналіз (INTRADAY_LOOKBACK_SESSIONS сесій до
+                 09:45 дати аналізу), зібрані з хвилинних через bar_cache.resample.
+
+Експорт інкрементальний: позначка _watermark.json зберігає останній вивантажений id
+аналізу, час останнього відгуку і пари (тикер, дата), свічки яких уже вивантажені,
+тож кожен запуск дописує лише нові файли — навіть якщо старі аналізи вже перенесені
+в архів. Позначка оновлюється після запису файлів; імена файлів залежать від позначки,
+тож повтор після збою перезаписує ті самі файли, а не дублює рядки.
+
+    python -m app.dataset_export
+    python -m app.dataset_export --format arrow --dir output/dataset
+    python -m app.dataset_export --no-intraday   # без запитів хвилинних свічок до Polygon
+
+Потребує pyarrow (імпортується лише тут).
+"""
+import argparse, json, os
+
+import numpy as np
+from datetime import date, datetime, timedelta
+from loguru import logger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.history_store import get_store
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "output/dataset"))
+WATERMARK_FILE = "_watermark.json"
+# Денне вікно, яке отримує модель при аналізі (commands_analysis.DAILY_SESSIONS)
+DAILY_LOOKBACK_SESSIONS = 21
+# 5-хвилинне вікно аналізу (commands_analysis.INTRADAY_SESSIONS)
+INTRADAY_LOOKBACK_SESSIONS = 3
+# Аналізів за один прохід експорту
+EXPORT_BATCH = 10_000
+
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+
+PREDICTION_FIELDS = ("id", "ticker", "date", "provider", "model", "prompt_hash", "weights_hash",
+                     "probability", "confidence", "created_at")
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("Для експорту потрібен pyarrow: pip install pyarrow") from e
+    return pa, ds
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    return {
+        "predictions": pa.schema([
+            ("id", pa.int64()), ("ticker", pa.string()), ("date", pa.string()),
+            ("provider", pa.string()), ("model", pa.string()),
+            ("prompt_hash", pa.string()), ("weights_hash", pa.string()),
+            ("probability", pa.int32()), ("confidence", pa.int32()),
+            ("created_at", pa.string()), ("month", pa.string()),
+        ]),
+        "feedback": pa.schema([
+            ("analysis_id", pa.int64()), ("ticker", pa.string()), ("date", pa.string()),
+            ("provider", pa.string()), ("feedback", pa.string()), ("feedback_at", pa.string()),
+            ("month", pa.string()),
+        ]),
+        "bars": pa.schema([
+            ("ticker", pa.string()), ("date", pa.string()), ("t", pa.int64()),
+            ("o", pa.float64()), ("h", pa.float64()), ("l", pa.float64()), ("c", pa.float64()),
+            ("v", pa.float64()), ("di_plus", pa.float64()), ("di_minus", pa.float64()),
+            ("adx", pa.float64()), ("month", pa.string()),
+        ]),
+        "bars_5m": pa.schema([
+            ("ticker", pa.string()), ("date", pa.string()), ("t", pa.int64()),
+            ("o", pa.float64()), ("h", pa.float64()), ("l", pa.float64()), ("c", pa.float64()),
+            ("v", pa.float64()), ("month", pa.string()),
+        ]),
+    }
+
+
+def load_watermark(export_dir: Path = EXPORT_DIR) -> Dict[str, Any]:
+    path = export_dir / WATERMARK_FILE
+    if path.exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"prediction_id": 0, "feedback_at": "", "exported": {}}
+
+
+def _save_watermark(export_dir: Path, watermark: Dict[str, Any]) -> None:
+    path = export_dir / WATERMARK_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(tmp, path)
+
+
+def bar_snapshot(ticker: str, day: str) -> List[Dict[str, Any]]:
+    """Завершені денні свічки перед датою аналізу з локального сховища (без запитів до API) та ADX."""
+    from app import market_calendar, warehouse
+    from app.indicator import adx_arrays
+
+    sessions = market_calendar.sessions_back(date.fromisoformat(day) - timedelta(days=1), DAILY_LOOKBACK_SESSIONS)
+    bars = warehouse.daily_bars(ticker, sessions[0], sessions[-1], ingest=False)
+    if not len(bars):
+        return []
+    di_plus, di_minus, adx = adx_arrays(bars[:, 2], bars[:, 3], bars[:, 4])
+    return [{
+        "ticker": ticker, "date": day, "t": int(row[0]),
+        "o": row[1], "h": row[2], "l": row[3], "c": row[4], "v": row[5],
+        "di_plus": None if np.isnan(di_plus[i]) else float(di_plus[i]),
+        "di_minus": None if np.isnan(di_minus[i]) else float(di_minus[i]),
+        "adx": None if np.isnan(adx[i]) else float(adx[i]),
+        "month": day[:7],
+    } for i, row in enumerate(bars.tolist())]
+
+
+def intraday_snapshot(ticker: str, day: str) -> List[Dict[str, Any]]:
+    """
+    5-хвилинні свічки вікна аналізу, зібрані з хвилинних. Хвилини, яких немає
+    в кеші, довантажуються з Polygon (кеш живе в пам'яті процесу).
+    """
+    from app import chart_data, market_calendar
+    from app.bar_cache import NY_TZ, minute_cache, resample
+
+    end_dt = market_calendar.last_session_end(
+        datetime.combine(date.fromisoformat(day), chart_data.DEFAULT_END_TIME, tzinfo=NY_TZ))
+    start_dt = market_calendar.window_start(end_dt, INTRADAY_LOOKBACK_SESSIONS)
+    chart_data.backfill_minutes(ticker, start_dt.date().isoformat(), end_dt.isoformat())
+    bars = resample(minute_cache.get(ticker, int(start_dt.timestamp() * 1000), int(end_dt.timestamp() * 1000)),
+                    5, "minute")
+    return [{
+        "ticker": ticker, "date": day, "t": int(row[0]),
+        "o": row[1], "h": row[2], "l": row[3], "c": row[4], "v": row[5],
+        "month": day[:7],
+    } for row in bars.tolist()]
+
+
+def _exported_pairs(ds, table_dir: Path, fmt: str) -> Set[Tuple[str, str]]:
+    """Пари (тикер, дата) з уже записаного набору — для позначок, створених до появи списку."""
+    if not table_dir.exists():
+        return set()
+    dataset = ds.dataset(table_dir, format=FORMATS[fmt], partitioning="hive")
+    table = dataset.to_table(columns=["ticker", "date"])
+    return set(zip(table.column("ticker").to_pylist(), table.column("date").to_pylist()))
+
+
+def _load_exported(ds, watermark: Dict[str, Any], export_dir: Path, fmt: str,
+                   tables: Tuple[str, ...]) -> Dict[str, Set[Tuple[str, str]]]:
+    exported = watermark.setdefault("exported", {})
+    pairs = {}
+    for table in tables:
+        if table in exported:
+            pairs[table] = {(ticker, day) for ticker, days in exported[table].items() for day in days}
+        else:
+            pairs[table] = _exported_pairs(ds, export_dir / table, fmt)
+    return pairs
+
+
+def _dump_exported(watermark: Dict[str, Any], pairs: Dict[str, Set[Tuple[str, str]]]) -> None:
+    for table, table_pairs in pairs.items():
+        by_ticker: Dict[str, List[str]] = {}
+        for ticker, day in sorted(table_pairs):
+            by_ticker.setdefault(ticker, []).append(day)
+        watermark["exported"][table] = by_ticker
+
+
+def _write(ds, pa, schema, rows: List[Dict[str, Any]], base_dir: Path, fmt: str, tag: str) -> None:
+    if not rows:
+        return
+    table = pa.Table.from_pylist(rows, schema=schema)
+    ds.write_dataset(
+        table, base_dir, format=FORMATS[fmt],
+        partitioning=ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive"),
+        basename_template=f"part-{tag}-{{i}}.{EXTENSIONS[fmt]}",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def export(export_dir: Path = EXPORT_DIR, fmt: str = "parquet", intraday: bool = True) -> Dict[str, int]:
+    """
+    Дописує в набори даних нові аналізи, відгуки й відповідні свічки; повертає кількість рядків.
+    intraday=False — без 5-хвилинних свічок (вони потребують запитів до Polygon).
+    """
+    pa, ds = _pyarrow()
+    schemas = _schemas(pa)
+    store = get_store()
+    export_dir.mkdir(parents=True, exist_ok=True)
+    watermark = load_watermark(export_dir)
+    snapshots = {"bars": bar_snapshot}
+    if intraday:
+        snapshots["bars_5m"] = intraday_snapshot
+    exported = _load_exported(ds, watermark, export_dir, fmt, tuple(snapshots))
+    counts = {"predictions": 0, "feedback": 0, **{table: 0 for table in snapshots}}
+
+    while True:
+        since = watermark["prediction_id"]
+        rows = store.rows_after(since, EXPORT_BATCH)
+        if not rows:
+            break
+        predictions = [{**{k: r[k] for k in PREDICTION_FIELDS}, "month": r["date"][:7]} for r in rows]
+        tag = f"{since + 1:012d}"
+        pairs = sorted({(r["ticker"], r["date"]) for r in rows})
+        for table, snapshot in snapshots.items():
+            # Свічки пари (тикер, дата) вивантажуються один раз, навіть якщо аналізів кілька;
+            # пара без свічок не позначається — наступний аналіз спробує знову
+            bars = []
+            for pair in pairs:
+                if pair in exported[table]:
+                    continue
+                snapshot_rows = snapshot(*pair)
+                if snapshot_rows:
+                    bars.extend(snapshot_rows)
+                    exported[table].add(pair)
+            _write(ds, pa, schemas[table], bars, export_dir / table, fmt, tag)
+            counts[table] += len(bars)
+        _write(ds, pa, schemas["predictions"], predictions, export_dir / "predictions", fmt, tag)
+        watermark["prediction_id"] = rows[-1]["id"]
+        _dump_exported(watermark, exported)
+        _save_watermark(export_dir, watermark)
+        counts["predictions"] += len(predictions)
+
+    feedback = [{
+        "analysis_id": r["id"], "ticker": r["ticker"], "date": r["date"], "provider": r["provider"],
+        "feedback": r["feedback"], "feedback_at": r["feedback_at"], "month": r["date"][:7],
+    } for r in store.feedback_after(watermark["feedback_at"])]
+    if feedback:
+        tag = "".join(ch for ch in watermark["feedback_at"] if ch.isdigit()) or "0"
+        _write(ds, pa, schemas["feedback"], feedback, export_dir / "feedback", fmt, tag)
+        watermark["feedback_at"] = feedback[-1]["feedback_at"]
+        _save_watermark(export_dir, watermark)
+        counts["feedback"] = len(feedback)
+
+    logger.info(f"[export] {export_dir}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Інкрементальний експорт історії аналізів у Parquet/Arrow")
+    parser.add_argument("--dir", default=str(EXPORT_DIR), help="каталог наборів даних")
+    parser.add_argument("--format", choices=tuple(FORMATS), default="parquet")
+    parser.add_argument("--no-intraday", action="store_true", help="не вивантажувати 5-хвилинні свічки")
+    args = parser.parse_args(argv)
+    export(Path(args.dir), args.format, intraday=not args.no_intraday)
+
+
+if __name__ == "__main__":
+    main()
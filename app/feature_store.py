@@ -0,0 +1,250 @@
+"""
+Сховище готових даних для промпту за (тикер, дата сесії, версія набору ознак):
+текст свічок з індикаторами, ознаки сесії та підсумок фундаментальних даних.
+
+Один і той самий тикер за ту саму дату аналізують різні користувачі (кожен зі своїм
+промптом) і обидва провайдери, тож ці частини рахуються один раз і далі
+беруться зі сховища. Два рівні:
+  пам'ять процесу — LRU з лімітом FEATURE_MEMORY_BYTES;
+  SQLite FEATURE_DB_PATH — спільний для процесів (воркерів webhook), LRU за часом
+  останнього використання з лімітом FEATURE_DISK_BYTES.
+
+Версія — хеш коду, що будує ознаки (індикатори, форматування свічок, ознаки сесії,
+фундаментальні дані) і самі свічки (ресемплінг хвилинних, сховище денних)
+разом із FEATURE_SET_VERSION: після зміни цього коду
+старі записи не читаються і видаляються при першому відкритті сховища.
+
+Зберігаються лише остаточні дані: вікно, що закінчується в майбутньому (або
+менше ніж MINUTE_COVERAGE_LAG тому), рахується щоразу заново. Виклик може
+додатково відхилити результат (get_or_compute(..., storable=...)) — так денні
+свічки з пропущеними сесіями не зберігаються. Від даних, а не коду, залежить і
+назва частини денних свічок: вона містить відбиток партицій сховища та спліттів
+тикера, тож переналивання дня чи новий спліт дають новий запис.
+"""
+import hashlib, inspect, json, os, sqlite3, threading, time
+
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from loguru import logger
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.singleflight import SingleFlight
+
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE_ENABLED", "1") == "1"
+FEATURE_DB_PATH = os.getenv("FEATURE_DB_PATH", "data/features.db")
+FEATURE_MEMORY_BYTES = int(os.getenv("FEATURE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+FEATURE_DISK_BYTES = int(os.getenv("FEATURE_DISK_BYTES", str(512 * 1024 * 1024)))
+# Збільшується вручну, коли змінюється зміст ознак без зміни коду (наприклад, формат даних API)
+FEATURE_SET_VERSION = 1
+SQLITE_BUSY_TIMEOUT = 30
+# Перевіряти розмір на диску раз на стільки записів
+EVICT_CHECK_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    version TEXT NOT NULL,
+    part TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (ticker, date, version, part)
+);
+CREATE INDEX IF NOT EXISTS features_used_at ON features (used_at);
+"""
+
+Key = Tuple[str, str, str]
+
+
+@lru_cache(maxsize=None)
+def feature_version() -> str:
+    """Хеш коду, від якого залежать ознаки; рахується один раз на процес."""
+    from app import bar_cache, chart_data, financial_data, indicator, market_calendar, session_features, warehouse
+
+    sources = [
+        str(FEATURE_SET_VERSION),
+        inspect.getsource(indicator),
+        inspect.getsource(session_features),
+        inspect.getsource(market_calendar),
+        inspect.getsource(bar_cache),
+        inspect.getsource(warehouse),
+        inspect.getsource(chart_data._bars_from_minutes),
+        inspect.getsource(chart_data._daily_from_warehouse),
+        inspect.getsource(chart_data.format_bars),
+        inspect.getsource(financial_data._prior_quarter),
+        inspect.getsource(financial_data.extract_fundamentals),
+        inspect.getsource(financial_data.format_fundamentals),
+        repr(financial_data.CURATED_METRICS),
+    ]
+    return hashlib.sha256("\n".join(sources).encode("utf-8")).hexdigest()[:12]
+
+
+def is_final(date_str: str) -> bool:
+    """Чи не зміняться вже дані вікна, що закінчується датою аналізу (з урахуванням затримки Polygon)."""
+    from app.chart_data import MINUTE_COVERAGE_LAG, NY_TZ, _parse_date
+
+    return _parse_date(date_str) + MINUTE_COVERAGE_LAG <= datetime.now(NY_TZ)
+
+
+def _worth_storing(value: Any) -> bool:
+    if isinstance(value, dict):
+        return any(value.values())
+    return bool(value)
+
+
+class FeatureStore:
+    def __init__(self, path: str = FEATURE_DB_PATH, memory_bytes: int = FEATURE_MEMORY_BYTES,
+                 disk_bytes: int = FEATURE_DISK_BYTES):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._memory: "OrderedDict[Tuple[Key, str], Tuple[Any, int]]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._writes = 0
+        self._flight = SingleFlight("feature-store")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        conn.executescript(SCHEMA)
+                        removed = conn.execute("DELETE FROM features WHERE version != ?",
+                                               (feature_version(),)).rowcount
+                        if removed:
+                            logger.info(f"[features] Видалено {removed} записів попередніх версій ознак")
+                        self._initialized = True
+        return conn
+
+    # --- пам'ять ---
+
+    def _remember(self, key: Key, part: str, value: Any, size: int) -> None:
+        with self._lock:
+            previous = self._memory.pop((key, part), None)
+            if previous is not None:
+                self._memory_size -= previous[1]
+            self._memory[(key, part)] = (value, size)
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes and self._memory:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_size -= evicted
+
+    # --- диск ---
+
+    def _evict_disk(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM features").fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        # Найдавніше використані записи, доки розмір не стане меншим за 90% ліміту
+        excess = total - int(self.disk_bytes * 0.9)
+        rows = conn.execute("SELECT rowid, size FROM features ORDER BY used_at").fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            doomed.append((rowid,))
+            excess -= size
+        conn.executemany("DELETE FROM features WHERE rowid = ?", doomed)
+        logger.info(f"[features] Витіснено {len(doomed)} записів (ліміт {self.disk_bytes} байт)")
+
+    def get(self, ticker: str, date_str: str, part: str) -> Optional[Any]:
+        if not FEATURE_STORE_ENABLED:
+            return None
+        key = (ticker, date_str, feature_version())
+        with self._lock:
+            cached = self._memory.get((key, part))
+            if cached is not None:
+                self._memory.move_to_end((key, part))
+                self.hits["memory"] += 1
+                return cached[0]
+
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, size FROM features WHERE ticker = ? AND date = ? AND version = ? AND part = ?",
+            (*key, part),
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute("UPDATE features SET used_at = ? WHERE ticker = ? AND date = ? AND version = ? AND part = ?",
+                     (time.time(), *key, part))
+        value = json.loads(row[0])
+        self._remember(key, part, value, row[1])
+        with self._lock:
+            self.hits["disk"] += 1
+        return value
+
+    def put(self, ticker: str, date_str: str, part: str, value: Any) -> None:
+        """Зберігає частину, якщо дані за дату вже остаточні; порожні результати (збій API) не зберігаються."""
+        if not FEATURE_STORE_ENABLED or not _worth_storing(value) or not is_final(date_str):
+            return
+        key = (ticker, date_str, feature_version())
+        body = json.dumps(value, ensure_ascii=False)
+        size = len(body.encode("utf-8"))
+        self._remember(key, part, value, size)
+
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO features (ticker, date, version, part, value, size, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (ticker, date, version, part) DO UPDATE SET value = excluded.value,"
+            " size = excluded.size, used_at = excluded.used_at",
+            (*key, part, body, size, time.time()),
+        )
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICT_CHECK_EVERY == 0
+        if check:
+            self._evict_disk(conn)
+
+    def get_or_compute(self, ticker: str, date_str: str, part: str, compute: Callable[[], Any],
+                       storable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Частина зі сховища; якщо її немає — compute() один раз для всіх одночасних викликів.
+        Результат зберігається, лише якщо storable(value) (і за умовами put).
+        """
+        value = self.get(ticker, date_str, part)
+        if value is not None:
+            return value
+
+        def build():
+            value = compute()
+            if storable(value):
+                self.put(ticker, date_str, part, value)
+            return value
+
+        return self._flight.do((ticker, date_str, part), build)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"memory_hits": self.hits["memory"], "disk_hits": self.hits["disk"], "misses": self.misses,
+                    "memory_entries": len(self._memory), "memory_bytes": self._memory_size}
+
+
+_store: Optional[FeatureStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> FeatureStore:
+    """Сховище відкривається при першому зверненні."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeatureStore()
+    return _store
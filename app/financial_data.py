@@ -1,22 +1,178 @@
-import requests, time
-
-from datetime import datetime, timedelta, timezone
-from typing import Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
 from loguru import logger
 
 from config import POLYGON_API_KEY
+from app import transport
+from app.singleflight import SingleFlight
 
 MAX_RETRIES = 3
 INITIAL_BACKOFF = 1
+FINANCIALS_URL = 'https://api.polygon.io/vX/reference/financials'
+# Куратований набір метрик: (розділ звіту, ключ Polygon); у промпті — "префікс.ключ"
+SECTION_PREFIXES = {
+    'income_statement': 'is',
+    'balance_sheet': 'bs',
+    'cash_flow_statement': 'cf',
+}
+CURATED_METRICS = (
+    ('income_statement', 'revenues'),
+    ('income_statement', 'gross_profit'),
+    ('income_statement', 'operating_income_loss'),
+    ('income_statement', 'net_income_loss'),
+    ('income_statement', 'diluted_earnings_per_share'),
+    ('balance_sheet', 'assets'),
+    ('balance_sheet', 'current_assets'),
+    ('balance_sheet', 'liabilities'),
+    ('balance_sheet', 'current_liabilities'),
+    ('balance_sheet', 'equity'),
+    ('balance_sheet', 'long_term_debt'),
+    ('cash_flow_statement', 'net_cash_flow_from_operating_activities'),
+)
+# Вікно пошуку звітів: два останні квартальні звіти з урахуванням затримки подання
+FINANCIALS_LOOKBACK_DAYS = 200
+# Скільки звітів запитувати: поточний, попередній квартал і запас на виправлені звіти
+FINANCIALS_LIMIT = 5
+# Кінець попереднього кварталу — за стільки днів до кінця поточного (52/53-тижневі роки зсувають межі)
+PRIOR_QUARTER_DAYS = (75, 105)
+
+_financials_flight = SingleFlight("polygon-financials")
+
+def _request_financials(params: dict) -> Optional[list]:
+    """Запит з retry; повертає results або None при помилці."""
+    backoff = INITIAL_BACKOFF
+    for attempt in range(1, MAX_RETRIES + 1):
+        resp = transport.http_get(FINANCIALS_URL, params={**params, 'apiKey': POLYGON_API_KEY})
+        if resp.status_code == 200:
+            break
+        if resp.status_code == 429:
+            transport.sleep(backoff)
+            backoff *= 2
+        else:
+            logger.error(f'HTTP {resp.status_code} при запиті: {resp.text}')
+            return None
+    else:
+        logger.error('Не вдалося отримати дані після повторних спроб')
+        return None
+
+    try:
+        return resp.json().get('results', [])
+    except Exception:
+        return None
+
+def _metric(item: Optional[dict], section: str, key: str) -> Optional[float]:
+    if not item:
+        return None
+    value = ((item.get('financials') or {}).get(section) or {}).get(key, {}).get('value')
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float], scale: float = 100) -> Optional[float]:
+    if numerator is None or not denominator:
+        return None
+    return round(numerator / denominator * scale, 2)
+
+
+def _change(current: Optional[float], prior: Optional[float]) -> Optional[float]:
+    if current is None or not prior:
+        return None
+    return round((current - prior) / abs(prior) * 100, 2)
+
+
+def _fiscal_quarter(item: dict) -> Optional[tuple]:
+    """(fiscal_year, номер кварталу) звіту або None, якщо період не квартальний чи невідомий."""
+    period = str(item.get('fiscal_period') or '')
+    try:
+        year = int(item.get('fiscal_year'))
+    except (TypeError, ValueError):
+        return None
+    if period not in ('Q1', 'Q2', 'Q3', 'Q4'):
+        return None
+    return year, int(period[1])
+
+
+def _end_date(item: dict) -> Optional[date]:
+    try:
+        return date.fromisoformat(item.get('end_date') or '')
+    except ValueError:
+        return None
+
+
+def _prior_quarter(current: dict, candidates: List[dict]) -> Optional[dict]:
+    """
+    Звіт за квартал перед current: за fiscal_year/fiscal_period, а якщо їх немає —
+    за end_date приблизно на квартал раніше. None, якщо такого звіту серед candidates немає.
+    """
+    quarter = _fiscal_quarter(current)
+    if quarter is not None:
+        year, number = quarter
+        expected = (year - 1, 4) if number == 1 else (year, number - 1)
+        for item in candidates:
+            if _fiscal_quarter(item) == expected:
+                return item
+
+    current_end = _end_date(current)
+    if current_end is None:
+        return None
+    low, high = PRIOR_QUARTER_DAYS
+    for item in candidates:
+        end = _end_date(item)
+        if end is not None and low <= (current_end - end).days <= high:
+            return item
+    return None
+
+
+def extract_fundamentals(current: dict, prior: Optional[dict] = None) -> Dict[str, Optional[float]]:
+    """
+    Куратовані метрики поточного кварталу з унікальними ключами ("is.revenues", "bs.assets", ...)
+    і показники, пораховані локально з поточного та попереднього кварталу.
+    """
+    summary: Dict[str, Optional[float]] = {
+        f"{SECTION_PREFIXES[section]}.{key}": _metric(current, section, key) for section, key in CURATED_METRICS
+    }
+    revenue = summary['is.revenues']
+    net_income = summary['is.net_income_loss']
+    summary.update({
+        'revenue_qoq': _change(revenue, _metric(prior, 'income_statement', 'revenues')),
+        'net_income_qoq': _change(net_income, _metric(prior, 'income_statement', 'net_income_loss')),
+        'eps_qoq': _change(summary['is.diluted_earnings_per_share'],
+                           _metric(prior, 'income_statement', 'diluted_earnings_per_share')),
+        'gross_margin': _ratio(summary['is.gross_profit'], revenue),
+        'operating_margin': _ratio(summary['is.operating_income_loss'], revenue),
+        'net_margin': _ratio(net_income, revenue),
+        'ocf_margin': _ratio(summary['cf.net_cash_flow_from_operating_activities'], revenue),
+        'current_ratio': _ratio(summary['bs.current_assets'], summary['bs.current_liabilities'], scale=1),
+        'debt_to_equity': _ratio(summary['bs.liabilities'], summary['bs.equity'], scale=1),
+    })
+    return summary
+
+
+def _fmt_value(value: Optional[float]) -> str:
+    """Скорочений запис: 12.3B, 450.1M, 7.5K; відсутнє значення — na."""
+    if value is None:
+        return 'na'
+    for limit, suffix in ((1e12, 'T'), (1e9, 'B'), (1e6, 'M'), (1e3, 'K')):
+        if abs(value) >= limit:
+            return f"{value / limit:.1f}{suffix}"
+    return f"{value:g}"
+
+
+def format_fundamentals(ticker: str, item: dict, summary: Dict[str, Optional[float]]) -> str:
+    """Рядок фіксованої схеми: "ticker|end_date|period|is.revenues:..|...|revenue_qoq:..|..."."""
+    period = f"{item.get('fiscal_period', '')} {item.get('fiscal_year', '')}".strip()
+    parts = [ticker, item.get('end_date', ''), period]
+    parts += [f"{key}:{_fmt_value(value)}" for key, value in summary.items()]
+    return '|'.join(parts)
+
 
 def fetch_financial_prompt(
     ticker: str,
-    days: int = 30,
+    days: int = FINANCIALS_LOOKBACK_DAYS,
     filing_date_to: Optional[str] = None
 ) -> str:
     """
-    Повертає компактний рядок для ШІ з усіма метриками останнього квартального звіту:
-    "ticker|end_date|metric1:value|metric2:value|..."
+    Повертає компактний рядок фіксованої схеми для ШІ: куратовані метрики останнього
+    квартального звіту та показники відносно попереднього кварталу (див. format_fundamentals).
     """
     # Обчислення діапазону дат
     try:
@@ -29,48 +185,23 @@ def fetch_financial_prompt(
     params = {
         'ticker': ticker,
         'timeframe': 'quarterly',
-        'limit': 1,
-        'apiKey': POLYGON_API_KEY,
+        # поточний і попередній квартал — для зміни QoQ
+        'limit': FINANCIALS_LIMIT,
         'sort': 'filing_date',
         'order': 'desc',
         'filing_date.gte': start_dt.date().isoformat(),
         'filing_date.lte': end_dt.date().isoformat(),
     }
-    # Запит з retry
-    backoff = INITIAL_BACKOFF
-    for attempt in range(1, MAX_RETRIES + 1):
-        resp = requests.get('https://api.polygon.io/vX/reference/financials', params=params)
-        if resp.status_code == 200:
-            break
-        if resp.status_code == 429:
-            time.sleep(backoff)
-            backoff *= 2
-        else:
-            logger.error(f'HTTP {resp.status_code} при запиті: {resp.text}')
-            return ''
-    else:
-        logger.error('Не вдалося отримати дані після повторних спроб')
-        return ''
+    # Одночасні запити з однаковими параметрами виконуються один раз
+    flight_key = FINANCIALS_URL + '?' + '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+    results = _financials_flight.do(flight_key, lambda: _request_financials(params))
 
     # Парсинг
     try:
-        item = resp.json().get('results', [])[0]
-    except Exception:
+        item = results[0]
+    except (IndexError, TypeError):
         return ''
+    # Наступний за датою подання звіт не обов'язково попередній квартал (виправлення, пропуски)
+    prior = _prior_quarter(item, results[1:])
 
-    end_date = item.get('end_date', '')
-    financials = item.get('financials', {})
-
-    # Збір всіх метрик
-    metrics = []
-    for section, fields in financials.items():
-        for key, info in fields.items():
-            val = info.get('value')
-            if val is not None:
-                # скорочення ключа до останньої частини
-                short = key.split('_')[-1]
-                metrics.append(f"{short}:{val}")
-
-    # Форматування
-    parts = [ticker, end_date] + metrics
-    return '|'.join(parts)
\ No newline at end of file
+    return format_fundamentals(ticker, item, extract_fundamentals(item, prior))
@@ -0,0 +1,193 @@
+"""
+Ротація історії аналізів: у таблиці analyses лишаються аналізи, записані за останні
+HISTORY_RETENTION_DAYS днів (за created_at, а не за датою, на яку робився прогноз),
+старіші переносяться в стиснуті місячні архіви output/archive/history-YYYY-MM.jsonl.gz
+за місяцем дати прогнозу (один JSON-рядок на аналіз).
+
+Архіви лише доповнюються: кожен перенос дописує новий gzip-член у кінець файлу,
+тож уже записані дані не переписуються. В архів потрапляє полегшений результат —
+без довгих текстів (recommendation, помилки), які не потрібні для бектестів.
+
+Запуск (наприклад, щоночі з cron):
+    python -m app.history_archive archive --days 180
+    python -m app.history_archive compact --archive
+"""
+import argparse, gzip, json, os
+
+from datetime import date, datetime, time, timedelta
+from loguru import logger
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.history_store import COLUMNS, get_store
+
+ARCHIVE_DIR = Path(os.getenv("HISTORY_ARCHIVE_DIR", "output/archive"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
+
+# Поля результату, що зберігаються в архіві (решта — довгі тексти й службові дані)
+ARCHIVE_RESULT_KEYS = ("ticker", "probability_value", "confidence", "justification", "fundamental_impact", "extra")
+# Максимальна довжина текстового поля результату в архіві
+SLIM_TEXT_LIMIT = 280
+
+
+def shard_path(month: str) -> Path:
+    return ARCHIVE_DIR / f"history-{month}.jsonl.gz"
+
+
+def slim_result(result: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Результат для архіву: лише поля схеми аналізу, тексти обрізані до SLIM_TEXT_LIMIT."""
+    if result is None:
+        return None
+    try:
+        data = json.loads(result)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    slim = {}
+    for key in ARCHIVE_RESULT_KEYS:
+        value = data.get(key)
+        if isinstance(value, str) and len(value) > SLIM_TEXT_LIMIT:
+            value = value[:SLIM_TEXT_LIMIT - 1] + "…"
+        if value is not None:
+            slim[key] = value
+    return slim
+
+
+def _archive_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    record = {key: row[key] for key in COLUMNS if key != "result"}
+    record["result"] = slim_result(row["result"])
+    return record
+
+
+def _append_shard(month: str, records: List[Dict[str, Any]]) -> None:
+    path = shard_path(month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    # Режим "ab" додає новий gzip-член; gzip.open читає файл як один потік
+    with open(path, "ab") as f:
+        f.write(gzip.compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive(retention_days: int = HISTORY_RETENTION_DAYS, today: Optional[date] = None) -> int:
+    """
+    Переносить аналізи, записані раніше ніж retention_days днів тому, в місячні архіви;
+    повертає кількість рядків. Відгук, поставлений пізніше, не продовжує життя рядка.
+
+    Видалення з таблиці виконується в тій самій транзакції після запису архівів:
+    збій посередині залишає рядок і в таблиці, і в архіві, а не губить його
+    (повтори відсіює read_archive за id).
+    """
+    # created_at — локальний ISO-час запису (старі імпортовані рядки мають дату прогнозу о 00:00)
+    cutoff = datetime.combine((today or date.today()) - timedelta(days=retention_days), time()).isoformat()
+    store = get_store()
+    with store.transaction() as conn:
+        rows = [dict(r) for r in conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM analyses WHERE created_at < ? ORDER BY date, id", (cutoff,)
+        ).fetchall()]
+        months: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            months.setdefault(row["date"][:7], []).append(_archive_record(row))
+        for month, records in months.items():
+            _append_shard(month, records)
+        conn.executemany("DELETE FROM analyses WHERE id = ?", [(row["id"],) for row in rows])
+    if rows:
+        logger.info(f"[history] В архів перенесено {len(rows)} записів до {cutoff} ({len(months)} міс.)")
+    return len(rows)
+
+
+def _months(date_from: Optional[str], date_to: Optional[str]) -> List[str]:
+    shards = sorted(p.name[len("history-"):-len(".jsonl.gz")] for p in ARCHIVE_DIR.glob("history-*.jsonl.gz"))
+    return [m for m in shards if (not date_from or m >= date_from[:7]) and (not date_to or m <= date_to[:7])]
+
+
+def _read_shard(month: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(shard_path(month), "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_archive(ticker: Optional[str] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, provider: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Архівні аналізи в хронологічному порядку (для бектестів); читаються лише потрібні місяці."""
+    for month in _months(date_from, date_to):
+        seen = set()
+        records = []
+        for record in _read_shard(month):
+            if record["id"] in seen:
+                continue
+            seen.add(record["id"])
+            if ticker and record["ticker"] != ticker:
+                continue
+            if provider and record["provider"] != provider:
+                continue
+            if (date_from and record["date"] < date_from) or (date_to and record["date"] > date_to):
+                continue
+            records.append(record)
+        records.sort(key=lambda r: (r["date"], r["id"]))
+        yield from records
+
+
+def _duplicate_key(record: Dict[str, Any]):
+    return record["ticker"], record["date"], record["provider"]
+
+
+def compact_archive(month: str) -> int:
+    """
+    Переписує архів місяця одним gzip-членом без повторних аналізів; повертає кількість видалених.
+    Файл замінюється атомарно через тимчасовий, тож читачі бачать або старий, або новий архів.
+    """
+    shard = sorted(_read_shard(month), key=lambda r: r["id"])
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for record in shard:
+        previous = latest.get(_duplicate_key(record))
+        if previous is not None and record["feedback"] is None:
+            record["feedback"], record["feedback_at"] = previous["feedback"], previous.get("feedback_at")
+        latest[_duplicate_key(record)] = record
+
+    records = sorted(latest.values(), key=lambda r: (r["date"], r["id"]))
+    path = shard_path(month)
+    tmp = path.with_suffix(".tmp")
+    payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(gzip.compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(shard) - len(records)
+
+
+def compact(include_archive: bool = False) -> int:
+    """Прибирає повторні аналізи одного тикера за дату (і провайдера); повертає кількість видалених."""
+    store = get_store()
+    removed = store.compact()
+    if include_archive:
+        # Під блокуванням запису, щоб archive() не дописав у файл, який зараз переписується
+        with store.transaction():
+            for month in _months(None, None):
+                removed += compact_archive(month)
+    logger.info(f"[history] Стиснення: видалено {removed} повторних аналізів")
+    return removed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ротація та стиснення історії аналізів")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive_parser = commands.add_parser("archive", help="перенести старі аналізи в місячні архіви")
+    archive_parser.add_argument("--days", type=int, default=HISTORY_RETENTION_DAYS,
+                                help="скільки останніх днів лишити в основному сховищі")
+    compact_parser = commands.add_parser("compact", help="прибрати повторні аналізи тикера за дату")
+    compact_parser.add_argument("--archive", action="store_true", help="також переписати місячні архіви")
+    args = parser.parse_args(argv)
+
+    if args.command == "archive":
+        archive(args.days)
+    else:
+        compact(args.archive)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Історія аналізів у таблиці SQLite з індексами під запити /history.
+
+Кожен аналіз — окремий рядок (повторний аналіз того ж тикера й дати теж
+зберігається), відгук ставиться на останній аналіз тикера за дату.
+Вибірки посторінкові за ключем (date, id): наступна сторінка — це
+умова WHERE по індексу, а не OFFSET, тож час запиту не росте з історією.
+
+Стара історія (документ "history" сховища стану або output/history.json)
+переноситься в таблицю один раз при першому відкритті.
+"""
+import json, os, sqlite3, threading
+
+from contextlib import contextmanager
+from datetime import datetime
+from loguru import logger
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.state_backend import STATE_DB_PATH
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", STATE_DB_PATH)
+LEGACY_HISTORY_PATH = "output/history.json"
+SQLITE_BUSY_TIMEOUT = 30
+
+PAGE_SIZE = 20
+AGGREGATE_LIMIT = 10
+FEEDBACK_SUCCESS = "success"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    provider TEXT,
+    model TEXT,
+    prompt_hash TEXT,
+    weights_hash TEXT,
+    probability INTEGER,
+    confidence INTEGER,
+    feedback TEXT,
+    feedback_at TEXT,
+    result TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_ticker_date ON analyses (ticker, date, id);
+CREATE INDEX IF NOT EXISTS analyses_date ON analyses (date, id);
+CREATE INDEX IF NOT EXISTS analyses_provider_date ON analyses (provider, date, id);
+CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created_at);
+CREATE TABLE IF NOT EXISTS history_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+COLUMNS = ("id", "ticker", "date", "provider", "model", "prompt_hash", "weights_hash",
+           "probability", "confidence", "feedback", "feedback_at", "result", "created_at")
+
+
+def probability_of(result: Optional[Dict]) -> Optional[int]:
+    """probability_value з результату; старі записи мають вкладений формат."""
+    if not isinstance(result, dict):
+        return None
+    value = result.get("probability_value",
+                       (result.get("intraday_trend_movement_probability") or {}).get("probability_value"))
+    try:
+        return int(str(value).rstrip("%")) if value is not None else None
+    except ValueError:
+        return None
+
+
+def encode_cursor(row: Dict) -> str:
+    return f"{row['date']}/{row['id']}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    if not cursor:
+        return None
+    date, _, row_id = cursor.partition("/")
+    return date, int(row_id)
+
+
+class HistoryStore:
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._initialized:
+                with self._init_lock:
+                    if not self._initialized:
+                        conn.executescript(SCHEMA)
+                        self._migrate(conn)
+                        self._import_legacy(conn)
+                        self._initialized = True
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(analyses)")}
+        if "feedback_at" not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN feedback_at TEXT")
+
+    def _import_legacy(self, conn: sqlite3.Connection) -> None:
+        from app.state_backend import Document
+
+        imported = "SELECT 1 FROM history_meta WHERE key = 'legacy_imported'"
+        if conn.execute(imported).fetchone():
+            return
+        # Документ читається до BEGIN IMMEDIATE: сховище стану може бути тим самим файлом SQLite
+        legacy = Document("history", default=dict, legacy_path=LEGACY_HISTORY_PATH).read()
+        with self.transaction(conn):
+            if conn.execute(imported).fetchone():
+                return
+            rows = []
+            for ticker, dates in legacy.items():
+                for date, entry in dates.items():
+                    result = entry.get("result")
+                    if result is None and "feedback" not in entry:
+                        continue
+                    provider, _, model = (entry.get("provider") or "").partition(":")
+                    rows.append((
+                        ticker, date, provider or None, model or None, None, None,
+                        probability_of(result), (result or {}).get("confidence"), entry.get("feedback"),
+                        f"{date}T00:00:00" if entry.get("feedback") else None,
+                        json.dumps(result, ensure_ascii=False) if result is not None else None,
+                        f"{date}T00:00:00",
+                    ))
+            rows.sort(key=lambda r: (r[1], r[0]))
+            conn.executemany(
+                "INSERT INTO analyses (ticker, date, provider, model, prompt_hash, weights_hash, probability,"
+                " confidence, feedback, feedback_at, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.execute("INSERT INTO history_meta (key, value) VALUES ('legacy_imported', ?)",
+                         (datetime.now().isoformat(),))
+        if rows:
+            logger.info(f"[history] Перенесено {len(rows)} записів зі старої історії")
+
+    @contextmanager
+    def transaction(self, conn: Optional[sqlite3.Connection] = None) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT: інші процеси не пишуть у таблицю до кінця блоку."""
+        conn = conn or self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- запис ---
+
+    def record(self, ticker: str, date: str, result: Dict, provider: Optional[str] = None,
+               model: Optional[str] = None, prompt_hash: Optional[str] = None,
+               weights_hash: Optional[str] = None) -> int:
+        cur = self._conn().execute(
+            "INSERT INTO analyses (ticker, date, provider, model, prompt_hash, weights_hash, probability,"
+            " confidence, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (ticker, date, provider, model, prompt_hash, weights_hash, probability_of(result),
+             result.get("confidence"), json.dumps(result, ensure_ascii=False), datetime.now().isoformat()),
+        )
+        return cur.lastrowid
+
+    def set_feedback(self, ticker: str, date: str, feedback: str) -> bool:
+        """Відгук до останнього аналізу тикера за дату; False, якщо аналізу немає."""
+        cur = self._conn().execute(
+            "UPDATE analyses SET feedback = ?, feedback_at = ? WHERE id = "
+            "(SELECT id FROM analyses WHERE ticker = ? AND date = ? ORDER BY id DESC LIMIT 1)",
+            (feedback, datetime.now().isoformat(), ticker, date),
+        )
+        return cur.rowcount > 0
+
+    def exists(self, ticker: str, date: str) -> bool:
+        return self._conn().execute(
+            "SELECT 1 FROM analyses WHERE ticker = ? AND date = ? LIMIT 1", (ticker, date)
+        ).fetchone() is not None
+
+    def compact(self) -> int:
+        """
+        Лишає один аналіз на (тикер, дата, провайдер) — останній; відгук зі старішого
+        рядка переноситься, якщо в останнього його немає. Повертає кількість видалених.
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE analyses SET (feedback, feedback_at) = (SELECT prev.feedback, prev.feedback_at"
+                " FROM analyses AS prev WHERE prev.ticker = analyses.ticker AND prev.date = analyses.date"
+                " AND prev.provider IS analyses.provider AND prev.feedback IS NOT NULL"
+                " ORDER BY prev.id DESC LIMIT 1)"
+                " WHERE feedback IS NULL AND id IN"
+                " (SELECT MAX(id) FROM analyses GROUP BY ticker, date, provider HAVING COUNT(*) > 1)"
+            )
+            cur = conn.execute(
+                "DELETE FROM analyses WHERE id NOT IN (SELECT MAX(id) FROM analyses GROUP BY ticker, date, provider)"
+            )
+            return cur.rowcount
+
+    # --- читання ---
+
+    @staticmethod
+    def _filters(ticker: Optional[str], date_from: Optional[str], date_to: Optional[str],
+                 provider: Optional[str]) -> Tuple[List[str], List[Any]]:
+        where, params = [], []
+        if ticker:
+            where.append("ticker = ?")
+            params.append(ticker)
+        if date_from:
+            where.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("date <= ?")
+            params.append(date_to)
+        if provider:
+            where.append("provider = ?")
+            params.append(provider)
+        return where, params
+
+    def query(self, ticker: Optional[str] = None, date_from: Optional[str] = None,
+              date_to: Optional[str] = None, provider: Optional[str] = None,
+              cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+        """Сторінка аналізів, новіші першими; повертає (рядки, курсор наступної сторінки або None)."""
+        where, params = self._filters(ticker, date_from, date_to, provider)
+        after = decode_cursor(cursor)
+        if after is not None:
+            where.append("(date < ? OR (date = ? AND id < ?))")
+            params.extend((after[0], after[0], after[1]))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM analyses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date DESC, id DESC LIMIT ?"
+        rows = [dict(r) for r in self._conn().execute(sql, params + [limit + 1]).fetchall()]
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def rows_after(self, last_id: int, limit: int = 10_000) -> List[Dict]:
+        """Аналізи з id > last_id у порядку додавання (інкрементальний експорт)."""
+        rows = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM analyses WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def feedback_after(self, since: str) -> List[Dict]:
+        """Відгуки, поставлені пізніше за since (ISO-час), у порядку часу."""
+        rows = self._conn().execute(
+            "SELECT id, ticker, date, provider, feedback, feedback_at FROM analyses"
+            " WHERE feedback_at > ? ORDER BY feedback_at, id", (since,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def aggregates(self, ticker: Optional[str] = None, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None, provider: Optional[str] = None,
+                   limit: int = AGGREGATE_LIMIT) -> List[Dict]:
+        """Для кожного тикера: кількість аналізів, середня ймовірність, частка успішних відгуків."""
+        where, params = self._filters(ticker, date_from, date_to, provider)
+        sql = (
+            "SELECT ticker, COUNT(*) AS count, AVG(probability) AS mean_probability,"
+            " COUNT(feedback) AS feedback, SUM(feedback = ?) AS hits FROM analyses"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY ticker ORDER BY count DESC, ticker LIMIT ?"
+        rows = self._conn().execute(sql, [FEEDBACK_SUCCESS] + params + [limit]).fetchall()
+        return [{
+            "ticker": r["ticker"],
+            "count": r["count"],
+            "mean_probability": r["mean_probability"],
+            "feedback": r["feedback"],
+            "hit_rate": (r["hits"] or 0) / r["feedback"] if r["feedback"] else None,
+        } for r in rows]
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    """Сховище відкривається при першому зверненні."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
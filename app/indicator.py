@@ -1,7 +1,12 @@
-import pandas as pd
+import math
 import numpy as np
 
-def add_adx(df: pd.DataFrame, window: int = 14) -> pd.DataFrame:
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+def add_adx(df: "pd.DataFrame", window: int = 14) -> "pd.DataFrame":
     """
     Додає в DataFrame стовпці:
       - DI+   (Positive Directional Indicator)
@@ -20,6 +25,8 @@ def add_adx(df: pd.DataFrame, window: int = 14) -> pd.DataFrame:
     result : pd.DataFrame
         Копія вхідного df з доданими стовпцями ['DI+', 'DI-', 'ADX'].
     """
+    import pandas as pd
+
     data = df.copy()
 
     # Крок 1: Directional Moves
@@ -47,4 +54,58 @@ def add_adx(df: pd.DataFrame, window: int = 14) -> pd.DataFrame:
     dx  = (data['DI+'] - data['DI-']).abs() / (data['DI+'] + data['DI-']) * 100
     data['ADX'] = dx.ewm(alpha=1/window, adjust=False).mean()
 
-    return data
\ No newline at end of file
+    return data
+
+def _wilder_ewm(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Рекурсивне згладжування Вайлдера (еквівалент ewm(alpha=1/window, adjust=False)).
+    NaN пропускаються: результат зберігає попереднє значення.
+    """
+    alpha = 1.0 / window
+    out = []
+    prev = math.nan
+    for x in np.asarray(values, dtype=np.float64).tolist():
+        if not math.isnan(x):
+            prev = x if math.isnan(prev) else prev + alpha * (x - prev)
+        out.append(prev)
+    return np.array(out, dtype=np.float64)
+
+
+def adx_arrays(h: np.ndarray, l: np.ndarray, c: np.ndarray, window: int = 14):
+    """
+    Ті самі DI+, DI-, ADX, що й add_adx, але на масивах NumPy без pandas —
+    для обчислень у робочих процесах над спільною пам'яттю.
+
+    Повертає:
+    ---------
+    (di_plus, di_minus, adx) : кортеж np.ndarray тієї ж довжини, що й вхідні масиви.
+    """
+    n = len(c)
+    if n == 0:
+        empty = np.empty(0)
+        return empty, empty, empty
+
+    # Крок 1: Directional Moves
+    up_move = np.concatenate(([np.nan], np.diff(h)))
+    down_move = -np.concatenate(([np.nan], np.diff(l)))
+    with np.errstate(invalid='ignore'):
+        plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+        minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+    # Крок 2: True Range
+    prev_c = np.concatenate(([np.nan], c[:-1]))
+    true_range = np.fmax(h - l, np.fmax(np.abs(h - prev_c), np.abs(l - prev_c)))
+
+    # Крок 3: Wilder’s smoothing
+    atr = _wilder_ewm(true_range, window)
+    plus_dm_smooth = _wilder_ewm(plus_dm, window)
+    minus_dm_smooth = _wilder_ewm(minus_dm, window)
+
+    # Крок 4-5: DI+, DI-, DX і ADX
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_plus = 100 * plus_dm_smooth / atr
+        di_minus = 100 * minus_dm_smooth / atr
+        dx = np.abs(di_plus - di_minus) / (di_plus + di_minus) * 100
+    adx = _wilder_ewm(dx, window)
+
+    return di_plus, di_minus, adx
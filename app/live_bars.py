@@ -0,0 +1,348 @@
+"""
+Живий потік хвилинних свічок (Polygon websocket, канал AM) у кільцеві буфери.
+
+Сервіс працює у фоновому потоці зі своїм event loop і тримає для кожного
+відстежуваного тикера буфер фіксованого розміру, тож пам'ять не росте
+незалежно від часу роботи бота. Кількість тикерів обмежена: при переповненні
+найдовше не запитуваний тикер відписується (LRU). Пакет websockets імпортується лише при старті.
+
+Під час підписки буфер одразу засівається історією до першої свічки потоку
+(кеш хвилин плюс свіжий хвіст з REST), тож вікна аналізу читаються з буфера
+без очікування, поки REST-покриття наздожене момент підписки.
+
+Ключ Polygon дозволяє одне з'єднання, тож у кількох процесах (воркери webhook)
+потік тримає лише власник оренди у сховищі стану; решта читають свічки з REST.
+
+Увімкнення: LIVE_BARS=1, адреса — LIVE_WS_URL (для тестів — bench.ws_replay).
+"""
+import asyncio, json, os, socket, threading, time, uuid
+
+import numpy as np
+from loguru import logger
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from app.state_backend import Document
+from config import POLYGON_API_KEY
+
+LIVE_ENABLED = os.getenv("LIVE_BARS", "0") == "1"
+LIVE_WS_URL = os.getenv("LIVE_WS_URL", "wss://socket.polygon.io/stocks")
+# Розмір буфера на тикер: ~5 сесій із розширеними годинами (16 год × 60 хв)
+BUFFER_BARS = 5 * 16 * 60
+# Максимальна кількість тикерів, на які можна підписатися
+MAX_TICKERS = 1000
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# Оренда з'єднання: власник продовжує її кожну третину терміну
+LIVE_LEASE_SECONDS = int(os.getenv("LIVE_LEASE_SECONDS", "30"))
+
+MINUTE_MS = 60_000
+
+_lease = Document("live_bars_lease", default=dict)
+
+
+class RingBuffer:
+    """
+    Кільцевий буфер хвилинних свічок (capacity, 6): t, o, h, l, c, v.
+    covered_from — з якого моменту буфер містить усі свічки: з початку
+    підписки, з початку засіву історією або (після переповнення) з найстарішої свічки.
+    """
+
+    def __init__(self, capacity: int = BUFFER_BARS):
+        self.capacity = capacity
+        self.covered_from: Optional[int] = None
+        self._data = np.empty((capacity, 6), dtype=np.float64)
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def reset(self, live_since: Optional[int] = None) -> None:
+        """Очищує буфер; live_since — час підписки, з якого свічки надходять без пропусків."""
+        with self._lock:
+            self._start = self._count = 0
+            self.covered_from = live_since
+
+    def _last_t(self) -> Optional[float]:
+        if not self._count:
+            return None
+        return self._data[(self._start + self._count - 1) % self.capacity, 0]
+
+    def append(self, row) -> None:
+        with self._lock:
+            last = self._last_t()
+            if last is not None and row[0] < last:
+                return
+            if last is not None and row[0] == last:
+                # Уточнення тієї ж хвилини
+                self._data[(self._start + self._count - 1) % self.capacity] = row
+                return
+            if self._count < self.capacity:
+                self._data[(self._start + self._count) % self.capacity] = row
+                self._count += 1
+            else:
+                self._data[self._start] = row
+                self._start = (self._start + 1) % self.capacity
+                self.covered_from = int(self._data[self._start, 0])
+
+    def _ordered(self) -> np.ndarray:
+        idx = (self._start + np.arange(self._count)) % self.capacity
+        return self._data[idx]
+
+    def seed(self, bars: np.ndarray, start_ms: int, end_ms: int) -> bool:
+        """
+        Додає історію (наприклад з REST), що покриває [start_ms, end_ms], перед живими
+        свічками. Приймається лише якщо вона стикується з початком живого покриття.
+        """
+        with self._lock:
+            if self.covered_from is None or end_ms < self.covered_from - MINUTE_MS or start_ms >= self.covered_from:
+                return False
+            current = self._ordered()
+            bars = bars[bars[:, 0] < (current[0, 0] if len(current) else self.covered_from)]
+            merged = np.concatenate((bars, current))[-self.capacity:]
+            self._data[:len(merged)] = merged
+            self._start, self._count = 0, len(merged)
+            truncated = len(bars) + len(current) > self.capacity
+            self.covered_from = int(merged[0, 0]) if truncated else start_ms
+            return True
+
+    def window(self, start_ms: int, end_ms: int) -> np.ndarray:
+        with self._lock:
+            bars = self._ordered()
+        return bars[(bars[:, 0] >= start_ms) & (bars[:, 0] <= end_ms)]
+
+    @property
+    def last_t(self) -> Optional[int]:
+        with self._lock:
+            last = self._last_t()
+        return None if last is None else int(last)
+
+
+class LiveBarService:
+    """Фонове підключення до websocket і розкладання подій AM по буферах."""
+
+    def __init__(self, url: str = LIVE_WS_URL, api_key: str = POLYGON_API_KEY,
+                 capacity: int = BUFFER_BARS, max_tickers: int = MAX_TICKERS):
+        self.url = url
+        self.api_key = api_key
+        self.capacity = capacity
+        self.max_tickers = max_tickers
+        self.connected = False
+        self.received = 0
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owns_stream = False
+
+        self._buffers: "OrderedDict[str, RingBuffer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    # --- керування ---
+
+    def start(self, tickers: Iterable[str] = ()) -> bool:
+        """Запускає фоновий потік; False, якщо пакет websockets не встановлено."""
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            logger.warning("[live] Пакет websockets не встановлено — живий потік вимкнено")
+            return False
+        self.watch(tickers)
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="live-bars", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+        if self._loop is not None and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def watch(self, tickers: Iterable[str]) -> List[str]:
+        """
+        Додає тикери до підписки; повертає ті, що додані вперше. При переповненні
+        відписує найдовше не запитувані тикери, але не ті, що передані в цьому ж виклику.
+        """
+        added, evicted = [], []
+        requested = [t.upper() for t in tickers]
+        with self._lock:
+            for ticker in requested:
+                if ticker in self._buffers:
+                    self._buffers.move_to_end(ticker)
+                    continue
+                if len(self._buffers) >= self.max_tickers:
+                    oldest = next(iter(self._buffers))
+                    if oldest in requested:
+                        logger.warning(f"[live] Досягнуто ліміт {self.max_tickers} тикерів, {ticker} не додано")
+                        break
+                    del self._buffers[oldest]
+                    evicted.append(oldest)
+                self._buffers[ticker] = RingBuffer(self.capacity)
+                added.append(ticker)
+        if (added or evicted) and self._loop is not None and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._resubscribe(added, evicted), self._loop)
+        return added
+
+    def is_watched(self, ticker: str) -> bool:
+        return ticker in self._buffers
+
+    def _touch(self, ticker: str) -> Optional[RingBuffer]:
+        """Буфер тикера з позначкою останнього звернення для LRU."""
+        with self._lock:
+            buffer = self._buffers.get(ticker)
+            if buffer is not None:
+                self._buffers.move_to_end(ticker)
+            return buffer
+
+    # --- оренда з'єднання ---
+
+    def acquire_lease(self) -> bool:
+        """Бере або продовжує оренду потоку; False, якщо її тримає інший живий процес."""
+        def take(data: Dict) -> bool:
+            now = time.time()
+            if data.get("owner") not in (None, self.owner_id) and data.get("expires", 0) > now:
+                return False
+            data.update(owner=self.owner_id, expires=now + LIVE_LEASE_SECONDS)
+            return True
+
+        self.owns_stream = _lease.update(take)
+        return self.owns_stream
+
+    def release_lease(self) -> None:
+        def drop(data: Dict) -> None:
+            if data.get("owner") == self.owner_id:
+                data.clear()
+
+        _lease.update(drop)
+        self.owns_stream = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    # --- читання ---
+
+    def window(self, ticker: str, start_ms: int, end_ms: int) -> Optional[np.ndarray]:
+        """Хвилинні свічки [start_ms, end_ms], якщо буфер повністю покриває вікно, інакше None."""
+        buffer = self._touch(ticker)
+        if buffer is None or buffer.covered_from is None or buffer.covered_from > start_ms:
+            return None
+        # Без з'єднання свіжіші за останню свічку дані невідомі
+        last = buffer.last_t
+        if not self.connected and (last is None or end_ms > last + MINUTE_MS):
+            return None
+        return buffer.window(start_ms, end_ms)
+
+    def seed(self, ticker: str, bars: np.ndarray, start_ms: int, end_ms: int) -> bool:
+        buffer = self._touch(ticker)
+        return buffer is not None and buffer.seed(bars, start_ms, end_ms)
+
+    def stats(self) -> Dict[str, int]:
+        return {"tickers": len(self._buffers), "connected": int(self.connected), "received": self.received,
+                "owner": int(self.owns_stream)}
+
+    # --- websocket ---
+
+    async def _subscribe(self, tickers: List[str]) -> None:
+        await self._ws.send(json.dumps({"action": "subscribe", "params": ",".join(f"AM.{t}" for t in tickers)}))
+        # Свічка поточної хвилини ще прийде, тож покриття — з її початку
+        since = int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+        for ticker in tickers:
+            buffer = self._buffers.get(ticker)
+            if buffer is not None:
+                buffer.reset(live_since=since)
+        # Запити до REST — в пулі потоків, щоб не затримувати читання потоку
+        asyncio.get_running_loop().run_in_executor(None, self._seed_history, tickers, since)
+
+    def _seed_history(self, tickers: List[str], since: int) -> None:
+        """Засіває буфери історією до моменту підписки since."""
+        from app.chart_data import live_seed
+
+        for ticker in tickers:
+            buffer = self._buffers.get(ticker)
+            # Тикер відписано або з'єднання перевстановлено — засів уже неактуальний
+            if buffer is None or buffer.covered_from != since:
+                continue
+            try:
+                bars, start_ms = live_seed(ticker, since)
+            except Exception as e:
+                logger.warning(f"[live] Не вдалося засіяти буфер {ticker}: {e}")
+                continue
+            buffer.seed(bars, start_ms, since - 1)
+
+    async def _resubscribe(self, added: List[str], evicted: List[str]) -> None:
+        if evicted:
+            await self._ws.send(json.dumps({"action": "unsubscribe", "params": ",".join(f"AM.{t}" for t in evicted)}))
+        if added:
+            await self._subscribe(added)
+
+    def _handle(self, message: str) -> None:
+        for event in json.loads(message):
+            ev = event.get("ev")
+            if ev == "AM":
+                buffer = self._buffers.get(event.get("sym"))
+                if buffer is None:
+                    continue
+                buffer.append((event["s"], event["o"], event["h"], event["l"], event["c"], event["v"]))
+                self.received += 1
+            elif ev == "status":
+                logger.info(f"[live] {event.get('status')}: {event.get('message', '')}")
+
+    async def _session(self, websockets) -> None:
+        async with websockets.connect(self.url, max_queue=1024) as ws:
+            self._ws = ws
+            await ws.send(json.dumps({"action": "auth", "params": self.api_key}))
+            with self._lock:
+                tickers = list(self._buffers)
+            if tickers:
+                await self._subscribe(tickers)
+            self.connected = True
+            logger.info(f"[live] Підключено до {self.url}, тикерів: {len(tickers)}")
+            async for message in ws:
+                self._handle(message)
+
+    async def _keep_lease(self) -> None:
+        """Продовжує оренду під час сесії; якщо її перехопили, закриває з'єднання."""
+        while True:
+            await asyncio.sleep(LIVE_LEASE_SECONDS / 3)
+            if not await asyncio.to_thread(self.acquire_lease):
+                logger.warning("[live] Оренду потоку втрачено, з'єднання закривається")
+                if self._ws is not None:
+                    await self._ws.close()
+                return
+
+    async def _run(self) -> None:
+        import websockets
+
+        self._loop = asyncio.get_running_loop()
+        delay = RECONNECT_MIN_DELAY
+        while not self._stopped.is_set():
+            if not await asyncio.to_thread(self.acquire_lease):
+                # Потік тримає інший процес — чекаємо, поки оренда звільниться або спливе
+                await asyncio.sleep(LIVE_LEASE_SECONDS / 3)
+                continue
+            keeper = asyncio.create_task(self._keep_lease())
+            try:
+                await self._session(websockets)
+                delay = RECONNECT_MIN_DELAY
+            except Exception as e:
+                logger.warning(f"[live] З'єднання втрачено: {e}")
+            finally:
+                keeper.cancel()
+                self.connected = False
+                self._ws = None
+                # Під час розриву могли пропасти свічки — буфери заповнюються заново
+                with self._lock:
+                    for buffer in self._buffers.values():
+                        buffer.reset()
+            if not self._stopped.is_set():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        await asyncio.to_thread(self.release_lease)
+
+
+service = LiveBarService()
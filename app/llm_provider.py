@@ -0,0 +1,358 @@
+import threading, time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from loguru import logger
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app import transport
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.prompt_manager import get_active_prompt, get_prompt_hash
+from app.weights_manager import get_active_weights, format_weights_for_prompt, get_weights_hash
+from app.analysis_schema import parse_analysis
+from app.usage_manager import (
+    BudgetExceededError, check_budget, estimate_tokens, record_usage, release_budget, reserve_budget,
+    settle_usage, COMPLETION_TOKENS_PER_TICKER, DATA_TOKENS_PER_TICKER
+)
+
+SYSTEM_PROMPT = "You are a stock market analyst with a high level of expertise in predicting trend movements."
+
+MAX_ATTEMPTS = 3
+
+# Хеджування: якщо основний провайдер не відповів за p90 своєї латентності,
+# той самий запит надсилається партнеру і береться перша валідна відповідь
+HEDGE_ENABLED = True
+HEDGE_PERCENTILE = 90
+# Поріг до накопичення статистики латентності
+HEDGE_DEFAULT_DELAY = 8.0
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Скільки дублікатів може виконуватись одночасно (щоб не зайняти весь пул _executor)
+HEDGE_MAX_CONCURRENT = 4
+# Облікова запись, на яку записуються токени програлого дубліката (не бюджет користувача)
+HEDGE_ACCOUNT = "hedge"
+
+# Резервний провайдер: отримує запит при відмові основного або дублікат
+# при повільній відповіді (може бути інша модель того ж вендора)
+HEDGE_PARTNERS = {
+    "gpt": "gemini",
+    "gemini": "gpt",
+}
+
+# Форма відповіді описана й у тексті: схема примусова, але опис підказує моделі зміст полів
+RESPONSE_FORMAT = """Respond with a JSON object {"analysis": [...]} containing one record per ticker:
+ticker, probability_value (integer 0-100), confidence (integer 1-10), justification,
+fundamental_impact, extra (optional)."""
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_CONCURRENT)
+
+
+class AnalysisError(RuntimeError):
+    """Провайдер(и) не повернули валідну відповідь після всіх спроб."""
+
+
+class HedgeRace:
+    """
+    Спільний стан основного запиту та його дубліката: відповідь зараховується
+    лише першому, хто її отримав; інший не робить нових спроб, а вже сплачені
+    ним токени записуються на HEDGE_ACCOUNT.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner: Optional[str] = None
+
+    def claim(self, name: str) -> bool:
+        with self._lock:
+            if self.winner is None:
+                self.winner = name
+                return True
+            return False
+
+    @property
+    def decided(self) -> bool:
+        return self.winner is not None
+
+
+def _payer(user_id, race: Optional[HedgeRace]):
+    return HEDGE_ACCOUNT if race is not None and race.decided else user_id
+
+
+class PromptParts(NamedTuple):
+    """
+    Промпт, розділений на статичний префікс (шаблон, ваги, формат відповіді —
+    однаковий для всіх запитів користувача, тож кешується провайдером) і дані.
+    """
+    prefix: str
+    body: str
+    # (хеш промпту, хеш ваг) — версія префікса
+    cache_key: Tuple[str, str]
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.body
+
+
+class AnalysisOutcome(NamedTuple):
+    result: Any
+    provider: str
+    model: str
+    # (хеш промпту, хеш ваг), з якими виконано аналіз
+    cache_key: Tuple[str, str] = ("", "")
+
+
+class LLMProvider:
+    """
+    Базовий клас провайдера. Нащадки реалізують лише _complete();
+    збирання промпту, облік токенів, повтори та розбір відповіді спільні.
+    """
+
+    name: str = ""
+    # Пауза перед повтором після помилки
+    retry_delay: float = 1
+
+    def __init__(self, model: str):
+        self.model = model
+        self.breaker = CircuitBreaker(f"{type(self).__name__}:{model}")
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def _complete(self, prompt: PromptParts, model: str, kind: str) -> Tuple[str, Optional[int], Optional[int]]:
+        """Виконує запит і повертає (текст, prompt_tokens, completion_tokens)."""
+        raise NotImplementedError
+
+    def is_rate_limit(self, exc: Exception) -> bool:
+        return False
+
+    def record_latency(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def run(self, prompt: PromptParts, kind: str, parse, user_id=None, command: str = "",
+            expected_tickers: int = 1, race: Optional[HedgeRace] = None) -> AnalysisOutcome:
+        """
+        Запит із повторами; повертає розібраний результат або кидає AnalysisError.
+        Rate limit і відкритий запобіжник не повторюються — запит одразу
+        віддається іншому провайдеру. race — спільний стан із дублікатом (run_hedged).
+        """
+        # Оцінка токенів резервується до виклику і замінюється фактичними після нього
+        model, reservation = reserve_budget(
+            user_id, self.model,
+            estimate_tokens(prompt.text) + COMPLETION_TOKENS_PER_TICKER * expected_tickers
+        )
+        last_error = None
+        try:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                if race is not None and race.decided:
+                    raise AnalysisError(f"[{self.name}] Скасовано: відповідь уже отримано від {race.winner}")
+                if not self.breaker.allow():
+                    raise CircuitOpenError(f"[{self.name}] Провайдер тимчасово недоступний")
+                started = time.perf_counter()
+                try:
+                    text, prompt_tokens, completion_tokens = self._complete(prompt, model, kind)
+                    logger.info(f"[{self.name}] Tokens used: input: {prompt_tokens}, out: {completion_tokens}")
+                    try:
+                        result = parse(text)
+                    except Exception:
+                        record_usage(_payer(user_id, race), command, model, prompt_tokens, completion_tokens)
+                        raise
+                    self.record_latency(time.perf_counter() - started)
+                    self.breaker.record_success()
+                    if race is not None and not race.claim(self.name):
+                        # Програлий дублікат: провайдер його сплатив, але користувач — ні
+                        logger.info(f"[{self.name}] Відповідь після {race.winner} — не зараховується")
+                        record_usage(HEDGE_ACCOUNT, command, model, prompt_tokens, completion_tokens)
+                        return AnalysisOutcome(result, self.name, model, prompt.cache_key)
+                    settle_usage(user_id, reservation, command, model, prompt_tokens, completion_tokens)
+                    return AnalysisOutcome(result, self.name, model, prompt.cache_key)
+                except Exception as e:
+                    last_error = e
+                    if self.is_rate_limit(e):
+                        logger.warning(f"[{self.name}] Rate limit на спробі {attempt}/{MAX_ATTEMPTS}")
+                        self.breaker.record_failure(rate_limited=True)
+                        break
+                    logger.error(f"[{self.name}] Помилка на спробі {attempt}/{MAX_ATTEMPTS}: {e}")
+                    self.breaker.record_failure()
+                if attempt < MAX_ATTEMPTS:
+                    transport.sleep(self.retry_delay)
+        finally:
+            release_budget(user_id, reservation)
+
+        raise AnalysisError(f"[{self.name}] Аналіз не виконано: {last_error}")
+
+
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: str) -> LLMProvider:
+    """Повертає зареєстрований провайдер за назвою ('gpt', 'gemini')."""
+    with _providers_lock:
+        if name not in _providers:
+            if name == "gpt":
+                from app.gpt_handler import OpenAIProvider
+                _providers[name] = OpenAIProvider()
+            elif name == "gemini":
+                from app.gemini_handler import GeminiProvider
+                _providers[name] = GeminiProvider()
+            else:
+                raise KeyError(f"Невідомий провайдер: {name}")
+        return _providers[name]
+
+
+def register_provider(name: str, provider: LLMProvider) -> None:
+    """Реєструє додатковий провайдер (наприклад іншу модель для хеджування)."""
+    provider.name = name
+    with _providers_lock:
+        _providers[name] = provider
+
+
+def parse_single(text: str) -> Dict[str, Any]:
+    return parse_analysis(text)[0]
+
+
+def parse_multi(text: str) -> List[Dict[str, Any]]:
+    """Записи за схемою, відсортовані за probability_value DESC."""
+    return parse_analysis(text)
+
+
+def build_prefix(user_id=None) -> Tuple[str, Tuple[str, str]]:
+    """Статичний префікс промпту користувача та його версія (хеш промпту, хеш ваг)."""
+    prompt_template = get_active_prompt(user_id)
+    weights = get_active_weights(user_id)
+    prefix = (
+        f"{prompt_template}\n\n"
+        f"Recommended Weights:\n{format_weights_for_prompt(weights)}\n\n"
+        f"Probability will be 100% if you are sure about the trend.\n\n"
+        f"{RESPONSE_FORMAT}\n\n"
+    )
+    return prefix, (get_prompt_hash(prompt_template), get_weights_hash(weights))
+
+
+def _session_section(session_data: str) -> str:
+    return f"Session Features:\n{session_data}\n" if session_data else ""
+
+
+def build_single_prompt(ticker: str, data_5m: str, data_1d: str, fundamental_data: str,
+                        user_id=None, session_data: str = "") -> PromptParts:
+    prefix, cache_key = build_prefix(user_id)
+    body = (
+        f"DATA:\n"
+        f"Ticker: {ticker}\n"
+        f"{_session_section(session_data)}"
+        f"Chart Data 5m:\n{data_5m}\n"
+        f"Chart Data 1d:\n{data_1d}\n"
+        f"Fundamental Data:\n{fundamental_data}"
+    )
+    return PromptParts(prefix, body, cache_key)
+
+
+def build_multi_prompt(tickers: List[str], data_5m_map: Dict[str, str], data_1d_map: Dict[str, str],
+                       fundamental_data_map: Dict[str, str], user_id=None,
+                       session_data_map: Optional[Dict[str, str]] = None) -> PromptParts:
+    prefix, cache_key = build_prefix(user_id)
+    session_data_map = session_data_map or {}
+    sections = [
+        f"Ticker: {tk}\n"
+        f"{_session_section(session_data_map.get(tk, ''))}"
+        f"Chart Data 5m:\n{data_5m_map.get(tk, '')}\n\n"
+        f"Chart Data 1d:\n{data_1d_map.get(tk, '')}\n\n"
+        f"Fundamental Data:\n{fundamental_data_map.get(tk, '')}\n"
+        for tk in tickers
+    ]
+    return PromptParts(prefix, "DATA SECTIONS:\n\n" + "\n---\n".join(sections), cache_key)
+
+
+def check_analysis_budget(provider_name: str, user_id=None, tickers: int = 1) -> None:
+    """
+    Перевірка бюджету користувача до завантаження даних (оцінка за розміром префікса
+    й типовим обсягом даних тикера). Виконується для кожного запиту, зокрема для тих,
+    що приєднуються до вже запущеного однакового аналізу.
+    """
+    prefix, _ = build_prefix(user_id)
+    check_budget(user_id, get_provider(provider_name).model,
+                 estimate_tokens(prefix) + (DATA_TOKENS_PER_TICKER + COMPLETION_TOKENS_PER_TICKER) * tickers)
+
+
+def _hedge_delay(provider: LLMProvider) -> float:
+    return provider.latency_percentile(HEDGE_PERCENTILE) or HEDGE_DEFAULT_DELAY
+
+
+def run_hedged(provider_name: str, prompt: PromptParts, kind: str, parse, user_id=None,
+               command: str = "", expected_tickers: int = 1) -> AnalysisOutcome:
+    """
+    Надсилає запит основному провайдеру. Якщо той впав (помилка, 429,
+    відкритий запобіжник) — запит одразу йде резервному провайдеру з
+    HEDGE_PARTNERS; якщо просто не відповів за p90 своєї латентності —
+    запит дублюється (не більше HEDGE_MAX_CONCURRENT дублікатів одночасно),
+    і повертається перша валідна відповідь. Користувачу зараховується лише вона.
+    """
+    primary = get_provider(provider_name)
+    args = (prompt, kind, parse, user_id, command, expected_tickers)
+    race = HedgeRace()
+    first = _executor.submit(primary.run, *args, race=race)
+
+    partner_name = HEDGE_PARTNERS.get(provider_name)
+    if partner_name is None:
+        return first.result()
+
+    timeout = _hedge_delay(primary) if HEDGE_ENABLED else None
+    done, _ = wait([first], timeout=timeout)
+    if done and (first.exception() is None or isinstance(first.exception(), BudgetExceededError)):
+        return first.result()
+
+    if done:
+        logger.warning(f"[{provider_name}] Недоступний — перемикаю запит на {partner_name}")
+        second = _executor.submit(get_provider(partner_name).run, *args, race=race)
+    elif _hedge_slots.acquire(blocking=False):
+        logger.info(f"[{provider_name}] Немає відповіді за поріг — дублюю запит у {partner_name}")
+        second = _executor.submit(get_provider(partner_name).run, *args, race=race)
+        second.add_done_callback(lambda _f: _hedge_slots.release())
+    else:
+        logger.info(f"[{provider_name}] Ліміт одночасних дублікатів вичерпано — чекаю на основний запит")
+        return first.result()
+
+    pending = {first, second}
+    last_error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is not None:
+                last_error = fut.exception()
+            elif fut.result().provider == race.winner:
+                return fut.result()
+    raise last_error
+
+
+def analyze_ticker(provider_name: str, ticker: str, data_5m: str, data_1d: str,
+                   fundamental_data: str, user_id=None, command: str = "",
+                   session_data: str = "") -> AnalysisOutcome:
+    """
+    Аналіз одного тикера. Результат — словник
+    {ticker, probability_value, confidence, justification, fundamental_impact, extra}.
+    """
+    prompt = build_single_prompt(ticker, data_5m, data_1d, fundamental_data, user_id, session_data)
+    return run_hedged(provider_name, prompt, "single", parse_single, user_id, command)
+
+
+def analyze_tickers(provider_name: str, tickers: List[str], data_5m_map: Dict[str, str],
+                    data_1d_map: Dict[str, str], fundamental_data_map: Dict[str, str],
+                    user_id=None, command: str = "",
+                    session_data_map: Optional[Dict[str, str]] = None) -> AnalysisOutcome:
+    """
+    Аналізує одночасно декілька тикерів. Результат — список словників
+    {ticker, probability_value, confidence, justification, fundamental_impact, extra},
+    відсортований за probability_value DESC.
+    """
+    prompt = build_multi_prompt(tickers, data_5m_map, data_1d_map, fundamental_data_map, user_id,
+                                session_data_map)
+    return run_hedged(provider_name, prompt, "multi", parse_multi, user_id, command,
+                      expected_tickers=len(tickers))
@@ -0,0 +1,179 @@
+"""
+Календар торгових сесій NYSE: свята, скорочені дні (закриття о 13:00) і межі сесій
+у часі Нью-Йорка (перехід на літній час враховує ZoneInfo).
+
+Свята обчислюються за правилами біржі й кешуються по роках, тож перевірка дня
+чи пошук N попередніх сесій — це пошук у відсортованому кортежі без звернень до API.
+"""
+import bisect
+
+from datetime import date, datetime, time as dtime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, List, Tuple
+from zoneinfo import ZoneInfo
+
+NY_TZ = ZoneInfo("America/New_York")
+
+REGULAR_OPEN = dtime(9, 30)
+REGULAR_CLOSE = dtime(16, 0)
+EARLY_CLOSE = dtime(13, 0)
+# Розширені години (премаркет і афтермаркет)
+EXTENDED_OPEN = dtime(4, 0)
+EXTENDED_CLOSE = dtime(20, 0)
+
+# Позапланові закриття (жалоба, стихійні лиха), яких немає в правилах
+SPECIAL_CLOSURES = frozenset({
+    date(2012, 10, 29), date(2012, 10, 30),  # ураган Сенді
+    date(2018, 12, 5),                       # похорон Дж. Буша-старшого
+    date(2025, 1, 9),                        # похорон Дж. Картера
+})
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-й (з 1) день тижня weekday у місяці; n = -1 — останній."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """Великдень (григоріанський, алгоритм Мееуса/Джонса/Бутчера)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    return date(year, month, (h + l - 7 * m + 114) % 31 + 1)
+
+
+def _observed(day: date) -> date:
+    """Свято у суботу переноситься на п'ятницю, у неділю — на понеділок."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def holidays(year: int) -> FrozenSet[date]:
+    days = {
+        _nth_weekday(year, 1, 0, 3),            # День Мартіна Лютера Кінга
+        _nth_weekday(year, 2, 0, 3),            # День президентів
+        _easter(year) - timedelta(days=2),      # Страсна п'ятниця
+        _nth_weekday(year, 5, 0, -1),           # День пам'яті
+        _observed(date(year, 7, 4)),            # День незалежності
+        _nth_weekday(year, 9, 0, 1),            # День праці
+        _nth_weekday(year, 11, 3, 4),           # День подяки
+        _observed(date(year, 12, 25)),          # Різдво
+    }
+    # Новий рік у суботу не переноситься на 31 грудня (правило NYSE)
+    if date(year, 1, 1).weekday() != 5:
+        days.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    days.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(days)
+
+
+@lru_cache(maxsize=None)
+def early_closes(year: int) -> FrozenSet[date]:
+    """Дні із закриттям о 13:00: 3 липня, п'ятниця після Дня подяки, Святвечір (якщо це робочий день)."""
+    days = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+    for day in (date(year, 7, 3), date(year, 12, 24)):
+        if day.weekday() < 4:
+            days.add(day)
+    return frozenset(d for d in days if d not in holidays(year))
+
+
+@lru_cache(maxsize=None)
+def _year_sessions(year: int) -> Tuple[date, ...]:
+    closed = holidays(year)
+    day, end, out = date(year, 1, 1), date(year, 12, 31), []
+    while day <= end:
+        if day.weekday() < 5 and day not in closed:
+            out.append(day)
+        day += timedelta(days=1)
+    return tuple(out)
+
+
+def is_session(day: date) -> bool:
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def close_time(day: date) -> dtime:
+    return EARLY_CLOSE if day in early_closes(day.year) else REGULAR_CLOSE
+
+
+def session_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Початок і кінець регулярної сесії дня у часі Нью-Йорка."""
+    return (datetime.combine(day, REGULAR_OPEN, tzinfo=NY_TZ),
+            datetime.combine(day, close_time(day), tzinfo=NY_TZ))
+
+
+def previous_session(day: date, inclusive: bool = False) -> date:
+    """Остання сесія до day (або сам day, якщо inclusive і це сесія)."""
+    return sessions_back(day if inclusive else day - timedelta(days=1), 1)[0]
+
+
+def next_session(day: date, inclusive: bool = False) -> date:
+    year = day.year
+    while True:
+        sessions = _year_sessions(year)
+        i = (bisect.bisect_left if inclusive else bisect.bisect_right)(sessions, day)
+        if i < len(sessions):
+            return sessions[i]
+        year, inclusive, day = year + 1, True, date(year + 1, 1, 1)
+
+
+def sessions_back(end: date, n: int) -> List[date]:
+    """Останні n сесій до end включно, від старішої до новішої."""
+    out: List[date] = []
+    year = end.year
+    i = bisect.bisect_right(_year_sessions(year), end)
+    while len(out) < n:
+        sessions = _year_sessions(year)
+        take = min(i, n - len(out))
+        out[:0] = sessions[i - take:i]
+        year -= 1
+        i = len(_year_sessions(year))
+    return out
+
+
+def sessions_between(start: date, end: date) -> List[date]:
+    """Усі сесії в [start, end]."""
+    out: List[date] = []
+    for year in range(start.year, end.year + 1):
+        sessions = _year_sessions(year)
+        out.extend(sessions[bisect.bisect_left(sessions, start):bisect.bisect_right(sessions, end)])
+    return out
+
+
+def last_session_end(dt: datetime) -> datetime:
+    """
+    dt, якщо це час торгового дня; інакше — закриття останньої сесії перед ним
+    (для кінця вибірки, що припав на вихідний чи свято).
+    """
+    local = dt.astimezone(NY_TZ)
+    if is_session(local.date()):
+        return dt
+    return session_bounds(previous_session(local.date()))[1]
+
+
+def window_start(end_dt: datetime, sessions: int) -> datetime:
+    """Північ першого дня з останніх `sessions` сесій, що закінчуються днем end_dt."""
+    local = end_dt.astimezone(NY_TZ)
+    first = sessions_back(local.date(), sessions)[0]
+    return datetime.combine(first, dtime(0), tzinfo=NY_TZ)
+
+
+def close_minute(day: date) -> int:
+    """Хвилина закриття регулярної сесії від півночі (960 або 780 у скорочений день)."""
+    close = close_time(day)
+    return close.hour * 60 + close.minute
@@ -1,11 +1,12 @@
 # prompt_manager.py
-import json
-import os
+import hashlib
 from datetime import datetime
 from typing import Dict, List, Optional, Union
-from pathlib import Path
+
+from app.state_backend import Document
 
 # Constants
+# Legacy JSON file; its content is imported into the state backend on first write
 PROMPTS_FILE = "data/prompts.json"
 DEFAULT_PROMPT = """
     You are an intraday stock analyst with the seriousness and discipline of a professional trader. My grandfather is terminally ill and has always dreamed of, in his final days, understanding which single stock is most likely to break out and trend today. He placed his last hope in your analysis.
@@ -25,37 +26,21 @@ DEFAULT_PROMPT = """
     Important:  
     - Treat each ticker as if you were risking your own capital.  
     - Be ruthless and precise: only the strongest breakout setups should score near 100%.  
-    - Return a pure JSON array, sorted by probability_value DESC.  
+    - Return a JSON object {"analysis": [...]} with one record per ticker, sorted by probability_value DESC.  
 """
 
-# Ensure data directory exists
-Path("data").mkdir(exist_ok=True)
+_prompts = Document(
+    "prompts",
+    default=lambda: {"default": DEFAULT_PROMPT, "users": {}},
+    legacy_path=PROMPTS_FILE,
+)
 
 def _load_prompts() -> Dict:
-    """Load prompts from JSON file or return initial structure if file doesn't exist."""
-    if not os.path.exists(PROMPTS_FILE):
-        return {
-            "default": DEFAULT_PROMPT,
-            "users": {}
-        }
-    
-    try:
-        with open(PROMPTS_FILE, 'r') as f:
-            data = json.load(f)
-            # Ensure backward compatibility
-            if "users" not in data:
-                data["users"] = {}
-            return data
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {
-            "default": DEFAULT_PROMPT,
-            "users": {}
-        }
-
-def _save_prompts(prompts: Dict) -> None:
-    """Save prompts to JSON file."""
-    with open(PROMPTS_FILE, 'w') as f:
-        json.dump(prompts, f, indent=4)
+    """Load prompts from the state backend."""
+    data = _prompts.read()
+    # Ensure backward compatibility
+    data.setdefault("users", {})
+    return data
 
 def get_default_prompt() -> str:
     """Return the default analysis prompt."""
@@ -93,22 +78,18 @@ def save_prompt(user_id: Union[str, int], prompt: str) -> None:
     Maintains history of all previous prompts.
     """
     user_id = str(user_id)
-    prompts = _load_prompts()
-    
-    if "users" not in prompts:
-        prompts["users"] = {}
-    
-    if user_id not in prompts["users"]:
-        prompts["users"][user_id] = {"history": []}
-    
+
     # Add new prompt entry to history
     new_entry = {
         "prompt": prompt,
         "timestamp": datetime.now().isoformat()
     }
-    
-    prompts["users"][user_id]["history"].append(new_entry)
-    _save_prompts(prompts)
+
+    def add(prompts: Dict) -> None:
+        users = prompts.setdefault("users", {})
+        users.setdefault(user_id, {"history": []})["history"].append(new_entry)
+
+    _prompts.update(add)
 
 def get_active_prompt(user_id: Optional[Union[str, int]] = None) -> str:
     """
@@ -121,16 +102,20 @@ def get_active_prompt(user_id: Optional[Union[str, int]] = None) -> str:
             return custom_prompt
     return get_default_prompt()
 
+def get_prompt_hash(prompt: str) -> str:
+    """Return a short stable hash of the prompt text (used in cache and coalescing keys)."""
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+
 def reset_user_prompt(user_id: Union[str, int]) -> bool:
     """
     Reset a user's prompt history (delete all custom prompts).
     Returns True if reset was successful, False if user had no history.
     """
     user_id = str(user_id)
-    prompts = _load_prompts()
-    
-    if user_id in prompts["users"]:
-        del prompts["users"][user_id]
-        _save_prompts(prompts)
-        return True
-    return False
\ No newline at end of file
+    if user_id not in _load_prompts()["users"]:
+        return False
+
+    def reset(prompts: Dict) -> bool:
+        return prompts.setdefault("users", {}).pop(user_id, None) is not None
+
+    return _prompts.update(reset)
\ No newline at end of file
@@ -0,0 +1,155 @@
+import asyncio, time
+
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List
+
+# Смуги пріоритету: інтерактивні запити завжди обслуговуються раніше масових
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Скільки задач виконується одночасно
+MAX_WORKERS = 8
+# Максимальна кількість задач у черзі; далі — відмова
+MAX_QUEUE = 200
+# Скільки задач одного користувача може виконуватись одночасно
+PER_USER_LIMIT = 2
+# Скільки останніх очікувань зберігати для статистики
+WAIT_SAMPLES = 500
+
+
+class QueueFullError(RuntimeError):
+    """Глобальна черга заповнена — запит відхилено."""
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        super().__init__(f"Бот зараз перевантажений ({depth} задач у черзі). Спробуйте за хвилину.")
+
+
+class _Job:
+    __slots__ = ("user_id", "lane", "fn", "future", "enqueued_at")
+
+    def __init__(self, user_id: Hashable, lane: int, fn: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.user_id = user_id
+        self.lane = lane
+        self.fn = fn
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class Scheduler:
+    """
+    Планувальник між обробниками команд і етапами завантаження/LLM.
+
+    Задачі стоять у двох смугах (interactive, bulk). Усередині смуги користувачі
+    обслуговуються по колу, тож довгий масовий аналіз одного користувача не
+    блокує інших. Кожен користувач має ліміт одночасних задач, а загальна
+    черга обмежена і відхиляє нові задачі при переповненні.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_queue: int = MAX_QUEUE,
+                 per_user_limit: int = PER_USER_LIMIT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+
+        self._lanes: Dict[int, "OrderedDict[Hashable, Deque[_Job]]"] = {
+            INTERACTIVE: OrderedDict(), BULK: OrderedDict()
+        }
+        self._queued = 0
+        self._running = 0
+        self._running_by_user: Dict[Hashable, int] = {}
+        self._waits: Dict[int, Deque[float]] = {lane: deque(maxlen=WAIT_SAMPLES) for lane in self._lanes}
+
+    async def submit(self, user_id: Hashable, lane: int, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ставить задачу в чергу і чекає на її результат."""
+        if self._queued >= self.max_queue:
+            raise QueueFullError(self._queued)
+
+        job = _Job(user_id, lane, fn, asyncio.get_running_loop().create_future())
+        self._lanes[lane].setdefault(user_id, deque()).append(job)
+        self._queued += 1
+        self._dispatch()
+        return await job.future
+
+    async def submit_many(self, user_id: Hashable, lane: int,
+                          fns: List[Callable[[], Awaitable[Any]]]) -> List[Any]:
+        """
+        Виконує багато задач одного користувача, тримаючи в черзі не більше
+        per_user_limit з них одночасно. Повертає результати або винятки в порядку fns.
+        """
+        window = asyncio.Semaphore(self.per_user_limit)
+
+        async def one(fn):
+            async with window:
+                return await self.submit(user_id, lane, fn)
+
+        return await asyncio.gather(*(one(fn) for fn in fns), return_exceptions=True)
+
+    def _next_job(self):
+        for lane, users in self._lanes.items():
+            for user_id in list(users):
+                if self._running_by_user.get(user_id, 0) >= self.per_user_limit:
+                    continue
+                jobs = users[user_id]
+                job = jobs.popleft()
+                # Користувач переходить у кінець черги — наступним буде інший
+                if jobs:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._queued -= 1
+            if job.future.cancelled():
+                continue
+            self._running += 1
+            self._running_by_user[job.user_id] = self._running_by_user.get(job.user_id, 0) + 1
+            self._waits[job.lane].append(time.monotonic() - job.enqueued_at)
+            asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            result = await job.fn()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running -= 1
+            left = self._running_by_user[job.user_id] - 1
+            if left:
+                self._running_by_user[job.user_id] = left
+            else:
+                del self._running_by_user[job.user_id]
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """Глибина черги, кількість задач, що виконуються, і час очікування по смугах."""
+        lanes = {}
+        for lane, users in self._lanes.items():
+            waits = sorted(self._waits[lane])
+            lanes[LANE_NAMES[lane]] = {
+                "queued": sum(len(jobs) for jobs in users.values()),
+                "users": len(users),
+                "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            }
+        return {
+            "queued": self._queued,
+            "running": self._running,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "lanes": lanes,
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,139 @@
+import random, time, warnings
+
+import numpy as np
+from datetime import datetime
+from loguru import logger
+from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+from config import POLYGON_API_KEY
+from app import market_calendar, transport, warehouse
+
+SNAPSHOT_URL = "https://api.polygon.io/v2/snapshot/locale/us/markets/stocks/tickers"
+NY_TZ = ZoneInfo("America/New_York")
+
+MAX_RETRIES = 3
+INITIAL_BACKOFF = 1
+
+# Історія зі сховища для ATR і середнього обсягу
+LOOKBACK_SESSIONS = 20
+ATR_WINDOW = 14
+# Фільтри ліквідності
+MIN_PRICE = 2.0
+MIN_AVG_VOLUME = 300_000
+TOP_N = 20
+
+# Ключі сортування: score — рух в ATR, підсилений відносним обсягом
+SORT_KEYS = ("score", "gap", "rvol", "atr")
+
+
+def _request_snapshot() -> List[dict]:
+    backoff = INITIAL_BACKOFF
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        resp = transport.http_get(SNAPSHOT_URL, params={"apiKey": POLYGON_API_KEY}, timeout=30)
+        if resp.status_code == 200:
+            return resp.json().get("tickers") or []
+        elif resp.status_code == 429:
+            sleep_time = backoff + random.uniform(0, backoff * 0.1)
+            logger.warning(f"[screener] Rate limit, sleeping {sleep_time:.1f}s (attempt {attempt})")
+            transport.sleep(sleep_time)
+            backoff *= 2
+        else:
+            resp.raise_for_status()
+
+    raise RuntimeError(f"Не вдалося отримати snapshot за {MAX_RETRIES} спроб")
+
+
+def snapshot_arrays(items: List[dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Snapshot → (tickers, price, prev_close, volume), відсортовані за тикером.
+    price — остання угода (у премаркеті теж), volume — обсяг поточного дня з 04:00.
+    """
+    rows = []
+    for item in items:
+        last = (item.get("lastTrade") or {}).get("p") or (item.get("min") or {}).get("c") or (item.get("day") or {}).get("c")
+        rows.append((
+            item.get("ticker", ""),
+            last or np.nan,
+            (item.get("prevDay") or {}).get("c") or np.nan,
+            (item.get("day") or {}).get("v") or 0.0,
+        ))
+    rows.sort(key=lambda r: r[0])
+    tickers = np.array([r[0] for r in rows], dtype=str)
+    values = np.array([r[1:] for r in rows], dtype=np.float64).reshape(-1, 3)
+    return tickers, values[:, 0], values[:, 1], values[:, 2]
+
+
+def compute_metrics(tickers: np.ndarray, price: np.ndarray, prev_close: np.ndarray, volume: np.ndarray,
+                    panel_tickers: np.ndarray, panel: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Векторні метрики для всього ринку:
+      gap      — геп до попереднього закриття, %;
+      rvol     — обсяг поточного дня (у премаркеті — премаркету) до середнього денного;
+      atr      — рух від попереднього закриття в одиницях ATR(14);
+      score    — |atr| × √rvol;
+      avg_volume — середній денний обсяг за LOOKBACK_SESSIONS.
+    """
+    n = len(tickers)
+    idx = np.searchsorted(panel_tickers, tickers)
+    idx_clipped = np.minimum(idx, max(len(panel_tickers) - 1, 0))
+    found = (idx < len(panel_tickers)) & (panel_tickers[idx_clipped] == tickers) if len(panel_tickers) else np.zeros(n, bool)
+
+    atr = np.full(n, np.nan)
+    avg_volume = np.full(n, np.nan)
+    last_close = np.full(n, np.nan)
+    if len(panel_tickers):
+        h, l, c, v = panel[..., 2], panel[..., 3], panel[..., 4], panel[..., 5]
+        prev_c = np.vstack((np.full((1, c.shape[1]), np.nan), c[:-1]))
+        with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            true_range = np.fmax(h - l, np.fmax(np.abs(h - prev_c), np.abs(l - prev_c)))
+            panel_atr = np.nanmean(true_range[-ATR_WINDOW:], axis=0)
+            panel_avg_volume = np.nanmean(v, axis=0)
+        atr[found] = panel_atr[idx[found]]
+        avg_volume[found] = panel_avg_volume[idx[found]]
+        last_close[found] = c[-1, idx[found]]
+
+    # Якщо snapshot не містить prevDay — беремо останнє закриття зі сховища
+    prev_close = np.where(np.isnan(prev_close), last_close, prev_close)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = price - prev_close
+        gap = move / prev_close * 100
+        rvol = volume / avg_volume
+        atr_move = move / atr
+        score = np.abs(atr_move) * np.sqrt(rvol)
+
+    return {"gap": gap, "rvol": rvol, "atr": atr_move, "score": score, "avg_volume": avg_volume}
+
+
+def screen(sort: str = "score", top: int = TOP_N, min_price: float = MIN_PRICE,
+           min_avg_volume: float = MIN_AVG_VOLUME) -> List[Dict]:
+    """
+    Прохід по всьому ринку: snapshot + історія зі сховища → ранжований список кандидатів
+    {ticker, price, gap, rvol, atr, score}, відсортований за |sort| DESC.
+    WarehouseMissError, якщо історія у сховищі ще наповнюється у фоні.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Невідомий ключ сортування: {sort}")
+    started = time.perf_counter()
+
+    tickers, price, prev_close, volume = snapshot_arrays(_request_snapshot())
+    end = market_calendar.previous_session(datetime.now(NY_TZ).date())
+    panel_tickers, panel = warehouse.load_panel(end, LOOKBACK_SESSIONS)
+    metrics = compute_metrics(tickers, price, prev_close, volume, panel_tickers, panel)
+
+    key = np.abs(metrics[sort])
+    valid = np.isfinite(key) & (price >= min_price) & (metrics["avg_volume"] >= min_avg_volume)
+    order = np.flatnonzero(valid)[np.argsort(-key[valid], kind="stable")][:top]
+
+    logger.info(f"[screener] {len(tickers)} тикерів, {int(valid.sum())} пройшли фільтри, "
+                f"{time.perf_counter() - started:.2f}s")
+    return [{
+        "ticker": str(tickers[i]),
+        "price": round(float(price[i]), 4),
+        "gap": round(float(metrics["gap"][i]), 2),
+        "rvol": round(float(metrics["rvol"][i]), 2),
+        "atr": round(float(metrics["atr"][i]), 2),
+        "score": round(float(metrics["score"][i]), 2),
+    } for i in order]
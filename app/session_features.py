@@ -0,0 +1,151 @@
+"""
+Сегментація внутрішньоденних свічок за сесіями та ознаки дня для промпту, скринера й бектестів.
+
+Кожна свічка (n, 6: t, o, h, l, c, v) отримує мітку сесії за часом Нью-Йорка:
+премаркет 04:00–09:30, регулярна сесія 09:30–закриття (16:00 або 13:00 у скорочений день),
+афтермаркет закриття–20:00. Усе обчислюється векторно над масивом свічок.
+
+Ознаки дня (останнього дня в масиві або заданого): OHLCV кожної сесії, геп відносно
+закриття попередньої регулярної сесії, діапазон відкриття (перші OPENING_RANGE_MINUTES
+регулярної сесії) і відносний обсяг премаркету — відносно премаркету попередніх днів
+до того самого часу. Результат кешується за (тикер, день, остання свічка).
+"""
+import threading
+
+import numpy as np
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.bar_cache import DAY_MS, EPOCH_ORDINAL, MINUTE_MS, SESSION_OPEN_MIN, ny_offsets_ms, session_close_minutes
+
+OUTSIDE, PREMARKET, REGULAR, AFTER_HOURS = -1, 0, 1, 2
+SESSION_NAMES = {PREMARKET: "pm", REGULAR: "rth", AFTER_HOURS: "ah"}
+
+PREMARKET_OPEN_MIN = 4 * 60
+AFTER_HOURS_CLOSE_MIN = 20 * 60
+OPENING_RANGE_MINUTES = 15
+
+# Скільки днів ознак тримати в пам'яті
+MAX_CACHED_DAYS = 4096
+
+_cache: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def segment(bars: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Мітка сесії, номер дня (з 1970-01-01 за Нью-Йорком) і хвилина від півночі для кожної свічки."""
+    t = bars[:, 0].astype(np.int64)
+    local = t + ny_offsets_ms(t)
+    day = local // DAY_MS
+    minute = (local % DAY_MS) // MINUTE_MS
+    close = session_close_minutes(local)
+
+    labels = np.full(len(bars), OUTSIDE, dtype=np.int8)
+    labels[(minute >= PREMARKET_OPEN_MIN) & (minute < SESSION_OPEN_MIN)] = PREMARKET
+    labels[(minute >= SESSION_OPEN_MIN) & (minute < close)] = REGULAR
+    labels[(minute >= close) & (minute < AFTER_HOURS_CLOSE_MIN)] = AFTER_HOURS
+    return labels, day, minute
+
+
+def session_ohlcv(bars: np.ndarray, labels: np.ndarray, day: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    OHLCV кожної сесії кожного дня: (дні, мітки, значення (k, 5): o, h, l, c, v).
+    Свічки відсортовані за часом, тож сесія — це суцільний відрізок масиву.
+    """
+    keep = labels != OUTSIDE
+    bars, labels, day = bars[keep], labels[keep], day[keep]
+    if len(bars) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), np.empty((0, 5))
+
+    starts = np.flatnonzero(np.concatenate(([True], (day[1:] != day[:-1]) | (labels[1:] != labels[:-1]))))
+    ends = np.concatenate((starts[1:], [len(bars)])) - 1
+    values = np.column_stack((
+        bars[starts, 1],
+        np.maximum.reduceat(bars[:, 2], starts),
+        np.minimum.reduceat(bars[:, 3], starts),
+        bars[ends, 4],
+        np.add.reduceat(bars[:, 5], starts),
+    ))
+    return day[starts], labels[starts], values
+
+
+def _pct(value: float, base: float) -> Optional[float]:
+    if not np.isfinite(value) or not np.isfinite(base) or base == 0:
+        return None
+    return round(float(value / base - 1) * 100, 2)
+
+
+def _num(value: float) -> Optional[float]:
+    return round(float(value), 4) if np.isfinite(value) else None
+
+
+def day_features(bars: np.ndarray, day: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """Ознаки дня `day` (типово — дня останньої свічки) зі свічок до кінця цього дня; None, якщо свічок немає."""
+    if len(bars) == 0:
+        return None
+    labels, days, minute = segment(bars)
+    target = days[-1] if day is None else day.toordinal() - EPOCH_ORDINAL
+    upto = days <= target
+    bars, labels, days, minute = bars[upto], labels[upto], days[upto], minute[upto]
+    if len(bars) == 0 or days[-1] != target:
+        return None
+
+    group_days, group_labels, values = session_ohlcv(bars, labels, days)
+    features: Dict[str, Any] = {"date": date.fromordinal(EPOCH_ORDINAL + int(target)).isoformat()}
+    for label, name in SESSION_NAMES.items():
+        match = np.flatnonzero((group_days == target) & (group_labels == label))
+        row = values[match[0]] if len(match) else np.full(5, np.nan)
+        for key, value in zip(("o", "h", "l", "c", "v"), row):
+            features[f"{name}_{key}"] = _num(value)
+
+    prior_rth = np.flatnonzero((group_days < target) & (group_labels == REGULAR))
+    prev_close = values[prior_rth[-1], 3] if len(prior_rth) else np.nan
+    features["prev_close"] = _num(prev_close)
+    # Ціна відкриття дня: перша угода регулярної сесії, а до неї — остання ціна премаркету
+    reference = features["rth_o"] if features["rth_o"] is not None else features["pm_c"]
+    features["gap_pct"] = _pct(reference if reference is not None else np.nan, prev_close)
+
+    opening = (days == target) & (labels == REGULAR) & (minute < SESSION_OPEN_MIN + OPENING_RANGE_MINUTES)
+    if opening.any():
+        or_high, or_low = bars[opening, 2].max(), bars[opening, 3].min()
+        features.update(or_h=_num(or_high), or_l=_num(or_low), or_range_pct=_pct(or_high, or_low))
+    else:
+        features.update(or_h=None, or_l=None, or_range_pct=None)
+
+    # Відносний обсяг премаркету: той самий проміжок 04:00–(остання хвилина) у попередні дні
+    premarket = labels == PREMARKET
+    cutoff = minute[-1] if labels[-1] == PREMARKET else SESSION_OPEN_MIN
+    prior_days = np.unique(days[(days < target) & (labels == REGULAR)])
+    today_volume = bars[premarket & (days == target), 5].sum()
+    if len(prior_days):
+        prior = premarket & (days < target) & (minute <= cutoff) & np.isin(days, prior_days)
+        mean_volume = bars[prior, 5].sum() / len(prior_days)
+        features["pm_rvol"] = round(float(today_volume / mean_volume), 2) if mean_volume > 0 else None
+    else:
+        features["pm_rvol"] = None
+    return features
+
+
+def features_for(ticker: str, bars: np.ndarray, day: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """day_features із кешем: той самий день із тими самими свічками рахується один раз."""
+    if len(bars) == 0:
+        return None
+    key = (ticker, day, int(bars[-1, 0]), len(bars))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    features = day_features(bars, day)
+    with _cache_lock:
+        _cache[key] = features
+        while len(_cache) > MAX_CACHED_DAYS:
+            _cache.popitem(last=False)
+    return features
+
+
+def format_features(features: Optional[Dict[str, Any]]) -> str:
+    """Рядок для промпту: "date:YYYY-MM-DD|prev_close:..|gap_pct:..|..." (порожні значення пропускаються)."""
+    if not features:
+        return ""
+    return "|".join(f"{key}:{value}" for key, value in features.items() if value is not None)
@@ -0,0 +1,77 @@
+import asyncio, threading
+
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Об'єднує одночасні синхронні виклики з однаковим ключем: функцію виконує
+    лише перший потік, решта чекають і отримують той самий результат або виняток.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            logger.debug(f"[{self.name}] Очікую на запит, що вже виконується: {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Асинхронний варіант SingleFlight для обробників команд: одночасні ідентичні
+    запити чекають на одну спільну задачу. Скасування одного очікувача не
+    скасовує спільне обчислення.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = 0
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+        else:
+            self.shared += 1
+            logger.debug(f"[{self.name}] Приєднуюсь до аналізу, що вже виконується: {key}")
+        return await asyncio.shield(task)
@@ -0,0 +1,301 @@
+"""
+Спільне сховище стану (промпти, ваги, облік токенів, історія) для кількох процесів бота.
+
+Кожен документ — JSON із лічильником версії. Оновлення виконуються як атомарний
+read-modify-write у транзакції сховища; процеси кешують розібраний документ і
+перечитують його лише тоді, коли версія в сховищі змінилась.
+
+Бекенди (STATE_BACKEND):
+  sqlite — файл STATE_DB_PATH, транзакції BEGIN IMMEDIATE (за замовчуванням);
+  redis  — сервер із протоколом RESP за STATE_REDIS_URL, оптимістичні WATCH/MULTI/EXEC
+           (для тестів — bench.resp_stub).
+
+Якщо документа ще немає в сховищі, він читається зі старого JSON-файлу
+і переноситься в сховище при першому записі.
+"""
+import copy, json, os, random, socket, sqlite3, threading, time
+
+from loguru import logger
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "data/state.db")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://127.0.0.1:6379/0")
+
+# Очікування блокування SQLite іншим процесом, с
+SQLITE_BUSY_TIMEOUT = 30
+# Спроби оптимістичної транзакції Redis при конкурентних записах
+REDIS_MAX_RETRIES = 50
+# Випадкова пауза між спробами (до attempt × значення, с), щоб записувачі не змагались у такт
+REDIS_RETRY_DELAY = 0.002
+REDIS_KEY_PREFIX = "state:"
+
+T = TypeVar("T")
+# Функція оновлення тіла документа: попереднє тіло (None — документа немає) → нове тіло
+Apply = Callable[[Optional[str]], str]
+
+
+class StateBackend:
+    """Сховище версіонованих JSON-документів."""
+
+    def version(self, name: str) -> int:
+        """Поточна версія документа (0 — документа немає)."""
+        raise NotImplementedError
+
+    def load(self, name: str) -> Tuple[int, Optional[str]]:
+        raise NotImplementedError
+
+    def update(self, name: str, apply: Apply) -> Tuple[int, str]:
+        """Атомарно замінює тіло документа на apply(тіло); повертає (нова версія, нове тіло)."""
+        raise NotImplementedError
+
+
+class SQLiteBackend(StateBackend):
+    """
+    SQLite у режимі WAL: читання не блокують запис, а BEGIN IMMEDIATE бере
+    блокування запису до читання, тож паралельні оновлення з різних процесів
+    виконуються по черзі й не губляться.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "name TEXT PRIMARY KEY, version INTEGER NOT NULL, body TEXT NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def version(self, name: str) -> int:
+        row = self._conn().execute("SELECT version FROM documents WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, name: str) -> Tuple[int, Optional[str]]:
+        row = self._conn().execute("SELECT version, body FROM documents WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def update(self, name: str, apply: Apply) -> Tuple[int, str]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT version, body FROM documents WHERE name = ?", (name,)).fetchone()
+            body = apply(row[1] if row else None)
+            version = (row[0] if row else 0) + 1
+            conn.execute(
+                "INSERT INTO documents (name, version, body) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = excluded.version, body = excluded.body",
+                (name, version, body),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version, body
+
+
+class RESPError(RuntimeError):
+    """Помилка, повернута сервером RESP."""
+
+
+class RESPConnection:
+    """Мінімальний клієнт протоколу RESP (Redis) поверх сокета."""
+
+    def __init__(self, host: str, port: int, timeout: float = 10):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile("rb")
+
+    def command(self, *args) -> Any:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("RESP server closed connection")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RESPError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RESPError(f"Unexpected RESP reply: {line!r}")
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+
+class RedisBackend(StateBackend):
+    """
+    Документ і його версія — два ключі. Оновлення: WATCH тіла, читання,
+    MULTI/SET/INCR/EXEC; якщо інший процес встиг змінити документ, EXEC
+    повертає nil і транзакція повторюється з новим тілом.
+    """
+
+    def __init__(self, url: str = STATE_REDIS_URL, prefix: str = REDIS_KEY_PREFIX):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip("/") or 0)
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _conn(self) -> RESPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = RESPConnection(self.host, self.port)
+            if self.password:
+                conn.command("AUTH", self.password)
+            if self.db:
+                conn.command("SELECT", self.db)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, fn: Callable[[RESPConnection], T]) -> T:
+        # Розірване з'єднання відкривається заново один раз
+        try:
+            return fn(self._conn())
+        except (ConnectionError, OSError):
+            self._local.conn = None
+            return fn(self._conn())
+
+    def _keys(self, name: str) -> Tuple[str, str]:
+        return f"{self.prefix}{name}", f"{self.prefix}{name}:version"
+
+    def version(self, name: str) -> int:
+        _, version_key = self._keys(name)
+        return int(self._call(lambda c: c.command("GET", version_key)) or 0)
+
+    def load(self, name: str) -> Tuple[int, Optional[str]]:
+        body, version = self._call(lambda c: c.command("MGET", *self._keys(name)))
+        return int(version or 0), body
+
+    def update(self, name: str, apply: Apply) -> Tuple[int, str]:
+        body_key, version_key = self._keys(name)
+
+        def attempt(conn: RESPConnection) -> Optional[Tuple[int, str]]:
+            conn.command("WATCH", body_key)
+            try:
+                body = apply(conn.command("GET", body_key))
+            except BaseException:
+                conn.command("UNWATCH")
+                raise
+            conn.command("MULTI")
+            conn.command("SET", body_key, body)
+            conn.command("INCR", version_key)
+            result = conn.command("EXEC")
+            return None if result is None else (int(result[1]), body)
+
+        for n in range(1, REDIS_MAX_RETRIES + 1):
+            result = self._call(attempt)
+            if result is not None:
+                return result
+            time.sleep(random.uniform(0, REDIS_RETRY_DELAY * n))
+        raise RuntimeError(f"Не вдалося оновити {name}: забагато конкурентних змін")
+
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StateBackend:
+    """Бекенд створюється при першому зверненні (імпорт модулів не чіпає файлів)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STATE_BACKEND == "redis":
+                    _backend = RedisBackend()
+                elif STATE_BACKEND == "sqlite":
+                    _backend = SQLiteBackend()
+                else:
+                    raise ValueError(f"Невідомий STATE_BACKEND: {STATE_BACKEND}")
+                logger.info(f"Сховище стану: {type(_backend).__name__}")
+    return _backend
+
+
+def set_backend(backend: Optional[StateBackend]) -> None:
+    """Встановлює бекенд явно (бенчмарки); None — повернутися до налаштувань з оточення."""
+    global _backend
+    _backend = backend
+
+
+class Document:
+    """
+    JSON-документ у сховищі стану з локальним кешем, що інвалідовується за версією.
+    read() повертає копію, тож зміни викликача не потрапляють у кеш.
+    """
+
+    def __init__(self, name: str, default: Callable[[], Dict], legacy_path: Optional[str] = None):
+        self.name = name
+        self.default = default
+        self.legacy_path = legacy_path
+        self._cached: Optional[Tuple[StateBackend, int, Dict]] = None
+        self._lock = threading.Lock()
+
+    def _initial(self) -> Dict:
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, OSError):
+                logger.warning(f"[state] Не вдалося прочитати {self.legacy_path}, використовую порожній {self.name}")
+        return self.default()
+
+    def _remember(self, backend: StateBackend, version: int, data: Dict) -> None:
+        with self._lock:
+            if self._cached is None or self._cached[0] is not backend or self._cached[1] <= version:
+                self._cached = (backend, version, data)
+
+    def read(self) -> Dict:
+        backend = get_backend()
+        version = backend.version(self.name)
+        cached = self._cached
+        if cached is not None and cached[0] is backend and cached[1] == version:
+            return copy.deepcopy(cached[2])
+
+        version, body = backend.load(self.name)
+        data = json.loads(body) if body is not None else self._initial()
+        self._remember(backend, version, data)
+        return copy.deepcopy(data)
+
+    def update(self, fn: Callable[[Dict], T]) -> T:
+        """Атомарно змінює документ: fn отримує поточні дані, змінює їх на місці й повертає результат."""
+        backend = get_backend()
+        outcome = {}
+
+        def apply(body: Optional[str]) -> str:
+            data = json.loads(body) if body is not None else self._initial()
+            outcome["result"] = fn(data)
+            return json.dumps(data)
+
+        version, body = backend.update(self.name, apply)
+        # Кешується окрема копія: результат fn може посилатися на частини даних
+        self._remember(backend, version, json.loads(body))
+        return outcome["result"]
@@ -0,0 +1,318 @@
+import gzip, hashlib, importlib, json, os, threading, time
+
+from loguru import logger
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Режим транспорту: live — реальні запити, record — реальні запити із записом у касету,
+# replay — відтворення з касети без мережі
+TRANSPORT_MODE = os.getenv("TRANSPORT_MODE", "live")
+CASSETTE_PATH = os.getenv("TRANSPORT_CASSETTE", "cassettes/default.jsonl.gz")
+# Швидкість відтворення: instant — без затримок, recorded — із записаною латентністю
+REPLAY_SPEED = os.getenv("TRANSPORT_REPLAY_SPEED", "instant")
+
+# Параметри, які ніколи не потрапляють у касету
+SECRET_PARAMS = ("apiKey", "api_key")
+# Атрибути винятків SDK, за якими провайдери розпізнають rate limit і тип помилки
+ERROR_ATTRS = ("code", "status_code", "status")
+
+
+class CassetteMissError(KeyError):
+    """У касеті немає запису для запиту, який виконується в режимі replay."""
+
+
+class CassetteResponse:
+    """Мінімальна заміна requests.Response для записаних HTTP-відповідей."""
+
+    def __init__(self, status_code: int, text: str, url: str):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+def _redact(params: Optional[Dict]) -> Dict:
+    return {k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS}
+
+
+def _http_key(url: str, params: Optional[Dict]) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(_redact(params).items()))
+    return f"GET {url}?{query}"
+
+
+def _llm_key(provider: str, path: Tuple[str, ...], kwargs: Dict) -> str:
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return f"{provider}.{'.'.join(path)}:{digest}"
+
+
+def _dump_response(resp: Any) -> Any:
+    """Серіалізує відповідь SDK (pydantic-моделі OpenAI та google-genai) у JSON-сумісний вигляд."""
+    if hasattr(resp, "model_dump"):
+        # None-поля зберігаються: після відтворення атрибут має бути, як і в живій відповіді
+        data = resp.model_dump(mode="json")
+        # GenerateContentResponse.text — властивість, якої немає в model_dump
+        if "text" not in data and hasattr(type(resp), "text"):
+            data["text"] = resp.text
+        return data
+    return resp
+
+
+def _to_namespace(data: Any) -> Any:
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_to_namespace(v) for v in data]
+    return data
+
+
+def _dump_error(exc: Exception) -> Dict[str, Any]:
+    cls = type(exc)
+    info: Dict[str, Any] = {"module": cls.__module__, "type": cls.__qualname__, "message": str(exc)}
+    attrs = {}
+    for name in ERROR_ATTRS:
+        value = getattr(exc, name, None)
+        if isinstance(value, (str, int, float, bool)):
+            attrs[name] = value
+    if attrs:
+        info["attrs"] = attrs
+    return info
+
+
+def _rebuild_error(info: Dict[str, Any]) -> Exception:
+    """
+    Відновлює виняток того ж класу, що був записаний (наприклад openai.RateLimitError),
+    разом з атрибутами code/status_code, щоб обробники retry і rate limit поводились
+    так само, як із живим провайдером.
+    """
+    try:
+        cls = getattr(importlib.import_module(info["module"]), info["type"])
+        exc = cls.__new__(cls)
+        Exception.__init__(exc, info["message"])
+    except Exception:
+        exc = RuntimeError(f"{info['type']}: {info['message']}")
+    for name, value in info.get("attrs", {}).items():
+        try:
+            setattr(exc, name, value)
+        except AttributeError:
+            pass
+    return exc
+
+
+class Cassette:
+    """
+    Компактне сховище записів: gzip-файл із одним JSON-рядком на взаємодію.
+    Записи з однаковим ключем відтворюються в порядку запису
+    (наприклад 429, а потім 200); після вичерпання повторюється останній.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict]] = {}
+        self._cursors: Dict[str, int] = {}
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def append(self, entry: Dict) -> None:
+        with self._lock:
+            self._entries.setdefault(entry["key"], []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # gzip допускає дописування нових членів у кінець файлу
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def next(self, key: str) -> Dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(key)
+            idx = self._cursors.get(key, 0)
+            self._cursors[key] = idx + 1
+            return entries[min(idx, len(entries) - 1)]
+
+    def rewind(self) -> None:
+        with self._lock:
+            self._cursors.clear()
+
+
+class LiveTransport:
+    """Реальні запити без запису."""
+
+    def http_get(self, url: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+        import requests
+        return requests.get(url, params=params, timeout=timeout)
+
+    def call_llm(self, provider: str, path: Tuple[str, ...], method, kwargs: Dict) -> Any:
+        return method(**kwargs)
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class RecordingTransport(LiveTransport):
+    """Реальні запити із записом пар запит/відповідь, латентності та помилок у касету."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def http_get(self, url: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+        started = time.perf_counter()
+        resp = super().http_get(url, params=params, timeout=timeout)
+        self.cassette.append({
+            "kind": "http",
+            "key": _http_key(url, params),
+            "latency": round(time.perf_counter() - started, 4),
+            "status": resp.status_code,
+            "body": resp.text,
+        })
+        return resp
+
+    def call_llm(self, provider: str, path: Tuple[str, ...], method, kwargs: Dict) -> Any:
+        entry = {
+            "kind": "llm",
+            "key": _llm_key(provider, path, kwargs),
+            "request": {"model": kwargs.get("model")},
+        }
+        started = time.perf_counter()
+        try:
+            resp = method(**kwargs)
+        except Exception as e:
+            entry.update(latency=round(time.perf_counter() - started, 4), error=_dump_error(e))
+            self.cassette.append(entry)
+            raise
+        entry.update(latency=round(time.perf_counter() - started, 4), response=_dump_response(resp))
+        self.cassette.append(entry)
+        return resp
+
+
+class ReplayTransport:
+    """Детерміноване відтворення з касети без доступу до мережі."""
+
+    def __init__(self, cassette: Cassette, speed: str = "instant"):
+        self.cassette = cassette
+        self.speed = speed
+
+    def _wait(self, entry: Dict) -> None:
+        if self.speed == "recorded":
+            time.sleep(entry.get("latency", 0))
+
+    def http_get(self, url: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+        key = _http_key(url, params)
+        entry = self.cassette.next(key)
+        self._wait(entry)
+        return CassetteResponse(entry["status"], entry["body"], key[len("GET "):])
+
+    def call_llm(self, provider: str, path: Tuple[str, ...], method, kwargs: Dict) -> Any:
+        entry = self.cassette.next(_llm_key(provider, path, kwargs))
+        self._wait(entry)
+        if "error" in entry:
+            raise _rebuild_error(entry["error"])
+        return _to_namespace(entry["response"])
+
+    def sleep(self, seconds: float) -> None:
+        # backoff між спробами теж відтворюється лише в режимі recorded
+        if self.speed == "recorded":
+            time.sleep(seconds)
+
+
+class _LazyClient:
+    """Клієнт SDK, що створюється при першому справжньому виклику (у replay — ніколи)."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+
+class LLMClientProxy:
+    """
+    Обгортка над клієнтом SDK: збирає шлях атрибутів (chat.completions.create,
+    models.generate_content, ...) і передає виклик поточному транспорту.
+    """
+
+    def __init__(self, provider: str, client: _LazyClient, path: Tuple[str, ...] = ()):
+        self._provider = provider
+        self._client = client
+        self._path = path
+
+    def __getattr__(self, name: str) -> "LLMClientProxy":
+        return LLMClientProxy(self._provider, self._client, self._path + (name,))
+
+    def _method(self, **kwargs) -> Any:
+        method = self._client.get()
+        for name in self._path:
+            method = getattr(method, name)
+        return method(**kwargs)
+
+    def __call__(self, **kwargs) -> Any:
+        return get_transport().call_llm(self._provider, self._path, self._method, kwargs)
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def _build_transport():
+    if TRANSPORT_MODE == "live":
+        return LiveTransport()
+    cassette = Cassette(CASSETTE_PATH)
+    if TRANSPORT_MODE == "record":
+        logger.info(f"Транспорт: запис у {CASSETTE_PATH}")
+        return RecordingTransport(cassette)
+    if TRANSPORT_MODE == "replay":
+        logger.info(f"Транспорт: відтворення з {CASSETTE_PATH} ({len(cassette)} записів, {REPLAY_SPEED})")
+        return ReplayTransport(cassette, REPLAY_SPEED)
+    raise ValueError(f"Невідомий TRANSPORT_MODE: {TRANSPORT_MODE}")
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = _build_transport()
+    return _transport
+
+
+def set_transport(transport) -> None:
+    """Встановлює транспорт явно (бенчмарки, навантажувальні тести)."""
+    global _transport
+    _transport = transport
+
+
+def wrap_client(provider: str, factory: Callable[[], Any]) -> LLMClientProxy:
+    """Проксі клієнта SDK; factory викликається лише перед першим живим запитом."""
+    return LLMClientProxy(provider, _LazyClient(factory))
+
+
+def http_get(url: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+    return get_transport().http_get(url, params=params, timeout=timeout)
+
+
+def sleep(seconds: float) -> None:
+    """Пауза між повторними спробами; у режимі replay instant пропускається."""
+    get_transport().sleep(seconds)
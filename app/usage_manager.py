@@ -0,0 +1,258 @@
+# usage_manager.py
+import time, uuid
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple, Union
+
+from app.state_backend import Document
+
+# Constants
+# Legacy JSON file; its content is imported into the state backend on first write
+USAGE_FILE = "data/usage.json"
+
+# Per-user token budgets (prompt + completion tokens)
+DAILY_TOKEN_BUDGET = 300_000
+MONTHLY_TOKEN_BUDGET = 3_000_000
+# Share of a budget after which requests are switched to a cheaper model
+DOWNGRADE_THRESHOLD = 0.8
+
+# Cheaper fallback model for every primary model
+DOWNGRADE_MODELS = {
+    "gpt-4o-mini": "gpt-4.1-nano",
+    "gemini-2.0-flash": "gemini-2.0-flash-lite",
+}
+
+# Rough ratio used for pre-call estimation (no tokenizer needed)
+CHARS_PER_TOKEN = 4
+# Expected completion size for one ticker in the response
+COMPLETION_TOKENS_PER_TICKER = 150
+# Typical size of one ticker's data sections, for checks made before the data is fetched
+DATA_TOKENS_PER_TICKER = 12_000
+
+# Reservations of a process that died mid-call stop counting after this many seconds
+RESERVATION_TTL = 600
+# Daily entries older than this are dropped on write (covers the whole current month)
+USAGE_RETENTION_DAYS = 35
+
+_usage = Document("usage", default=lambda: {"users": {}}, legacy_path=USAGE_FILE)
+
+
+class BudgetExceededError(Exception):
+    """Raised when a request would push a user over the daily or monthly budget."""
+
+    def __init__(self, period: str, used: int, budget: int):
+        self.period = period
+        self.used = used
+        self.budget = budget
+        label = "денний" if period == "daily" else "місячний"
+        super().__init__(
+            f"Перевищено {label} ліміт токенів: використано {used} з {budget}. "
+            f"Перегляньте /usage."
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for a prompt, good enough for budget checks."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _load_usage() -> Dict:
+    """Load usage data from the state backend."""
+    data = _usage.read()
+    data.setdefault("users", {})
+    return data
+
+
+def _user_entry(usage: Dict, user_id: str) -> Dict:
+    entry = usage.setdefault("users", {}).setdefault(user_id, {"days": {}})
+    entry.setdefault("reserved", {})
+    return entry
+
+
+def _add_usage(usage: Dict, user_id: str, command: str, model: str,
+               prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    day = datetime.now().strftime('%Y-%m-%d')
+    days = _user_entry(usage, user_id)["days"]
+    entry = (
+        days.setdefault(day, {})
+        .setdefault(command, {})
+        .setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0})
+    )
+    entry["prompt_tokens"] += prompt_tokens or 0
+    entry["completion_tokens"] += completion_tokens or 0
+    entry["calls"] += 1
+
+
+def _prune(usage: Dict) -> None:
+    """Drop days past USAGE_RETENTION_DAYS and expired reservations, so the document stays small."""
+    oldest = (datetime.now() - timedelta(days=USAGE_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    expired = time.time() - RESERVATION_TTL
+    users = usage.setdefault("users", {})
+    for user_id in list(users):
+        entry = users[user_id]
+        days = entry.get("days", {})
+        for day in [d for d in days if d < oldest]:
+            del days[day]
+        reserved = entry.get("reserved", {})
+        for rid in [r for r, res in reserved.items() if res["at"] < expired]:
+            del reserved[rid]
+        if not days and not reserved:
+            del users[user_id]
+
+
+def record_usage(
+    user_id: Optional[Union[str, int]],
+    command: str,
+    model: str,
+    prompt_tokens: Optional[int],
+    completion_tokens: Optional[int]
+) -> None:
+    """
+    Add token counts of one provider call to the user's daily totals.
+    Structure: users -> user_id -> days -> YYYY-MM-DD -> command -> model -> counters.
+    """
+    user_id = str(user_id) if user_id else "anonymous"
+
+    def add(usage: Dict) -> None:
+        _add_usage(usage, user_id, command, model, prompt_tokens, completion_tokens)
+        _prune(usage)
+
+    _usage.update(add)
+
+
+def _sum_tokens(day_entry: Dict) -> int:
+    return sum(
+        counters["prompt_tokens"] + counters["completion_tokens"]
+        for models in day_entry.values()
+        for counters in models.values()
+    )
+
+
+def _totals(usage: Dict, user_id: str) -> Dict[str, int]:
+    """Tokens used today and this month, including live reservations of calls in progress."""
+    now = datetime.now()
+    day, month = now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+    entry = usage.get("users", {}).get(user_id, {})
+    days = entry.get("days", {})
+    expired = time.time() - RESERVATION_TTL
+    reserved = sum(res["tokens"] for res in entry.get("reserved", {}).values() if res["at"] >= expired)
+
+    return {
+        "daily": _sum_tokens(days.get(day, {})) + reserved,
+        "monthly": sum(_sum_tokens(e) for d, e in days.items() if d.startswith(month)) + reserved,
+    }
+
+
+def get_usage_totals(user_id: Union[str, int]) -> Dict[str, int]:
+    """Return total tokens used by the user today and in the current month."""
+    return _totals(_load_usage(), str(user_id))
+
+
+def _choose_model(totals: Dict[str, int], model: str, estimated_tokens: int) -> str:
+    downgrade = False
+    for period, budget in (("daily", DAILY_TOKEN_BUDGET), ("monthly", MONTHLY_TOKEN_BUDGET)):
+        projected = totals[period] + estimated_tokens
+        if projected > budget:
+            raise BudgetExceededError(period, totals[period], budget)
+        if projected > budget * DOWNGRADE_THRESHOLD:
+            downgrade = True
+
+    if downgrade:
+        return DOWNGRADE_MODELS.get(model, model)
+    return model
+
+
+def check_budget(
+    user_id: Optional[Union[str, int]],
+    model: str,
+    estimated_tokens: int
+) -> str:
+    """
+    Check the user's budgets and return the model to use, without reserving anything.
+    Above DOWNGRADE_THRESHOLD of a budget the cheaper model is returned,
+    above the budget itself BudgetExceededError is raised.
+    """
+    if not user_id:
+        return model
+    return _choose_model(get_usage_totals(user_id), model, estimated_tokens)
+
+
+def reserve_budget(
+    user_id: Optional[Union[str, int]],
+    model: str,
+    estimated_tokens: int
+) -> Tuple[str, Optional[str]]:
+    """
+    Check the budgets and reserve estimated_tokens in the same state transaction,
+    so concurrent calls of one user cannot all pass the check and overshoot the cap.
+    Returns (model to use, reservation id); settle_usage or release_budget ends the reservation.
+    """
+    if not user_id:
+        return model, None
+    user_id = str(user_id)
+    rid = uuid.uuid4().hex
+
+    def reserve(usage: Dict) -> str:
+        _prune(usage)
+        chosen = _choose_model(_totals(usage, user_id), model, estimated_tokens)
+        _user_entry(usage, user_id)["reserved"][rid] = {"tokens": estimated_tokens, "at": time.time()}
+        return chosen
+
+    return _usage.update(reserve), rid
+
+
+def settle_usage(
+    user_id: Optional[Union[str, int]],
+    reservation: Optional[str],
+    command: str,
+    model: str,
+    prompt_tokens: Optional[int],
+    completion_tokens: Optional[int]
+) -> None:
+    """Replace the reservation with the tokens the provider actually reported."""
+    user_id = str(user_id) if user_id else "anonymous"
+
+    def settle(usage: Dict) -> None:
+        _add_usage(usage, user_id, command, model, prompt_tokens, completion_tokens)
+        _user_entry(usage, user_id)["reserved"].pop(reservation, None)
+
+    _usage.update(settle)
+
+
+def release_budget(user_id: Optional[Union[str, int]], reservation: Optional[str]) -> None:
+    """Drop a reservation without recording usage (the call was not made or was already settled)."""
+    if not user_id or not reservation:
+        return
+    user_id = str(user_id)
+    if reservation not in _load_usage()["users"].get(user_id, {}).get("reserved", {}):
+        return
+    _usage.update(lambda usage: usage["users"].get(user_id, {}).get("reserved", {}).pop(reservation, None))
+
+
+def get_usage_report(user_id: Union[str, int]) -> Dict:
+    """
+    Return usage breakdown for the current day and month:
+    totals, budgets and per command/model counters.
+    """
+    user_id = str(user_id)
+    month = datetime.now().strftime('%Y-%m')
+    days = _load_usage()["users"].get(user_id, {}).get("days", {})
+
+    breakdown: Dict[str, Dict[str, int]] = {}
+    for d, entry in days.items():
+        if not d.startswith(month):
+            continue
+        for command, models in entry.items():
+            for model, counters in models.items():
+                row = breakdown.setdefault(f"{command} ({model})", {"tokens": 0, "calls": 0})
+                row["tokens"] += counters["prompt_tokens"] + counters["completion_tokens"]
+                row["calls"] += counters["calls"]
+
+    totals = get_usage_totals(user_id)
+    return {
+        "daily": totals["daily"],
+        "monthly": totals["monthly"],
+        "daily_budget": DAILY_TOKEN_BUDGET,
+        "monthly_budget": MONTHLY_TOKEN_BUDGET,
+        "breakdown": breakdown,
+    }
@@ -1,67 +1,38 @@
-import json, os
-
-import pandas as pd
 from datetime import datetime
 
+from app.history_store import get_store
+from app.prompt_manager import get_active_prompt, get_prompt_hash
+from app.weights_manager import get_active_weights, get_weights_hash
+
 FEATURES_PATH = 'data/features.csv'
-HISTORY_PATH = 'output/history.json'
 DATA_PATH = 'data/tickers.csv'
 
 OUTPUT_DIR = 'output/'
 
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-
-# Ініціалізація файлу історії
-if not os.path.exists(HISTORY_PATH):
-    with open(HISTORY_PATH, 'w') as f:
-        json.dump({}, f)
-
-
-def load_history():
-    with open(HISTORY_PATH, 'r') as f:
-        return json.load(f)
-
-# Збереження історії
-def save_history(history):
-    with open(HISTORY_PATH, 'w') as f:
-        json.dump(history, f, indent=4)
 
 # Перевірка, чи вже є запис для конкретної дати
 def is_already_processed(ticker):
-    history = load_history()
     today = datetime.now().strftime('%Y-%m-%d')
-    if ticker in history and today in history[ticker]:
-        return True
-    return False
+    return get_store().exists(ticker, today)
 
-# Додавання нового запису в історію (з результатом за замовчуванням None)
-def add_to_history(ticker, date_str=None):
-    history = load_history()
-    
-    if ticker not in history:
-        history[ticker] = {}
-    
-    if date_str not in history[ticker]:
-        history[ticker][date_str] = {"result": None}
-    
-    save_history(history)
-
-# Оновлення результату для запису
-def update_history(ticker, result, date_str=None):
-    history = load_history()
-    
-    if ticker in history and date_str in history[ticker]:
-        history[ticker][date_str]["result"] = result
-        save_history(history)
+# Запис результату аналізу в історію (таблиця з індексами, див. history_store)
+def update_history(ticker, result, date_str=None, outcome=None):
+    provider = model = prompt_hash = weights_hash = None
+    if outcome is not None:
+        provider, model = outcome.provider, outcome.model
+        prompt_hash, weights_hash = outcome.cache_key
+    date_str = date_str or datetime.now().strftime('%Y-%m-%d')
+    get_store().record(ticker, date_str, result, provider, model, prompt_hash, weights_hash)
 
 def load_features():
+    import pandas as pd
     df = pd.read_csv(FEATURES_PATH)
     features = dict(zip(df['parameter'], df['weight']))
     return features
 
 # Load tickers from CSV file
 def load_tickers():
+    import pandas as pd
     return pd.read_csv(DATA_PATH)['ticker'].tolist()
 
 def validate_date(date_str: str) -> datetime | None:
@@ -70,8 +41,14 @@ def validate_date(date_str: str) -> datetime | None:
     except ValueError:
         return None
     
-def update_feedback(ticker: str, date: str, feedback: str) -> None:
-    history = load_history()
-    if ticker in history and date in history[ticker]:
-        history[ticker][date]["feedback"] = feedback
-        save_history(history)
\ No newline at end of file
+def update_feedback(ticker: str, date: str, feedback: str) -> bool:
+    return get_store().set_feedback(ticker, date, feedback)
+
+def analysis_key(tickers, date_str: str, provider: str, user_id=None) -> tuple:
+    """
+    Ключ однакового аналізу: (тикер(и), дата, провайдер, хеш промпту, хеш ваг).
+    Користувачі з однаковим ефективним промптом і вагами отримують той самий ключ.
+    """
+    prompt_hash = get_prompt_hash(get_active_prompt(user_id))
+    weights_hash = get_weights_hash(get_active_weights(user_id))
+    return (tickers, date_str, provider, prompt_hash, weights_hash)
@@ -0,0 +1,446 @@
+"""
+Локальне сховище денних свічок усього ринку, наповнене з Polygon grouped daily.
+
+Одна партиція — одна торгова сесія: data/warehouse/daily/date=YYYY-MM-DD/raw.npz
+зі стовпцями tickers, t, o, h, l, c, v (відсортовано за тикером). Вихідні й
+свята визначає market_calendar, тож для них немає ні партицій, ні запитів.
+Порожня відповідь за торговий день (збій, дані ще не готові) не зберігається —
+день буде запитано знову не раніше ніж через EMPTY_RETRY_SECONDS.
+
+Партиції зберігають свічки без поправки на спліти (adjusted=false) і ніколи не
+переписуються. Поправка застосовується під час читання за переліком спліттів з
+/v3/reference/splits (data/warehouse/splits.json), який оновлюється раз на день,
+тож вікно, через яке пройшов спліт, завжди в одному масштабі цін — як у
+денних агрегатах Polygon з adjusted=true. Старі партиції bars.npz (з поправкою
+на день наповнення) не читаються і наповнюються заново.
+
+Якщо під час аналізу бракує більше ніж SYNC_INGEST_MAX_DAYS днів, запит не чекає
+на наповнення: daily_bars і load_panel кидають WarehouseMissError (денні свічки
+беруться з Polygon для одного тикера, скринер просить повторити пізніше),
+а відсутні дні довантажуються у фоні.
+
+Запуск наповнення вручну (або щоночі з cron):
+    python -m app.warehouse --from 2025-01-01 --to 2025-03-31
+    python -m app.warehouse --days 30
+"""
+import argparse, hashlib, json, os, random, threading, time
+
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+from loguru import logger
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from config import POLYGON_API_KEY
+from app import market_calendar, transport
+from app.singleflight import SingleFlight
+
+WAREHOUSE_DIR = Path("data/warehouse/daily")
+GROUPED_URL = "https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/{date}"
+SPLITS_URL = "https://api.polygon.io/v3/reference/splits"
+NY_TZ = ZoneInfo("America/New_York")
+
+MAX_RETRIES = 3
+INITIAL_BACKOFF = 1
+# Скільки партицій тримати в пам'яті
+MAX_LOADED_PARTITIONS = 512
+# Скільки відсутніх днів довантажується прямо під час запиту; більше — у фоні
+SYNC_INGEST_MAX_DAYS = 3
+# Одночасні запити grouped daily при наповненні
+INGEST_WORKERS = 4
+# Повторний запит дня, за який Polygon повернув порожній результат, — не раніше ніж через
+EMPTY_RETRY_SECONDS = 300
+# Спліти за стільки днів до останньої синхронізації запитуються знову (Polygon інколи додає їх із запізненням)
+SPLITS_OVERLAP_DAYS = 30
+SPLITS_PAGE_LIMIT = 1000
+
+_COLUMNS = ("t", "o", "h", "l", "c", "v")
+
+_ingest_flight = SingleFlight("polygon-grouped")
+_loaded: "OrderedDict[date, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+_loaded_lock = threading.Lock()
+# День → час (monotonic), до якого порожню відповідь не запитуємо повторно
+_empty_until: Dict[date, float] = {}
+_backfill_pending: Set[date] = set()
+_backfill_lock = threading.Lock()
+# Стан синхронізації спліттів: {"from", "to", "events": {тикер: [[execution_date, split_from, split_to]]}}
+_splits_state: Optional[Dict] = None
+# Тикер → [(execution_date, множник цін)] за зростанням дати
+_splits: Dict[str, List[Tuple[date, float]]] = {}
+_splits_lock = threading.Lock()
+
+
+class WarehouseMissError(LookupError):
+    """У сховищі бракує партицій за діапазон; їх довантажує фонове наповнення."""
+
+
+def partition_path(day: date) -> Path:
+    return WAREHOUSE_DIR / f"date={day.isoformat()}" / "raw.npz"
+
+
+def splits_path() -> Path:
+    return WAREHOUSE_DIR.parent / "splits.json"
+
+
+def _day_start_ms(day: date) -> int:
+    return int(datetime.combine(day, dtime(0), tzinfo=NY_TZ).timestamp() * 1000)
+
+
+def _get_json(url: str, params: Dict, what: str) -> Dict:
+    backoff = INITIAL_BACKOFF
+    for attempt in range(1, MAX_RETRIES + 1):
+        resp = transport.http_get(url, params=params, timeout=30)
+        if resp.status_code == 200:
+            return resp.json()
+        elif resp.status_code == 429:
+            sleep_time = backoff + random.uniform(0, backoff * 0.1)
+            logger.warning(f"[warehouse] Rate limit, sleeping {sleep_time:.1f}s (attempt {attempt})")
+            transport.sleep(sleep_time)
+            backoff *= 2
+        else:
+            resp.raise_for_status()
+
+    raise RuntimeError(f"Не вдалося отримати {what} за {MAX_RETRIES} спроб")
+
+
+def _request_grouped(day: date) -> List[dict]:
+    # Без поправки на спліти: партиція не залежить від дня наповнення
+    params = {"adjusted": "false", "apiKey": POLYGON_API_KEY}
+    payload = _get_json(GROUPED_URL.format(date=day.isoformat()), params, f"grouped daily за {day}")
+    return payload.get("results") or []
+
+
+def _request_splits(start: date, end: date) -> List[dict]:
+    """Усі спліти ринку з execution_date у [start, end] (з переходом за next_url)."""
+    url = SPLITS_URL
+    params = {"execution_date.gte": start.isoformat(), "execution_date.lte": end.isoformat(),
+              "limit": SPLITS_PAGE_LIMIT}
+    results = []
+    while url:
+        payload = _get_json(url, {**params, "apiKey": POLYGON_API_KEY}, f"спліти за {start}..{end}")
+        results.extend(payload.get("results") or [])
+        # next_url вже містить курсор і параметри запиту, крім ключа
+        url, params = payload.get("next_url"), {}
+    return results
+
+
+def _write_partition(day: date, results: List[dict]) -> None:
+    rows = sorted((r for r in results if r.get("T")), key=lambda r: r["T"])
+    tickers = np.array([r["T"] for r in rows], dtype=str)
+    values = np.array([[r.get(k, np.nan) for k in _COLUMNS] for r in rows], dtype=np.float64).reshape(-1, len(_COLUMNS))
+    # Як і в денних агрегатах, свічка дня має мітку півночі за Нью-Йорком
+    values[:, 0] = _day_start_ms(day)
+
+    path = partition_path(day)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, tickers=tickers, **{k: values[:, i] for i, k in enumerate(_COLUMNS)})
+    os.replace(tmp, path)
+    # Партиція старого формату (з поправкою на день наповнення) більше не потрібна
+    (path.parent / "bars.npz").unlink(missing_ok=True)
+
+
+def ingest_day(day: date, force: bool = False) -> bool:
+    """
+    Завантажує партицію торгового дня, якщо її ще немає. Повертає True, якщо був запит до API.
+    Поточний і майбутні дні не зберігаються — вони ще не завершені.
+    """
+    if day >= datetime.now(NY_TZ).date() or not market_calendar.is_session(day):
+        return False
+    if partition_path(day).exists() and not force:
+        return False
+    with _loaded_lock:
+        if not force and _empty_until.get(day, 0) > time.monotonic():
+            return False
+
+    def ingest():
+        results = _request_grouped(day)
+        if not results:
+            logger.warning(f"[warehouse] {day}: порожня відповідь grouped daily, партиція не збережена")
+            with _loaded_lock:
+                _empty_until[day] = time.monotonic() + EMPTY_RETRY_SECONDS
+            return True
+        _write_partition(day, results)
+        logger.debug(f"[warehouse] {day}: {len(results)} тикерів")
+        with _loaded_lock:
+            _loaded.pop(day, None)
+            _empty_until.pop(day, None)
+        return True
+
+    return _ingest_flight.do(day, ingest)
+
+
+def ingest_days(days: Iterable[date], force: bool = False) -> int:
+    """Наповнює партиції днів (до INGEST_WORKERS запитів одночасно); повертає кількість запитів до API."""
+    days = list(days)
+    if len(days) <= 1:
+        return sum(ingest_day(day, force=force) for day in days)
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="warehouse") as pool:
+        return sum(pool.map(lambda day: ingest_day(day, force=force), days))
+
+
+def ingest_range(start: date, end: date, force: bool = False) -> int:
+    """Наповнює всі відсутні партиції торгових днів [start, end]; повертає кількість запитів до API."""
+    return ingest_days(market_calendar.sessions_between(start, end), force=force)
+
+
+def missing_days(start: date, end: date) -> List[date]:
+    """Завершені торгові дні [start, end] без партиції."""
+    last = min(end, datetime.now(NY_TZ).date() - timedelta(days=1))
+    return [day for day in market_calendar.sessions_between(start, last) if not partition_path(day).exists()]
+
+
+def _backfill(days: List[date]) -> None:
+    try:
+        requested = ingest_days(days)
+        logger.info(f"[warehouse] Фонове наповнення: {len(days)} днів, запитів до API {requested}")
+    except Exception as e:
+        logger.warning(f"[warehouse] Фонове наповнення не вдалося: {e}")
+    finally:
+        with _backfill_lock:
+            _backfill_pending.difference_update(days)
+
+
+def backfill_async(days: Iterable[date]) -> None:
+    """Довантажує дні в окремому потоці; дні, що вже наповнюються, пропускаються."""
+    with _backfill_lock:
+        new = sorted(set(days) - _backfill_pending)
+        _backfill_pending.update(new)
+    if new:
+        threading.Thread(target=_backfill, args=(new,), name="warehouse-backfill", daemon=True).start()
+
+
+def _load_partition(day: date) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    with _loaded_lock:
+        if day in _loaded:
+            _loaded.move_to_end(day)
+            return _loaded[day]
+
+    path = partition_path(day)
+    if not path.exists():
+        return None
+    with np.load(path) as npz:
+        partition = (npz["tickers"], np.column_stack([npz[k] for k in _COLUMNS]).reshape(-1, len(_COLUMNS)))
+    if not len(partition[0]):
+        # Порожні партиції зберігались раніше для вихідних і невдалих запитів;
+        # для торгового дня файл видаляється, щоб день було запитано знову
+        if market_calendar.is_session(day):
+            path.unlink(missing_ok=True)
+        return None
+
+    with _loaded_lock:
+        _loaded[day] = partition
+        while len(_loaded) > MAX_LOADED_PARTITIONS:
+            _loaded.popitem(last=False)
+    return partition
+
+
+def _index_splits(events: Dict[str, List[list]]) -> Dict[str, List[Tuple[date, float]]]:
+    index = {}
+    for ticker, rows in events.items():
+        valid = [(date.fromisoformat(day), split_from / split_to)
+                 for day, split_from, split_to in rows if split_from > 0 and split_to > 0]
+        if valid:
+            index[ticker] = sorted(valid)
+    return index
+
+
+def _load_splits_state() -> Dict:
+    global _splits_state, _splits
+    if _splits_state is None:
+        path = splits_path()
+        state = {"from": None, "to": None, "events": {}}
+        if path.exists():
+            with open(path) as f:
+                state = json.load(f)
+        _splits_state, _splits = state, _index_splits(state["events"])
+    return _splits_state
+
+
+def _splits_cover(state: Dict, start: date, today: date) -> bool:
+    return (state["from"] is not None and date.fromisoformat(state["from"]) <= start
+            and date.fromisoformat(state["to"]) >= today)
+
+
+def sync_splits(start: date) -> None:
+    """
+    Оновлює перелік спліттів так, щоб він покривав [start, сьогодні]. Запит до API —
+    лише для ще не покритих днів (раз на день і при читанні старішої історії) плюс
+    SPLITS_OVERLAP_DAYS днів запасу.
+    """
+    global _splits_state, _splits
+    today = datetime.now(NY_TZ).date()
+    with _splits_lock:
+        state = _load_splits_state()
+        if _splits_cover(state, start, today):
+            return
+
+        ranges = []
+        if state["from"] is None:
+            ranges.append((start, today))
+        else:
+            covered_from, covered_to = date.fromisoformat(state["from"]), date.fromisoformat(state["to"])
+            if start < covered_from:
+                ranges.append((start, covered_from - timedelta(days=1)))
+            if covered_to < today:
+                ranges.append((covered_to - timedelta(days=SPLITS_OVERLAP_DAYS), today))
+
+        events = {ticker: {row[0]: row for row in rows} for ticker, rows in state["events"].items()}
+        for first, last in ranges:
+            for split in _request_splits(first, last):
+                ticker, day = split.get("ticker"), split.get("execution_date")
+                if ticker and day and split.get("split_from") and split.get("split_to"):
+                    events.setdefault(ticker, {})[day] = [day, split["split_from"], split["split_to"]]
+
+        covered_from = min([start] + ([date.fromisoformat(state["from"])] if state["from"] else []))
+        new_state = {"from": covered_from.isoformat(), "to": today.isoformat(),
+                     "events": {ticker: sorted(rows.values()) for ticker, rows in events.items()}}
+        path = splits_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(new_state, f)
+        os.replace(tmp, path)
+        _splits_state, _splits = new_state, _index_splits(new_state["events"])
+        logger.debug(f"[warehouse] Спліти {covered_from}..{today}: {sum(map(len, _splits.values()))}")
+
+
+def _split_factors(ticker: str, days: List[date]) -> Optional[np.ndarray]:
+    """Множник цін для кожного дня — добуток коефіцієнтів спліттів після нього; None, якщо спліттів немає."""
+    events = [(execution, ratio) for execution, ratio in _splits.get(ticker, ()) if execution > days[0]]
+    if not events:
+        return None
+    ordinals = np.array([day.toordinal() for day in days])
+    factors = np.ones(len(days))
+    for execution, ratio in events:
+        factors[ordinals < execution.toordinal()] *= ratio
+    return factors
+
+
+def _apply_splits(values: np.ndarray, factors: np.ndarray) -> None:
+    """Переводить свічки (n, 6) у масштаб після спліттів: ціни множаться на factors, об'єм ділиться."""
+    values[:, 1:5] *= factors[:, None]
+    values[:, 5] /= factors
+
+
+def source_version(ticker: str, start: date, end: date) -> str:
+    """
+    Відбиток даних, з яких daily_bars збирає свічки тикера за [start, end]: час зміни
+    й розмір кожної партиції та спліти тикера після start. Змінюється, коли день
+    наповнено (чи перезаписано) або став відомим новий спліт. Без запитів до API.
+    """
+    with _splits_lock:
+        _load_splits_state()
+    parts = []
+    for day in market_calendar.sessions_between(start, end):
+        try:
+            stat = partition_path(day).stat()
+            parts.append(f"{day}:{stat.st_mtime_ns}:{stat.st_size}")
+        except FileNotFoundError:
+            parts.append(f"{day}:-")
+    parts += [f"{execution}:{ratio!r}" for execution, ratio in _splits.get(ticker, ()) if execution > start]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def daily_bars(ticker: str, start: date, end: date, ingest: bool = True) -> np.ndarray:
+    """
+    Денні свічки тикера за [start, end] у форматі (n, 6): t, o, h, l, c, v.
+    Ціни й об'єми з поправкою на всі відомі спліти (як adjusted=true у Polygon).
+    Відсутні завершені дні спершу довантажуються (якщо ingest=True); якщо їх більше
+    за SYNC_INGEST_MAX_DAYS — WarehouseMissError, а дні довантажуються у фоні.
+    WarehouseMissError і тоді, коли перелік спліттів не вдалося оновити.
+    З ingest=False запитів до API немає: поправка — за вже збереженим переліком.
+    """
+    if ingest:
+        try:
+            sync_splits(start)
+        except Exception as e:
+            raise WarehouseMissError(f"Не вдалося оновити спліти: {e}") from e
+        missing = missing_days(start, end)
+        if len(missing) > SYNC_INGEST_MAX_DAYS:
+            backfill_async(missing)
+            raise WarehouseMissError(f"У сховищі бракує {len(missing)} днів за {start}..{end}")
+        ingest_days(missing)
+    else:
+        with _splits_lock:
+            _load_splits_state()
+
+    rows, days = [], []
+    for day in market_calendar.sessions_between(start, end):
+        partition = _load_partition(day)
+        if partition is not None:
+            tickers, values = partition
+            i = np.searchsorted(tickers, ticker)
+            if i < len(tickers) and tickers[i] == ticker:
+                rows.append(values[i])
+                days.append(day)
+
+    if not rows:
+        return np.empty((0, len(_COLUMNS)), dtype=np.float64)
+    bars = np.vstack(rows)
+    factors = _split_factors(ticker, days)
+    if factors is not None:
+        _apply_splits(bars, factors)
+    return bars
+
+
+def load_panel(end: date, sessions: int, ingest: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ринкова панель за останні `sessions` торгових днів до end включно.
+    Повертає (tickers, values) де values має форму (sessions, len(tickers), 6);
+    відсутні у дні тикери заповнені NaN. Дні — від старішого до новішого.
+    Ціни й об'єми з поправкою на спліти, як у daily_bars; якщо перелік спліттів
+    не вдалося оновити, використовується збережений. Відсутні дні — як у daily_bars:
+    до SYNC_INGEST_MAX_DAYS довантажуються одразу, інакше WarehouseMissError і фонове наповнення.
+    """
+    days = market_calendar.sessions_back(end, sessions)
+    if ingest:
+        try:
+            sync_splits(days[0])
+        except Exception as e:
+            logger.warning(f"[warehouse] Не вдалося оновити спліти, поправка за збереженим переліком: {e}")
+        missing = missing_days(days[0], days[-1])
+        if len(missing) > SYNC_INGEST_MAX_DAYS:
+            backfill_async(missing)
+            raise WarehouseMissError(f"У сховищі бракує {len(missing)} днів за {days[0]}..{days[-1]}")
+        ingest_days(missing)
+    with _splits_lock:
+        _load_splits_state()
+    loaded = [(day, p) for day, p in zip(days, map(_load_partition, days)) if p is not None]
+
+    if not loaded:
+        return np.empty(0, dtype=str), np.empty((0, 0, len(_COLUMNS)))
+    tickers = np.unique(np.concatenate([p[0] for _, p in loaded]))
+    values = np.full((len(loaded), len(tickers), len(_COLUMNS)), np.nan)
+    for i, (_, (day_tickers, day_values)) in enumerate(loaded):
+        values[i, np.searchsorted(tickers, day_tickers)] = day_values
+
+    loaded_days = [day for day, _ in loaded]
+    for ticker in _splits:
+        j = np.searchsorted(tickers, ticker)
+        if j < len(tickers) and tickers[j] == ticker:
+            factors = _split_factors(ticker, loaded_days)
+            if factors is not None:
+                _apply_splits(values[:, j], factors)
+    return tickers, values
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Наповнення локального сховища денних свічок з Polygon grouped daily")
+    parser.add_argument("--from", dest="start", help="перший день YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="останній день YYYY-MM-DD (типово вчора)")
+    parser.add_argument("--days", type=int, default=30, help="скільки днів назад, якщо --from не задано")
+    parser.add_argument("--force", action="store_true", help="перезаписати наявні партиції")
+    args = parser.parse_args(argv)
+
+    end = date.fromisoformat(args.end) if args.end else datetime.now(NY_TZ).date() - timedelta(days=1)
+    start = date.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+    requested = ingest_range(start, end, force=args.force)
+    logger.info(f"[warehouse] {start}..{end}: запитів до API {requested}")
+
+
+if __name__ == "__main__":
+    main()
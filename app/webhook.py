@@ -0,0 +1,355 @@
+"""
+Режим webhook: кілька процесів-воркерів за локальним зворотним проксі.
+
+    BOT_MODE=webhook WEBHOOK_URL=https://bot.example.com/telegram python main.py
+
+Супервізор запускає WEBHOOK_WORKERS воркерів (кожен — Application без Updater
+зі своїм HTTP-сервером на asyncio), реєструє webhook у Telegram і приймає
+оновлення на WEBHOOK_LISTEN:WEBHOOK_PORT. Проксі перевіряє секретний токен і
+пересилає оновлення воркеру за хешем чату, тож усі оновлення одного чату
+обробляє той самий процес (черга планувальника, об'єднання запитів).
+Впалі воркери перезапускаються.
+"""
+import asyncio, json, os, secrets, signal, subprocess, time, zlib
+
+from collections import deque
+from loguru import logger
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+# Без явного секрету супервізор генерує новий при кожному старті
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Воркери слухають послідовні порти, починаючи з цього
+WORKER_BASE_PORT = int(os.getenv("WEBHOOK_WORKER_BASE_PORT", str(WEBHOOK_PORT + 1)))
+WORKER_HOST = "127.0.0.1"
+# Скільки одночасних з'єднань Telegram відкриває до webhook
+MAX_CONNECTIONS = 40
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_BYTES = 1 << 20
+WORKER_START_TIMEOUT = 30
+WORKER_RESTART_DELAY = 1
+UPSTREAM_POOL_SIZE = 16
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 502: "Bad Gateway"}
+
+# (метод, шлях, заголовки, тіло) → (статус, тіло відповіді)
+Handler = Callable[[str, str, Dict[str, str], bytes], Awaitable[Tuple[int, bytes]]]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int):
+        self.status = status
+        super().__init__(REASONS.get(status, str(status)))
+
+
+# --- мінімальний HTTP/1.1 поверх asyncio ---
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, str]]]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413)
+    return await reader.readexactly(length) if length else b""
+
+
+def _encode(start_line: str, headers: Dict[str, str], body: bytes) -> bytes:
+    headers = dict(headers, **{"Content-Length": str(len(body))})
+    head = start_line + "\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+    return head.encode("latin-1") + body
+
+
+async def serve_http(host: str, port: int, handler: Handler) -> asyncio.AbstractServer:
+    """HTTP-сервер із keep-alive; кожен запит передається handler."""
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await _read_head(reader)
+                if head is None:
+                    break
+                request_line, headers = head
+                method, path = (request_line.split(" ") + ["", ""])[:2]
+                try:
+                    body = await _read_body(reader, headers)
+                    status, payload = await handler(method, path, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, b""
+                except Exception as e:
+                    logger.error(f"[webhook] Помилка обробки {method} {path}: {e}")
+                    status, payload = 502, b""
+                writer.write(_encode(f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                                     {"Content-Type": "application/json"}, payload))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Зупинка сервера з відкритими keep-alive з'єднаннями
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, host, port)
+
+
+class UpstreamPool:
+    """Пул keep-alive з'єднань до одного воркера."""
+
+    def __init__(self, host: str, port: int, size: int = UPSTREAM_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.size = size
+        self._idle: Deque[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = deque()
+
+    async def _exchange(self, conn, data: bytes) -> Tuple[int, bytes]:
+        reader, writer = conn
+        writer.write(data)
+        await writer.drain()
+        head = await _read_head(reader)
+        if head is None:
+            raise ConnectionError("upstream closed connection")
+        status_line, headers = head
+        return int(status_line.split(" ")[1]), await _read_body(reader, headers)
+
+    async def request(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        data = _encode(f"{method} {path} HTTP/1.1", dict(headers, Host=f"{self.host}:{self.port}"), body)
+        # Збережене з'єднання могло закритися на боці воркера — тоді одна спроба з новим
+        for reused in (True, False):
+            if reused and not self._idle:
+                continue
+            conn = self._idle.popleft() if reused else await asyncio.open_connection(self.host, self.port)
+            try:
+                result = await self._exchange(conn, data)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn[1].close()
+                if not reused:
+                    raise
+                continue
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+            return result
+        raise ConnectionError("upstream unavailable")
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.popleft()[1].close()
+
+
+def route_key(update: Dict) -> int:
+    """Ключ маршрутизації: чат оновлення (або автор, якщо чату немає)."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post", "business_message"):
+        if isinstance(update.get(field), dict) and "chat" in update[field]:
+            return update[field]["chat"]["id"]
+    query = update.get("callback_query")
+    if isinstance(query, dict):
+        message = query.get("message") or {}
+        return message.get("chat", {}).get("id") or query.get("from", {}).get("id", 0)
+    for value in update.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"].get("id", 0)
+    return update.get("update_id", 0)
+
+
+class WebhookProxy:
+    """Приймає оновлення від Telegram і пересилає їх воркерам із прив'язкою за чатом."""
+
+    def __init__(self, upstreams: List[Tuple[str, int]], path: str = WEBHOOK_PATH, secret: str = ""):
+        self.path = path
+        self.secret = secret
+        self.pools = [UpstreamPool(host, port) for host, port in upstreams]
+        self.forwarded = [0] * len(self.pools)
+
+    def route(self, update: Dict) -> int:
+        return zlib.crc32(str(route_key(update)).encode()) % len(self.pools)
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        if path != self.path:
+            raise HTTPError(404)
+        if method != "POST":
+            raise HTTPError(405)
+        if self.secret and not secrets.compare_digest(headers.get(SECRET_HEADER, ""), self.secret):
+            raise HTTPError(403)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            raise HTTPError(400)
+
+        index = self.route(update)
+        forward_headers = {"Content-Type": "application/json", SECRET_HEADER: self.secret}
+        try:
+            status, payload = await self.pools[index].request("POST", self.path, forward_headers, body)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            # Telegram повторить доставку після не-2xx відповіді
+            logger.warning(f"[webhook] Воркер {index} недоступний: {e}")
+            raise HTTPError(502)
+        self.forwarded[index] += 1
+        return status, payload
+
+    def close(self) -> None:
+        for pool in self.pools:
+            pool.close()
+
+
+# --- воркер ---
+
+async def serve_worker(application, host: str, port: int, path: str = WEBHOOK_PATH, secret: str = "",
+                       stop: Optional[asyncio.Event] = None) -> None:
+    """Обробляє оновлення з HTTP тими самими обробниками, що й polling; працює до stop."""
+    from telegram import Update
+
+    async def handle(method: str, request_path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        if request_path != path:
+            raise HTTPError(404)
+        if method != "POST":
+            raise HTTPError(405)
+        if secret and not secrets.compare_digest(headers.get(SECRET_HEADER, ""), secret):
+            raise HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except ValueError:
+            raise HTTPError(400)
+        # Відповідаємо одразу: обробка йде у фоні, як при polling
+        await application.update_queue.put(update)
+        return 200, b"{}"
+
+    stop = stop or asyncio.Event()
+    async with application:
+        await application.start()
+        server = await serve_http(host, port, handle)
+        logger.info(f"[webhook] Воркер {os.getpid()} слухає {host}:{port}")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            await application.stop()
+
+
+def _install_stop_signals(stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+
+def run_worker(application, port: Optional[int] = None) -> None:
+    """Точка входу процесу-воркера; порт і секрет передає супервізор через оточення."""
+    port = port or int(os.environ["WEBHOOK_WORKER_PORT"])
+
+    async def main():
+        stop = asyncio.Event()
+        _install_stop_signals(stop)
+        await serve_worker(application, WORKER_HOST, port, WEBHOOK_PATH, os.getenv("WEBHOOK_SECRET", ""), stop)
+
+    asyncio.run(main())
+
+
+# --- супервізор ---
+
+def spawn_worker(command: List[str], port: int, secret: str, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    worker_env = dict(env or os.environ, WEBHOOK_WORKER_PORT=str(port), WEBHOOK_SECRET=secret)
+    return subprocess.Popen(command, env=worker_env)
+
+
+async def wait_listening(host: str, port: int, timeout: float = WORKER_START_TIMEOUT) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Воркер на порту {port} не запустився за {timeout}s")
+            await asyncio.sleep(0.1)
+
+
+async def _set_webhook(token: str, url: str, secret: str, base_url: Optional[str]) -> None:
+    from telegram import Bot, Update
+
+    kwargs = {"base_url": base_url} if base_url else {}
+    async with Bot(token, **kwargs) as bot:
+        await bot.set_webhook(url, secret_token=secret, allowed_updates=Update.ALL_TYPES,
+                              max_connections=MAX_CONNECTIONS)
+    logger.info(f"[webhook] Webhook зареєстровано: {url}")
+
+
+async def supervise(command: List[str], workers: int = WEBHOOK_WORKERS, listen: str = WEBHOOK_LISTEN,
+                    port: int = WEBHOOK_PORT, secret: str = "", webhook_url: str = WEBHOOK_URL,
+                    token: Optional[str] = None, base_url: Optional[str] = None,
+                    env: Optional[Dict[str, str]] = None, stop: Optional[asyncio.Event] = None,
+                    worker_base_port: Optional[int] = None) -> None:
+    """Запускає воркерів і проксі; webhook_url реєструється в Telegram, якщо заданий."""
+    secret = secret or secrets.token_urlsafe(32)
+    base_port = worker_base_port or port + 1
+    ports = [base_port + i for i in range(workers)]
+    procs = [spawn_worker(command, p, secret, env) for p in ports]
+    stop = stop or asyncio.Event()
+    proxy = WebhookProxy([(WORKER_HOST, p) for p in ports], WEBHOOK_PATH, secret)
+    server = None
+    try:
+        await asyncio.gather(*(wait_listening(WORKER_HOST, p) for p in ports))
+        server = await serve_http(listen, port, proxy.handle)
+        logger.info(f"[webhook] Проксі на {listen}:{port}, воркерів: {workers}")
+        if webhook_url and token:
+            await _set_webhook(token, webhook_url, secret, base_url)
+
+        while not stop.is_set():
+            for i, proc in enumerate(procs):
+                if proc.poll() is not None:
+                    logger.warning(f"[webhook] Воркер на порту {ports[i]} завершився ({proc.returncode}), перезапуск")
+                    await asyncio.sleep(WORKER_RESTART_DELAY)
+                    procs[i] = spawn_worker(command, ports[i], secret, env)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        proxy.close()
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def run_supervisor(command: List[str], token: Optional[str] = None, base_url: Optional[str] = None) -> None:
+    if not WEBHOOK_URL:
+        logger.warning("[webhook] WEBHOOK_URL не задано — webhook не буде зареєстровано в Telegram")
+
+    async def main():
+        stop = asyncio.Event()
+        _install_stop_signals(stop)
+        await supervise(command, secret=WEBHOOK_SECRET, token=token, base_url=base_url, stop=stop,
+                        worker_base_port=WORKER_BASE_PORT)
+
+    asyncio.run(main())
@@ -1,58 +1,43 @@
 # weights_manager.py
+import hashlib
 import json
 import os
-import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Optional, Union
-from pathlib import Path
+
+from app.state_backend import Document
 
 # Constants
+# Legacy JSON file; its content is imported into the state backend on first write
 WEIGHTS_FILE = "data/weights.json"
 DEFAULT_WEIGHTS_PATH = 'data/features.csv'
 
-# Ensure data directory exists
-Path("data").mkdir(exist_ok=True)
-
 def _load_default_weights() -> Dict[str, float]:
     """Load default weights from CSV file or return empty dict if not found."""
     if not os.path.exists(DEFAULT_WEIGHTS_PATH):
         return {}
     
     try:
+        import pandas as pd
         df = pd.read_csv(DEFAULT_WEIGHTS_PATH)
         return dict(zip(df['parameter'], df['weight']))
     except Exception:
         return {}
 
+_weights = Document(
+    "weights",
+    default=lambda: {"default": _load_default_weights(), "users": {}},
+    legacy_path=WEIGHTS_FILE,
+)
+
 def _load_weights() -> Dict:
-    """Load weights from JSON file or return initial structure if file doesn't exist."""
-    default_weights = _load_default_weights()
-    
-    if not os.path.exists(WEIGHTS_FILE):
-        return {
-            "default": default_weights,
-            "users": {}
-        }
-    
-    try:
-        with open(WEIGHTS_FILE, 'r') as f:
-            data = json.load(f)
-            # Ensure backward compatibility
-            if "users" not in data:
-                data["users"] = {}
-            if "default" not in data:
-                data["default"] = default_weights
-            return data
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {
-            "default": default_weights,
-            "users": {}
-        }
-
-def _save_weights(weights: Dict) -> None:
-    """Save weights to JSON file."""
-    with open(WEIGHTS_FILE, 'w') as f:
-        json.dump(weights, f, indent=4)
+    """Load weights from the state backend."""
+    data = _weights.read()
+    # Ensure backward compatibility
+    data.setdefault("users", {})
+    if "default" not in data:
+        data["default"] = _load_default_weights()
+    return data
 
 def get_default_weights() -> Dict[str, float]:
     """Return the default weights."""
@@ -90,22 +75,18 @@ def save_weights(user_id: Union[str, int], weights: Dict[str, float]) -> None:
     Maintains history of all previous weight configurations.
     """
     user_id = str(user_id)
-    weights_data = _load_weights()
-    
-    if "users" not in weights_data:
-        weights_data["users"] = {}
-    
-    if user_id not in weights_data["users"]:
-        weights_data["users"][user_id] = {"history": []}
-    
+
     # Add new weights entry to history
     new_entry = {
         "weights": weights,
         "timestamp": datetime.now().isoformat()
     }
-    
-    weights_data["users"][user_id]["history"].append(new_entry)
-    _save_weights(weights_data)
+
+    def add(weights_data: Dict) -> None:
+        users = weights_data.setdefault("users", {})
+        users.setdefault(user_id, {"history": []})["history"].append(new_entry)
+
+    _weights.update(add)
 
 def get_active_weights(user_id: Optional[Union[str, int]] = None) -> Dict[str, float]:
     """
@@ -118,19 +99,24 @@ def get_active_weights(user_id: Optional[Union[str, int]] = None) -> Dict[str, f
             return custom_weights
     return get_default_weights()
 
+def get_weights_hash(weights: Dict[str, float]) -> str:
+    """Return a short stable hash of the weights (used in cache and coalescing keys)."""
+    payload = json.dumps(weights, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
 def reset_user_weights(user_id: Union[str, int]) -> bool:
     """
     Reset a user's weights history (delete all custom weights).
     Returns True if reset was successful, False if user had no history.
     """
     user_id = str(user_id)
-    weights_data = _load_weights()
-    
-    if user_id in weights_data["users"]:
-        del weights_data["users"][user_id]
-        _save_weights(weights_data)
-        return True
-    return False
+    if user_id not in _load_weights()["users"]:
+        return False
+
+    def reset(weights_data: Dict) -> bool:
+        return weights_data.setdefault("users", {}).pop(user_id, None) is not None
+
+    return _weights.update(reset)
 
 def format_weights_for_prompt(weights: Dict[str, float]) -> str:
     """
@@ -0,0 +1,232 @@
+"""
+Навантажувальний тест обробників Telegram-команд.
+
+Від імені N одночасних користувачів кладе оновлення в update_queue справжнього
+Application з main.build_application — той самий шлях, яким їх обробляє бот у
+режимі polling (разом з обмеженням concurrent_updates). Polygon і LLM —
+локальні замінники, відповіді бота приймає замінник Telegram Bot API.
+Звітує p50/p95/p99 латентності (до завершення обробки оновлення), пропускну
+здатність і час блокування event loop.
+
+    python -m bench.load_test --users 20 --requests 200 --mix analyze_gpt=5,history=2,setweights=1
+"""
+import argparse, asyncio, math, os, random, shutil, sys, tempfile, time
+
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Set
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STUB_TOKEN = "123456:stub-token"
+TICKERS = ["AAPL", "MSFT", "TSLA", "NVDA", "AMD", "META", "AMZN", "GOOG", "NFLX", "INTC"]
+
+DEFAULT_MIX = "analyze_gpt=5,analyze_gem=2,analyze_all_gem=1,history=2,setweights=1,myweights=1"
+
+
+def command_args(command: str, rng: random.Random) -> List[str]:
+    """Аргументи, які передав би користувач для відповідної команди."""
+    if command in ("analyze_gpt", "analyze_gem"):
+        return [rng.choice(TICKERS)]
+    if command in ("analyze_all_gpt", "analyze_all_gem"):
+        return rng.sample(TICKERS, 3)
+    if command == "setweights":
+        return [f"trend_following:{rng.random():.2f}", f"volume_spikes:{rng.random():.2f}"]
+    if command == "set_prompt":
+        return ["Rank", "tickers", "by", "breakout", "probability"]
+    return []
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile методом найближчого рангу."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LoopMonitor:
+    """Вимірює затримку event loop: наскільки пізніше за план прокидається asyncio.sleep."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.blocked = 0.0
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            if lag > 0.001:
+                self.blocked += lag
+                self.max_stall = max(self.max_stall, lag)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def run_load(app, telegram, mix: Dict[str, int], users: int, requests: int, seed: int) -> Dict:
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = [rng.choices(names, weights)[0] for _ in range(requests)]
+    queue: asyncio.Queue = asyncio.Queue()
+    for command in plan:
+        queue.put_nowait(command)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    pending: Dict[int, asyncio.Future] = {}
+    failed: Set[int] = set()
+
+    async def finished(update: Update, context) -> None:
+        # Остання група обробників: виконується і після помилки в команді
+        future = pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def on_error(update, context) -> None:
+        if isinstance(update, Update):
+            failed.add(update.update_id)
+
+    app.add_handler(TypeHandler(Update, finished), group=1)
+    app.add_error_handler(on_error)
+    await app.initialize()
+    await app.start()
+
+    async def virtual_user(user_id: int) -> None:
+        user_rng = random.Random(seed + user_id)
+        loop = asyncio.get_running_loop()
+        while not queue.empty():
+            command = queue.get_nowait()
+            text = " ".join([f"/{command}"] + command_args(command, user_rng))
+            update = Update.de_json(telegram.make_update(user_id, text), app.bot)
+            done = pending[update.update_id] = loop.create_future()
+            started = time.perf_counter()
+            await app.update_queue.put(update)
+            await done
+            if update.update_id in failed:
+                errors[command] += 1
+            latencies[command].append(time.perf_counter() - started)
+
+    monitor = LoopMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(100_000 + i) for i in range(users)))
+    wall = time.perf_counter() - started
+    await monitor.stop()
+    await app.stop()
+    await app.shutdown()
+
+    return {
+        "wall": wall,
+        "latencies": latencies,
+        "errors": errors,
+        "loop_blocked": monitor.blocked,
+        "loop_max_stall": monitor.max_stall,
+    }
+
+
+def format_report(result: Dict, transport) -> str:
+    all_latencies = [v for values in result["latencies"].values() for v in values]
+    total = len(all_latencies)
+    lines = [
+        f"Запитів: {total}, час: {result['wall']:.2f}s, пропускна здатність: {total / result['wall']:.2f} req/s",
+        f"Блокування event loop: {result['loop_blocked']:.2f}s "
+        f"({result['loop_blocked'] / result['wall']:.0%} часу), макс. пауза {result['loop_max_stall'] * 1000:.0f}ms",
+        "",
+        f"{'команда':<18}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}",
+    ]
+    rows = sorted(result["latencies"].items()) + [("*", all_latencies)]
+    for command, values in rows:
+        errors = sum(result["errors"].values()) if command == "*" else result["errors"].get(command, 0)
+        lines.append(
+            f"{command:<18}{len(values):>6}"
+            f"{percentile(values, 50) * 1000:>9.0f}ms{percentile(values, 95) * 1000:>8.0f}ms"
+            f"{percentile(values, 99) * 1000:>8.0f}ms{errors:>8}"
+        )
+    lines.append("")
+    lines.append("Виклики замінників: " + ", ".join(f"{k}={v}" for k, v in sorted(transport.calls.items())))
+    return "\n".join(lines)
+
+
+def prepare_workdir() -> str:
+    """Копія data/ у тимчасовій теці, щоб тест не змінював справжні промпти, ваги та історію."""
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    shutil.copytree(REPO_ROOT / "data", Path(workdir) / "data")
+    return workdir
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=10, help="кількість одночасних користувачів")
+    ap.add_argument("--requests", type=int, default=100, help="загальна кількість команд")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="команда=вага через кому")
+    ap.add_argument("--polygon-latency", type=float, default=0.05, help="латентність Polygon, с")
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="латентність LLM, с")
+    ap.add_argument("--telegram-latency", type=float, default=0.03, help="латентність Telegram, с")
+    ap.add_argument("--telegram-port", type=int, default=18082, help="порт замінника Telegram")
+    ap.add_argument("--rate-limit-share", type=float, default=0.0, help="частка відповідей Polygon 429")
+    ap.add_argument("--seed", type=int, default=42)
+    opts = ap.parse_args()
+
+    sys.path.insert(0, str(REPO_ROOT))
+    os.chdir(prepare_workdir())
+
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from app import transport, usage_manager
+    from bench.stubs import StubTransport
+
+    stub = StubTransport(opts.polygon_latency, opts.llm_latency,
+                         rate_limit_share=opts.rate_limit_share, seed=opts.seed)
+    transport.set_transport(stub)
+    # Бюджети токенів не повинні обмежувати синтетичне навантаження
+    usage_manager.DAILY_TOKEN_BUDGET = usage_manager.MONTHLY_TOKEN_BUDGET = 10**12
+
+    import main as bot
+
+    mix = parse_mix(opts.mix)
+    unknown = set(mix) - set(bot.COMMAND_HANDLERS)
+    if unknown:
+        ap.error(f"невідомі команди: {', '.join(sorted(unknown))}")
+
+    async def run() -> Dict:
+        from bench.telegram_stub import TelegramStub
+
+        telegram = TelegramStub(opts.telegram_latency)
+        base_url = await telegram.start(port=opts.telegram_port)
+        try:
+            app = bot.build_application(STUB_TOKEN, base_url)
+            return await run_load(app, telegram, mix, opts.users, opts.requests, opts.seed)
+        finally:
+            await telegram.close()
+
+    print(format_report(asyncio.run(run()), stub))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Локальний сервер із протоколом RESP (підмножина Redis) для тестів сховища стану:
+GET, SET, MGET, DEL, INCR, WATCH/UNWATCH, MULTI/EXEC/DISCARD, SELECT, AUTH, PING, FLUSHALL.
+
+    python -m bench.resp_stub --port 6390
+    STATE_BACKEND=redis STATE_REDIS_URL=redis://127.0.0.1:6390/0 python main.py
+"""
+import argparse, asyncio
+
+from typing import Any, Dict, List, Optional
+
+
+class SimpleString(str):
+    """Відповідь +TEXT (на відміну від bulk-рядка)."""
+
+
+def encode(value: Any) -> bytes:
+    if isinstance(value, SimpleString):
+        return f"+{value}\r\n".encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, bool):
+        return b"+OK\r\n" if value else b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RESPStub:
+    def __init__(self):
+        self.data: Dict[bytes, bytes] = {}
+        # Лічильник змін ключа для семантики WATCH
+        self.revisions: Dict[bytes, int] = {}
+        self.commands = 0
+
+    def _touch(self, key: bytes) -> None:
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    def execute(self, args: List[bytes]) -> Any:
+        """Виконує одну команду; викликається без await, тож атомарна щодо інших клієнтів."""
+        name = args[0].upper()
+        self.commands += 1
+        if name == b"GET":
+            return self.data.get(args[1])
+        if name == b"MGET":
+            return [self.data.get(key) for key in args[1:]]
+        if name == b"SET":
+            self.data[args[1]] = args[2]
+            self._touch(args[1])
+            return True
+        if name == b"DEL":
+            removed = 0
+            for key in args[1:]:
+                if self.data.pop(key, None) is not None:
+                    removed += 1
+                    self._touch(key)
+            return removed
+        if name == b"INCR":
+            try:
+                value = int(self.data.get(args[1], b"0")) + 1
+            except ValueError:
+                return ValueError("value is not an integer or out of range")
+            self.data[args[1]] = str(value).encode()
+            self._touch(args[1])
+            return value
+        if name == b"PING":
+            return SimpleString("PONG")
+        if name in (b"SELECT", b"AUTH"):
+            return True
+        if name == b"FLUSHALL":
+            for key in list(self.data):
+                self._touch(key)
+            self.data.clear()
+            return True
+        return ValueError(f"unknown command '{name.decode()}'")
+
+    async def handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        watched: Dict[bytes, int] = {}
+        queued: Optional[List[List[bytes]]] = None
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = args[0].upper()
+                if name == b"WATCH":
+                    watched.update({key: self.revisions.get(key, 0) for key in args[1:]})
+                    reply: Any = True
+                elif name == b"UNWATCH":
+                    watched.clear()
+                    reply = True
+                elif name == b"MULTI":
+                    queued = []
+                    reply = True
+                elif name == b"DISCARD":
+                    queued, reply = None, True
+                    watched.clear()
+                elif name == b"EXEC":
+                    if queued is None:
+                        reply = ValueError("EXEC without MULTI")
+                    elif any(self.revisions.get(key, 0) != rev for key, rev in watched.items()):
+                        reply = None
+                    else:
+                        reply = [self.execute(cmd) for cmd in queued]
+                    queued = None
+                    watched.clear()
+                elif queued is not None:
+                    queued.append(args)
+                    reply = SimpleString("QUEUED")
+                else:
+                    reply = self.execute(args)
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # inline-команда (наприклад з telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+
+async def serve(host: str = "127.0.0.1", port: int = 6390) -> asyncio.AbstractServer:
+    stub = RESPStub()
+    server = await asyncio.start_server(stub.handler, host, port)
+    server.stub = stub
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальний замінник Redis для сховища стану")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def run():
+        server = await serve(args.host, args.port)
+        print(f"RESP stub on {args.host}:{args.port}")
+        await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Бенчмарк старту бота: час імпорту main.py, важкі модулі й файли, що з'явились
+під час імпорту, та час до першої обробленої команди (проти локальних замінників).
+
+Кожен прогін — окремий процес із холодним інтерпретатором у тимчасовій копії data/:
+
+    python -m bench.startup --runs 5 --max-import-ms 500
+"""
+import argparse, json, os, shutil, statistics, subprocess, sys, tempfile, time
+
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Модулі, які не повинні завантажуватись при імпорті main
+HEAVY_MODULES = ("pandas", "openai", "google.genai", "pyarrow")
+# Команди, час до першої відповіді на які вимірюється (у порядку виконання)
+FIRST_COMMANDS = [("help", []), ("myweights", []), ("analyze_gpt", ["AAPL"])]
+
+
+def _snapshot(root: Path) -> set:
+    return {str(p.relative_to(root)) for p in root.rglob("*")}
+
+
+def child() -> None:
+    """Один холодний старт; результат — JSON у stdout."""
+    started = time.perf_counter()
+    workdir = Path.cwd()
+    before = _snapshot(workdir)
+
+    import main as bot
+
+    import_ms = (time.perf_counter() - started) * 1000
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+    created = sorted(_snapshot(workdir) - before)
+
+    import asyncio
+    from loguru import logger
+    logger.remove()
+
+    from app import transport, usage_manager
+    from bench.stubs import StubTransport, make_context, make_update
+
+    transport.set_transport(StubTransport(polygon_latency=0, llm_latency=0))
+    usage_manager.DAILY_TOKEN_BUDGET = usage_manager.MONTHLY_TOKEN_BUDGET = 10**12
+
+    first: Dict[str, float] = {}
+
+    async def run():
+        for command, args in FIRST_COMMANDS:
+            update = make_update(1, f"/{command}")
+            await bot.COMMAND_HANDLERS[command](update, make_context(args))
+            first[command] = (time.perf_counter() - started) * 1000
+
+    asyncio.run(run())
+    print(json.dumps({"import_ms": import_ms, "heavy": loaded, "created": created, "first": first}))
+
+
+def run_once() -> Dict:
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    try:
+        shutil.copytree(REPO_ROOT / "data", Path(workdir) / "data")
+        env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), TRANSPORT_MODE="live")
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-m", "bench.startup", "--child"], cwd=workdir, env=env,
+                             capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - started) * 1000
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def format_report(results: List[Dict]) -> str:
+    def row(name: str, values: List[float]) -> str:
+        return f"{name:<28}{statistics.median(values):>9.0f}ms{min(values):>9.0f}ms{max(values):>9.0f}ms"
+
+    lines = [f"{'етап':<28}{'median':>11}{'min':>11}{'max':>11}",
+             row("import main", [r["import_ms"] for r in results])]
+    for command, _ in FIRST_COMMANDS:
+        lines.append(row(f"перша /{command}", [r["first"][command] for r in results]))
+    lines.append(row("процес повністю", [r["process_ms"] for r in results]))
+    lines.append("")
+    lines.append("Важкі модулі після імпорту: " + (", ".join(results[0]["heavy"]) or "немає"))
+    lines.append("Файли, створені імпортом: " + (", ".join(results[0]["created"]) or "немає"))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="кількість холодних стартів")
+    ap.add_argument("--max-import-ms", type=float, default=None,
+                    help="завершитись з помилкою, якщо медіана імпорту більша")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    opts = ap.parse_args()
+
+    if opts.child:
+        child()
+        return
+
+    results = [run_once() for _ in range(opts.runs)]
+    print(format_report(results))
+
+    failures = []
+    if results[0]["heavy"]:
+        failures.append(f"імпорт завантажує {', '.join(results[0]['heavy'])}")
+    if results[0]["created"]:
+        failures.append("імпорт створює файли")
+    median_import = statistics.median(r["import_ms"] for r in results)
+    if opts.max_import_ms is not None and median_import > opts.max_import_ms:
+        failures.append(f"імпорт {median_import:.0f}ms > {opts.max_import_ms:.0f}ms")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Перевірка сховища стану під конкурентним записом: кілька процесів одночасно
+оновлюють облік токенів і ваги та пишуть історію аналізів. Жодне оновлення не повинно загубитися.
+
+    python -m bench.state_stress --backend sqlite --procs 4 --ops 200
+    python -m bench.state_stress --backend redis --procs 4 --ops 200   # із bench.resp_stub
+"""
+import argparse, asyncio, multiprocessing, os, shutil, sys, tempfile, threading, time
+
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+REDIS_PORT = 6391
+
+
+def writer(index: int, ops: int, start: "multiprocessing.synchronize.Event") -> None:
+    from loguru import logger
+    logger.remove()
+
+    from app.usage_manager import record_usage
+    from app.utils_ai import update_feedback, update_history
+    from app.weights_manager import save_weights
+
+    start.wait()
+    for i in range(ops):
+        record_usage(1, "stress", "model", 1, 1)
+        ticker = f"T{index}"
+        update_history(ticker, {"probability_value": i}, f"d{i}")
+        update_feedback(ticker, f"d{i}", "success")
+        if i % 10 == 0:
+            save_weights(index, {"w": i})
+
+
+def verify(procs: int, ops: int) -> list:
+    from app.usage_manager import get_usage_report
+    from app.history_store import get_store
+    from app.weights_manager import get_weights_history
+
+    problems = []
+    calls = sum(row["calls"] for row in get_usage_report(1)["breakdown"].values())
+    if calls != procs * ops:
+        problems.append(f"usage: {calls} викликів замість {procs * ops}")
+    history = {row["ticker"]: row for row in get_store().aggregates(limit=procs)}
+    for index in range(procs):
+        row = history.get(f"T{index}", {"count": 0, "feedback": 0})
+        if row["count"] != ops or row["feedback"] != ops:
+            problems.append(f"history T{index}: {row['count']} записів, {row['feedback']} з відгуком замість {ops}")
+        saved = len(get_weights_history(index))
+        if saved != (ops + 9) // 10:
+            problems.append(f"weights {index}: {saved} версій замість {(ops + 9) // 10}")
+    return problems
+
+
+def start_resp_stub() -> None:
+    from bench.resp_stub import serve
+
+    async def run():
+        server = await serve(port=REDIS_PORT)
+        await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True).start()
+    time.sleep(0.3)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backend", choices=("sqlite", "redis"), default="sqlite")
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--ops", type=int, default=200, help="оновлень на процес")
+    ap.add_argument("--redis-url", default=None, help="зовнішній сервер; без нього запускається bench.resp_stub")
+    opts = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="state-")
+    os.chdir(workdir)
+    os.environ["STATE_BACKEND"] = opts.backend
+    if opts.backend == "redis":
+        if opts.redis_url is None:
+            start_resp_stub()
+        os.environ["STATE_REDIS_URL"] = opts.redis_url or f"redis://127.0.0.1:{REDIS_PORT}/0"
+    sys.path.insert(0, str(REPO_ROOT))
+
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    workers = [ctx.Process(target=writer, args=(i, opts.ops, start)) for i in range(opts.procs)]
+    for proc in workers:
+        proc.start()
+    time.sleep(1)
+    started = time.perf_counter()
+    start.set()
+    for proc in workers:
+        proc.join()
+    elapsed = time.perf_counter() - started
+
+    updates = opts.procs * opts.ops * 3 + opts.procs * ((opts.ops + 9) // 10)
+    print(f"{opts.backend}: {updates} оновлень з {opts.procs} процесів за {elapsed:.2f}s "
+          f"({updates / elapsed:.0f}/s)")
+    problems = verify(opts.procs, opts.ops)
+    shutil.rmtree(workdir, ignore_errors=True)
+    if problems:
+        sys.exit("FAIL: " + "; ".join(problems))
+    print("OK: жодне оновлення не загублено")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Локальні замінники Polygon, LLM-провайдерів і Telegram для бенчмарків
+та навантажувальних тестів. Нічого не звертається до мережі.
+"""
+import asyncio, json, random, re, time
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from app.transport import CassetteResponse
+
+AGGS_RE = re.compile(r"/v2/aggs/ticker/(?P<ticker>[^/]+)/range/(?P<mult>\d+)/(?P<span>\w+)/(?P<start>[^/]+)/(?P<end>[^/?]+)")
+GROUPED_RE = re.compile(r"/v2/aggs/grouped/locale/us/market/stocks/(?P<date>\d{4}-\d{2}-\d{2})")
+TICKER_RE = re.compile(r'(?:Ticker: |"ticker": ")([A-Z.]+)')
+
+SPAN_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+# Розмір сторінки Polygon, якщо limit не передано
+DEFAULT_LIMIT = 5000
+# Тикери, які "торгуються" у відповідях grouped daily
+UNIVERSE = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOG", "META", "TSLA"]
+
+
+def _parse_bound(value: str) -> datetime:
+    if value.isdigit():
+        ts = int(value)
+        # Polygon приймає і секунди, і мілісекунди
+        return datetime.fromtimestamp(ts / 1000 if ts > 10**11 else ts, tz=timezone.utc)
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def synthetic_bars(ticker: str, multiplier: int, timespan: str,
+                   start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Детермінована випадкова ціна для тикера на заданому інтервалі."""
+    rng = random.Random(f"{ticker}:{multiplier}:{timespan}:{start.date()}")
+    step = SPAN_SECONDS.get(timespan, 60) * multiplier
+    price = 20 + rng.random() * 300
+    bars = []
+    ts = int(start.timestamp()) // step * step
+    while ts <= end.timestamp():
+        o = price
+        c = max(0.5, o * (1 + rng.gauss(0, 0.004)))
+        h = max(o, c) * (1 + abs(rng.gauss(0, 0.002)))
+        l = min(o, c) * (1 - abs(rng.gauss(0, 0.002)))
+        bars.append({
+            "t": ts * 1000, "o": round(o, 4), "h": round(h, 4), "l": round(l, 4),
+            "c": round(c, 4), "v": rng.randint(1_000, 500_000), "vw": round((h + l + c) / 3, 4), "n": rng.randint(10, 5_000),
+        })
+        price = c
+        ts += step
+    return bars
+
+
+def synthetic_grouped(day: datetime, universe: List[str]) -> List[Dict[str, Any]]:
+    """Денні свічки всього ринку за один день, як у grouped daily."""
+    if day.weekday() >= 5:
+        return []
+    return [{"T": tk, **synthetic_bars(tk, 1, "day", day, day)[0]} for tk in universe]
+
+
+def synthetic_snapshot(now: datetime, universe: List[str]) -> List[Dict[str, Any]]:
+    """Snapshot усього ринку: попередній день як у grouped daily, поточна ціна з гепом."""
+    prev = now - timedelta(days=1)
+    while prev.weekday() >= 5:
+        prev -= timedelta(days=1)
+    items = []
+    for tk in universe:
+        rng = random.Random(f"{tk}:{now.date()}")
+        prev_bar = synthetic_bars(tk, 1, "day", prev, prev)[0]
+        price = round(prev_bar["c"] * (1 + rng.gauss(0, 0.03)), 4)
+        items.append({
+            "ticker": tk,
+            "todaysChangePerc": round((price / prev_bar["c"] - 1) * 100, 4),
+            "day": {"o": price, "h": price, "l": price, "c": price, "v": rng.randint(0, 200_000)},
+            "min": {"c": price},
+            "lastTrade": {"p": price},
+            "prevDay": {k: prev_bar[k] for k in ("o", "h", "l", "c", "v")},
+        })
+    return items
+
+
+def synthetic_financials(ticker: str, limit: int = 1) -> Dict[str, Any]:
+    rng = random.Random(ticker)
+    quarters = []
+    revenue = rng.randint(10**7, 10**10)
+    for end_date, period in (("2025-03-31", "Q1"), ("2024-12-31", "Q4"))[:limit]:
+        quarters.append({
+            "end_date": end_date,
+            "fiscal_period": period,
+            "fiscal_year": end_date[:4],
+            "financials": {
+                "income_statement": {
+                    "revenues": {"value": revenue},
+                    "gross_profit": {"value": int(revenue * rng.uniform(0.2, 0.6))},
+                    "operating_income_loss": {"value": int(revenue * rng.uniform(-0.1, 0.3))},
+                    "net_income_loss": {"value": int(revenue * rng.uniform(-0.2, 0.3))},
+                    "diluted_earnings_per_share": {"value": round(rng.uniform(-1, 5), 2)},
+                },
+                "balance_sheet": {
+                    "assets": {"value": revenue * 3},
+                    "current_assets": {"value": revenue},
+                    "liabilities": {"value": revenue * 2},
+                    "current_liabilities": {"value": int(revenue * 0.7)},
+                    "equity": {"value": revenue},
+                },
+                "cash_flow_statement": {
+                    "net_cash_flow_from_operating_activities": {"value": int(revenue * rng.uniform(-0.1, 0.3))},
+                },
+            },
+        })
+        revenue = int(revenue * rng.uniform(0.8, 1.1))
+    return {"results": quarters}
+
+
+def synthetic_analysis(tickers: List[str]) -> List[Dict[str, Any]]:
+    rng = random.Random(",".join(tickers))
+    records = [{
+        "ticker": tk,
+        "probability_value": rng.randint(0, 100),
+        "confidence": rng.randint(1, 10),
+        "justification": "ADX>25, volume spike",
+        "fundamental_impact": "neutral",
+        "extra": "synthetic",
+    } for tk in tickers]
+    records.sort(key=lambda r: r["probability_value"], reverse=True)
+    return records
+
+
+class StubTransport:
+    """
+    Транспорт, що імітує Polygon та LLM-провайдерів із заданою латентністю.
+    Латентність виконується синхронно (time.sleep), так само як блокують
+    справжні requests/SDK-виклики, тож блокування event loop видно в метриках.
+    """
+
+    def __init__(self, polygon_latency: float = 0.05, llm_latency: float = 1.0,
+                 jitter: float = 0.2, rate_limit_share: float = 0.0, seed: int = 0,
+                 universe_size: int = 500):
+        self.polygon_latency = polygon_latency
+        self.llm_latency = llm_latency
+        self.jitter = jitter
+        self.rate_limit_share = rate_limit_share
+        self._rng = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.universe = (UNIVERSE + [f"SYN{i:04d}" for i in range(universe_size)])[:max(universe_size, len(UNIVERSE))]
+
+    def _delay(self, base: float) -> None:
+        if base > 0:
+            time.sleep(max(0.0, base * (1 + self._rng.uniform(-self.jitter, self.jitter))))
+
+    def _count(self, kind: str) -> None:
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def http_get(self, url: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+        self._delay(self.polygon_latency)
+        if self._rng.random() < self.rate_limit_share:
+            self._count("polygon_429")
+            return CassetteResponse(429, '{"status":"ERROR"}', url)
+
+        match = AGGS_RE.search(url)
+        if match:
+            self._count("polygon_aggs")
+            # Як і Polygon: сторінка не більше limit, продовження — через next_url з курсором
+            query = {**dict(parse_qsl(urlsplit(url).query)), **(params or {})}
+            limit = int(query.get("limit", DEFAULT_LIMIT))
+            offset = int(query.get("cursor", 0))
+            bars = synthetic_bars(
+                match["ticker"], int(match["mult"]), match["span"],
+                _parse_bound(match["start"]), _parse_bound(match["end"]),
+            )
+            payload = {"results": bars[offset:offset + limit]}
+            payload["resultsCount"] = len(payload["results"])
+            if offset + limit < len(bars):
+                payload["next_url"] = f"{url.split('?')[0]}?cursor={offset + limit}&limit={limit}"
+            return CassetteResponse(200, json.dumps(payload), url)
+        match = GROUPED_RE.search(url)
+        if match:
+            self._count("polygon_grouped")
+            results = synthetic_grouped(_parse_bound(match["date"]), self.universe)
+            return CassetteResponse(200, json.dumps({"results": results, "resultsCount": len(results)}), url)
+        if "/v2/snapshot/locale/us/markets/stocks/tickers" in url:
+            self._count("polygon_snapshot")
+            items = synthetic_snapshot(datetime.now(timezone.utc), self.universe)
+            return CassetteResponse(200, json.dumps({"status": "OK", "count": len(items), "tickers": items}), url)
+        if "/v3/reference/splits" in url:
+            self._count("polygon_splits")
+            return CassetteResponse(200, json.dumps({"status": "OK", "results": []}), url)
+        if "/reference/financials" in url:
+            self._count("polygon_financials")
+            return CassetteResponse(200, json.dumps(synthetic_financials((params or {}).get("ticker", ""), int((params or {}).get("limit", 1)))), url)
+
+        self._count("polygon_unknown")
+        return CassetteResponse(404, '{"status":"NOT_FOUND"}', url)
+
+    def call_llm(self, provider: str, path: Tuple[str, ...], method, kwargs: Dict) -> Any:
+        self._delay(self.llm_latency)
+        if path[-2:] == ("caches", "create"):
+            self._count(f"llm_{provider}_cache")
+            return SimpleNamespace(name=f"cachedContents/stub-{self.calls[f'llm_{provider}_cache']}")
+        self._count(f"llm_{provider}")
+
+        if provider == "openai":
+            prompt = "\n".join(m["content"] for m in kwargs.get("messages", []))
+        else:
+            prompt = kwargs.get("contents", "")
+            prompt = prompt if isinstance(prompt, str) else json.dumps(prompt, default=str)
+        tickers = list(dict.fromkeys(TICKER_RE.findall(prompt))) or ["UNKNOWN"]
+        records = synthetic_analysis(tickers)
+        if "DATA SECTIONS" not in prompt:
+            records = records[:1]
+        # Обидва провайдери повертають одну схему {"analysis": [...]}
+        content = json.dumps({"analysis": records})
+
+        if provider == "openai":
+            usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4,
+                                    total_tokens=(len(prompt) + len(content)) // 4)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=usage,
+            )
+
+        return SimpleNamespace(
+            text=content,
+            usage_metadata=SimpleNamespace(prompt_token_count=len(prompt) // 4,
+                                           candidates_token_count=len(content) // 4),
+        )
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class FakeMessage:
+    """Замінник telegram.Message: запам'ятовує відповіді бота."""
+
+    def __init__(self, chat_id: int, text: str = "", telegram_latency: float = 0.0):
+        self.chat_id = chat_id
+        self.text = text
+        self.telegram_latency = telegram_latency
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        self.replies.append(text)
+        return FakeMessage(self.chat_id, text, self.telegram_latency)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, message: FakeMessage):
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs) -> None:
+        return None
+
+    async def edit_message_text(self, text: str, **kwargs) -> None:
+        self.message.replies.append(text)
+
+
+def make_update(user_id: int, text: str = "", telegram_latency: float = 0.0,
+                callback_data: Optional[str] = None) -> SimpleNamespace:
+    """Синтетичний Update з тими полями, які читають обробники команд."""
+    message = FakeMessage(user_id, text, telegram_latency)
+    return SimpleNamespace(
+        update_id=random.randint(1, 10**9),
+        message=message,
+        effective_user=SimpleNamespace(id=user_id, first_name=f"user{user_id}"),
+        effective_chat=SimpleNamespace(id=user_id),
+        callback_query=FakeCallbackQuery(callback_data, message) if callback_data else None,
+    )
+
+
+def make_context(args: List[str]) -> SimpleNamespace:
+    """Синтетичний ContextTypes.DEFAULT_TYPE: обробники використовують лише args."""
+    return SimpleNamespace(args=list(args), user_data={}, chat_data={}, bot_data={})
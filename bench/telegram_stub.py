@@ -0,0 +1,122 @@
+"""
+Локальний замінник Telegram Bot API: приймає виклики бота (getMe, sendMessage,
+editMessageText, setWebhook, ...) і доставляє синтетичні оновлення на webhook.
+Усі надіслані ботом повідомлення записуються з часом отримання.
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot ...
+"""
+import asyncio, itertools, json, time
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from app.webhook import SECRET_HEADER, UpstreamPool, serve_http
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+
+def _params(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    """Параметри виклику: JSON або form-urlencoded (значення-нестроки закодовані в JSON)."""
+    if not body:
+        return {}
+    if headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode("utf-8")):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class TelegramStub:
+    def __init__(self, latency: float = 0.0):
+        # Затримка відповіді Bot API на надсилання повідомлень, с
+        self.latency = latency
+        self.sent: List[Tuple[float, int, str]] = []
+        self.webhook: Dict[str, Any] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._waiters: Dict[int, List[Tuple[int, asyncio.Future]]] = defaultdict(list)
+        self._received: Dict[int, int] = defaultdict(int)
+        self._server = None
+        self._pool: Optional[UpstreamPool] = None
+
+    # --- Bot API ---
+
+    def _message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, "text": text}
+
+    def _record(self, chat_id: int, text: str) -> None:
+        self.sent.append((time.perf_counter(), chat_id, text))
+        self._received[chat_id] += 1
+        waiters = self._waiters[chat_id]
+        for item in list(waiters):
+            count, future = item
+            if self._received[chat_id] >= count and not future.done():
+                future.set_result(time.perf_counter())
+                waiters.remove(item)
+
+    async def handle(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        api_method = path.rsplit("/", 1)[-1]
+        params = _params(headers, body)
+        self.calls[api_method] += 1
+
+        if api_method == "getMe":
+            result: Any = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            chat_id = int(params.get("chat_id", 0))
+            self._record(chat_id, params.get("text", ""))
+            result = self._message(chat_id, params.get("text", ""))
+        elif api_method == "setWebhook":
+            self.webhook = params
+            result = True
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Запускає сервер; повертає base_url для ApplicationBuilder.base_url."""
+        self._server = await serve_http(host, port, self.handle)
+        return f"http://{host}:{port}/bot"
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- доставка оновлень ---
+
+    def make_update(self, chat_id: int, text: str) -> Dict[str, Any]:
+        user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}, "from": user, "text": text}
+        command = text.split()[0] if text.startswith("/") else ""
+        if command:
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def expect(self, chat_id: int, replies: int) -> asyncio.Future:
+        """Future, що завершується часом отримання, коли чат отримає ще replies повідомлень."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append((self._received[chat_id] + replies, future))
+        return future
+
+    async def deliver(self, host: str, port: int, path: str, update: Dict[str, Any], secret: str = "") -> int:
+        """POST оновлення на webhook, як це робить Telegram; повертає HTTP-статус."""
+        if self._pool is None:
+            self._pool = UpstreamPool(host, port)
+        headers = {"Content-Type": "application/json"}
+        if secret:
+            headers[SECRET_HEADER] = secret
+        status, _ = await self._pool.request("POST", path, headers, json.dumps(update).encode())
+        return status
@@ -0,0 +1,148 @@
+"""
+Наскрізний бенчмарк режиму webhook: замінник Telegram → проксі → воркери →
+обробники → sendMessage назад у замінник. Polygon і LLM — локальні замінники.
+
+Для кожної команди вимірюється підтвердження webhook (HTTP 200 від проксі),
+перша відповідь бота і повна відповідь (усі очікувані повідомлення).
+
+    python -m bench.webhook_e2e --workers 2 --users 20 --requests 200
+"""
+import argparse, asyncio, os, random, sys, time
+
+from collections import defaultdict
+from typing import Dict, List
+
+from bench.load_test import REPO_ROOT, STUB_TOKEN, command_args, parse_mix, percentile, prepare_workdir
+
+DEFAULT_MIX = "help=2,myweights=2,analyze_gpt=4,analyze_all_gem=1"
+# Скільки повідомлень надсилає бот у відповідь на команду
+EXPECTED_REPLIES = {"analyze_gpt": 2, "analyze_gem": 2, "analyze_all_gpt": 2, "analyze_all_gem": 2}
+
+
+def worker() -> None:
+    """Процес-воркер із замінниками Polygon/LLM замість мережі."""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from app import transport, usage_manager, webhook
+    from bench.stubs import StubTransport
+
+    transport.set_transport(StubTransport(float(os.environ["BENCH_POLYGON_LATENCY"]),
+                                          float(os.environ["BENCH_LLM_LATENCY"])))
+    usage_manager.DAILY_TOKEN_BUDGET = usage_manager.MONTHLY_TOKEN_BUDGET = 10**12
+
+    import main as bot
+    webhook.run_worker(bot.build_application(STUB_TOKEN, os.environ["TELEGRAM_API_URL"], webhook_worker=True))
+
+
+async def run_e2e(opts) -> Dict:
+    from app import webhook
+    from bench.telegram_stub import TelegramStub
+
+    stub = TelegramStub()
+    base_url = await stub.start(port=opts.telegram_port)
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), TELEGRAM_API_URL=base_url,
+               BENCH_POLYGON_LATENCY=str(opts.polygon_latency), BENCH_LLM_LATENCY=str(opts.llm_latency))
+    secret = "bench-secret"
+    stop = asyncio.Event()
+    supervisor = asyncio.create_task(webhook.supervise(
+        [sys.executable, "-m", "bench.webhook_e2e", "--worker"], workers=opts.workers,
+        listen="127.0.0.1", port=opts.port, secret=secret,
+        webhook_url=f"http://127.0.0.1:{opts.port}{webhook.WEBHOOK_PATH}",
+        token=STUB_TOKEN, base_url=base_url, env=env, stop=stop,
+    ))
+    while not stub.webhook:
+        if supervisor.done():
+            supervisor.result()
+        await asyncio.sleep(0.1)
+
+    mix = parse_mix(opts.mix)
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(opts.seed)
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(opts.requests):
+        queue.put_nowait(rng.choices(names, weights)[0])
+
+    latencies: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def virtual_user(chat_id: int) -> None:
+        user_rng = random.Random(opts.seed + chat_id)
+        while not queue.empty():
+            command = queue.get_nowait()
+            text = " ".join([f"/{command}"] + command_args(command, user_rng))
+            first = stub.expect(chat_id, 1)
+            done = stub.expect(chat_id, EXPECTED_REPLIES.get(command, 1))
+            started = time.perf_counter()
+            try:
+                status = await stub.deliver("127.0.0.1", opts.port, webhook.WEBHOOK_PATH,
+                                            stub.make_update(chat_id, text), secret)
+                if status != 200:
+                    raise RuntimeError(f"HTTP {status}")
+                latencies[command]["ack"].append(time.perf_counter() - started)
+                latencies[command]["first"].append(await asyncio.wait_for(first, opts.timeout) - started)
+                latencies[command]["done"].append(await asyncio.wait_for(done, opts.timeout) - started)
+            except Exception:
+                errors[command] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(200_000 + i) for i in range(opts.users)))
+    wall = time.perf_counter() - started
+
+    stop.set()
+    await supervisor
+    await stub.close()
+    return {"wall": wall, "latencies": latencies, "errors": errors, "calls": dict(stub.calls)}
+
+
+def format_report(result: Dict) -> str:
+    total = sum(len(v["done"]) for v in result["latencies"].values())
+    lines = [
+        f"Запитів: {total}, час: {result['wall']:.2f}s, пропускна здатність: {total / result['wall']:.2f} req/s",
+        "",
+        f"{'команда':<18}{'n':>5}{'ack p50':>10}{'first p50':>11}{'first p95':>11}"
+        f"{'done p50':>10}{'done p95':>10}{'errors':>8}",
+    ]
+    for command, values in sorted(result["latencies"].items()):
+        lines.append(
+            f"{command:<18}{len(values['done']):>5}"
+            f"{percentile(values['ack'], 50) * 1000:>8.0f}ms"
+            f"{percentile(values['first'], 50) * 1000:>9.0f}ms{percentile(values['first'], 95) * 1000:>9.0f}ms"
+            f"{percentile(values['done'], 50) * 1000:>8.0f}ms{percentile(values['done'], 95) * 1000:>8.0f}ms"
+            f"{result['errors'].get(command, 0):>8}"
+        )
+    lines.append("")
+    lines.append("Виклики Bot API: " + ", ".join(f"{k}={v}" for k, v in sorted(result["calls"].items())))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=2, help="кількість процесів-воркерів")
+    ap.add_argument("--users", type=int, default=10, help="кількість одночасних чатів")
+    ap.add_argument("--requests", type=int, default=100, help="загальна кількість команд")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="команда=вага через кому")
+    ap.add_argument("--port", type=int, default=18443, help="порт проксі")
+    ap.add_argument("--telegram-port", type=int, default=18081, help="порт замінника Telegram")
+    ap.add_argument("--polygon-latency", type=float, default=0.05, help="латентність Polygon, с")
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="латентність LLM, с")
+    ap.add_argument("--timeout", type=float, default=60, help="очікування відповіді бота, с")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    opts = ap.parse_args()
+
+    if opts.worker:
+        worker()
+        return
+
+    os.chdir(prepare_workdir())
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    print(format_report(asyncio.run(run_e2e(opts))))
+
+
+if __name__ == "__main__":
+    main()
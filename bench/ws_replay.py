@@ -0,0 +1,92 @@
+"""
+Локальний websocket-сервер, що говорить протоколом Polygon (auth, subscribe, unsubscribe, AM)
+і відтворює синтетичні хвилинні свічки. Замінник живого потоку для тестів:
+
+    python -m bench.ws_replay --port 8765 --interval 0.5
+    LIVE_BARS=1 LIVE_WS_URL=ws://127.0.0.1:8765 python main.py
+"""
+import argparse, asyncio, json, time
+
+from datetime import datetime, timezone
+from typing import Dict, Set
+
+from bench.stubs import synthetic_bars
+
+MINUTE_MS = 60_000
+
+
+class ReplayServer:
+    """Кожні interval секунд надсилає кожному клієнту наступну хвилинну свічку його тикерів."""
+
+    def __init__(self, interval: float = 1.0, start_ms: int = None):
+        self.interval = interval
+        self.start_ms = start_ms if start_ms is not None else int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+        self.sent = 0
+
+    def _bar(self, ticker: str, t_ms: int) -> Dict:
+        start = datetime.fromtimestamp(t_ms / 1000, tz=timezone.utc)
+        bar = synthetic_bars(ticker, 1, "minute", start, start)[0]
+        return {"ev": "AM", "sym": ticker, "s": t_ms, "e": t_ms + MINUTE_MS,
+                "o": bar["o"], "h": bar["h"], "l": bar["l"], "c": bar["c"], "v": bar["v"]}
+
+    async def handler(self, ws, *_) -> None:
+        await ws.send(json.dumps([{"ev": "status", "status": "connected", "message": "Connected Successfully"}]))
+        tickers: Set[str] = set()
+        authed = asyncio.Event()
+
+        async def pump():
+            await authed.wait()
+            t_ms = self.start_ms
+            while True:
+                if tickers:
+                    await ws.send(json.dumps([self._bar(tk, t_ms) for tk in sorted(tickers)]))
+                    self.sent += len(tickers)
+                t_ms += MINUTE_MS
+                await asyncio.sleep(self.interval)
+
+        pump_task = asyncio.ensure_future(pump())
+        try:
+            async for message in ws:
+                request = json.loads(message)
+                action, params = request.get("action"), request.get("params", "")
+                if action == "auth":
+                    authed.set()
+                    await ws.send(json.dumps([{"ev": "status", "status": "auth_success", "message": "authenticated"}]))
+                elif action == "subscribe":
+                    subs = [p.split(".", 1)[1] for p in params.split(",") if p.startswith("AM.")]
+                    tickers.update(subs)
+                    await ws.send(json.dumps([{"ev": "status", "status": "success", "message": f"subscribed to: {params}"}]))
+                elif action == "unsubscribe":
+                    tickers.difference_update(p.split(".", 1)[1] for p in params.split(",") if p.startswith("AM."))
+                    await ws.send(json.dumps([{"ev": "status", "status": "success", "message": f"unsubscribed to: {params}"}]))
+        finally:
+            pump_task.cancel()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, interval: float = 1.0):
+    """Запускає сервер і повертає його (server.close() для зупинки)."""
+    import websockets
+
+    replay = ReplayServer(interval)
+    server = await websockets.serve(replay.handler, host, port)
+    server.replay = replay
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальний замінник websocket-потоку Polygon")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=1.0, help="секунд між хвилинними свічками")
+    args = parser.parse_args()
+
+    async def run():
+        server = await serve(args.host, args.port, args.interval)
+        print(f"Replay server on ws://{args.host}:{args.port}")
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import os, sys
+
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -7,17 +9,35 @@ from telegram.ext import CallbackQueryHandler
 from telegram.constants import ParseMode
 from telegram import Update
 from app.commands_prompt import prompt_history, set_prompt, show_my_prompt
-from app.commands_utils import history
+from app.commands_utils import history, history_page_handler, queue_status
+from app.commands_usage import usage
+from app.commands_screener import screener
 from app.weights_commands import reset_weights, set_weights, show_weights
 from config import TELEGRAM_API_KEY
 from loguru import logger
 
 from app.commands_gpt import analyze_gpt, analyze_all_gpt
 from app.commands_gemini import analyze_gem, analyze_all_gem
-from app.commands_gpt import feedback_handler as gpt_feedback_handler
-from app.commands_gemini import feedback_handler as gem_feedback_handler
+from app.commands_analysis import feedback_handler
+from app import live_bars, webhook
+from app.scheduler import MAX_QUEUE, MAX_WORKERS
+from app.utils_ai import load_tickers
+
+
+
+# polling — один процес із long polling; webhook — супервізор із воркерами (див. app/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Адреса Bot API (для локального замінника Telegram у бенчмарках)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# Скільки оновлень обробляється одночасно. Обробники здебільшого чекають у черзі
+# планувальника, тож межа — його місткість (виконуються + у черзі): черговість,
+# смуги й справедливість між користувачами задає планувальник, а не PTB
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", str(MAX_WORKERS + MAX_QUEUE)))
+
 
-logger.add("logs/app.log", format="{time} | {level} | {message}", rotation="10 MB")
+def setup_logging(name: str = "app") -> None:
+    # Файловий лог додається лише при запуску бота, а не при імпорті модуля
+    logger.add(f"logs/{name}.log", format="{time} | {level} | {message}", rotation="10 MB")
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -28,7 +48,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/analyze_gem TICKER [YYYY-MM-DD] - Аналіз тикера за допомогою Gemini\n"
         "/analyze_gpt TICKER [YYYY-MM-DD] - Аналіз тикера за допомогою ChatGPT\n"
         "/analyze_all_gem ticker1,ticker2 [YYYY-MM-DD] - Аналіз кількох тикерів (Gemini)\n"
-        "/analyze_all_gpt ticker1,ticker2 [YYYY-MM-DD] - Аналіз кількох тикерів (ChatGPT)\n\n"
+        "/analyze_all_gpt ticker1,ticker2 [YYYY-MM-DD] - Аналіз кількох тикерів (ChatGPT)\n"
+        "/screener [score|gap|rvol|atr] [N] - Скринер гепів і обсягу по всьому ринку\n\n"
         
         "⚙️ <b>Керування промптами (інструкціями для ШІ):</b>\n"
         "/set_prompt [текст] - Встановити власну інструкцію для аналізу\n"
@@ -39,6 +60,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/setweights параметр1:значення параметр2:значення - Встановити власні ваги\n"
         "/myweights - Переглянути поточні ваги параметрів\n"
         
+        "📊 <b>Використання:</b>\n"
+        "/usage - Використані токени та ліміти\n"
+        "/queue - Стан черги аналізів\n"
+        
         "ℹ️ <b>Додаткові команди:</b>\n"
         "/help - Детальна довідка по командам\n"
         
@@ -46,27 +71,67 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         parse_mode=ParseMode.HTML
     )
 
+COMMAND_HANDLERS = {
+    "start": help_command,
+    "analyze_gpt": analyze_gpt,
+    "analyze_gem": analyze_gem,
+    "analyze_all_gpt": analyze_all_gpt,
+    "analyze_all_gem": analyze_all_gem,
+    "screener": screener,
+
+    "prompthistory": prompt_history,
+    "myprompt": show_my_prompt,
+    "set_prompt": set_prompt,
+
+    "setweights": set_weights,
+    "myweights": show_weights,
+
+    "history": history,
+    "usage": usage,
+    "queue": queue_status,
+    "help": help_command,
+}
+
+CALLBACK_HANDLERS = [
+    (feedback_handler, "^feedback"),
+    (history_page_handler, "^history\\|"),
+]
+
+
+def build_application(token: str = TELEGRAM_API_KEY, base_url: str = TELEGRAM_API_URL, webhook_worker: bool = False):
+    # І в polling, і у воркері webhook обробники виконуються паралельно: інакше PTB
+    # обробляє по одному оновленню, і масовий аналіз одного користувача блокує всіх
+    builder = ApplicationBuilder().token(token).concurrent_updates(CONCURRENT_UPDATES)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if webhook_worker:
+        # Оновлення надходять з HTTP через проксі, а не з getUpdates
+        builder = builder.updater(None)
+    app = builder.build()
+    if live_bars.LIVE_ENABLED:
+        live_bars.service.start(load_tickers())
+
+    for command, handler in COMMAND_HANDLERS.items():
+        app.add_handler(CommandHandler(command, handler))
+    for handler, pattern in CALLBACK_HANDLERS:
+        app.add_handler(CallbackQueryHandler(handler, pattern=pattern))
+
+    return app
+
 if __name__ == '__main__':
-    app = ApplicationBuilder().token(TELEGRAM_API_KEY).build()
-
-    app.add_handler(CommandHandler("start", help_command))
-    app.add_handler(CommandHandler("analyze_gpt", analyze_gpt))
-    app.add_handler(CommandHandler("analyze_gem", analyze_gem))
-    app.add_handler(CommandHandler("analyze_all_gpt", analyze_all_gpt))
-    app.add_handler(CommandHandler("analyze_all_gem", analyze_all_gem))
-    
-    app.add_handler(CommandHandler("prompthistory", prompt_history))
-    app.add_handler(CommandHandler("myprompt", show_my_prompt))
-    app.add_handler(CommandHandler("set_prompt", set_prompt))
-    
-    app.add_handler(CommandHandler("setweights", set_weights))
-    app.add_handler(CommandHandler("myweights", show_weights))
-    
-    app.add_handler(CommandHandler("history", history))
-    app.add_handler(CommandHandler("help", help_command))
-    
-    app.add_handler(CallbackQueryHandler(gpt_feedback_handler, pattern="^feedback"))
-    app.add_handler(CallbackQueryHandler(gem_feedback_handler, pattern="^feedback"))
-
-    logger.info("Бот запущено.")
-    app.run_polling()
+    mode = sys.argv[1] if len(sys.argv) > 1 else BOT_MODE
+
+    if mode == "webhook":
+        setup_logging()
+        logger.info("Бот запущено (webhook).")
+        webhook.run_supervisor([sys.executable, os.path.abspath(__file__), "webhook-worker"],
+                               token=TELEGRAM_API_KEY, base_url=TELEGRAM_API_URL or None)
+    elif mode == "webhook-worker":
+        setup_logging(f"worker-{os.environ.get('WEBHOOK_WORKER_PORT', os.getpid())}")
+        webhook.run_worker(build_application(webhook_worker=True))
+    else:
+        setup_logging()
+        app = build_application()
+
+        logger.info("Бот запущено.")
+        app.run_polling()
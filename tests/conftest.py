@@ -0,0 +1,16 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Порожня робоча тека: відносні шляхи data/, output/ вказують у tmp_path, а не в репозиторій."""
+    from app import state_backend
+
+    monkeypatch.chdir(tmp_path)
+    state_backend.set_backend(state_backend.SQLiteBackend(str(tmp_path / "state.db")))
+    yield tmp_path
+    state_backend.set_backend(None)
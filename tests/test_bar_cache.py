@@ -0,0 +1,74 @@
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+
+from app.bar_cache import MINUTE_MS, NY_TZ, resample
+
+
+def ny_ms(day: date, hh: int, mm: int = 0) -> int:
+    return int(datetime.combine(day, time(hh, mm), tzinfo=NY_TZ).timestamp() * 1000)
+
+
+def minute_bars(day: date, start=(4, 0), end=(20, 0)) -> np.ndarray:
+    """Хвилинні свічки [start, end) за Нью-Йорком: ціна = номер хвилини, обсяг = 1."""
+    first, last = ny_ms(day, *start), ny_ms(day, *end)
+    t = np.arange(first, last, MINUTE_MS, dtype=np.int64)
+    price = np.arange(len(t), dtype=np.float64)
+    return np.column_stack((t, price, price + 0.5, price - 0.5, price + 0.25, np.ones(len(t))))
+
+
+def test_five_minute_buckets_aggregate_ohlcv():
+    day = date(2024, 3, 5)
+    bars = minute_bars(day, (9, 30), (10, 0))
+    out = resample(bars, 5, "minute")
+
+    assert len(out) == 6
+    assert out[0, 0] == ny_ms(day, 9, 30)
+    assert np.all(np.diff(out[:, 0]) == 5 * MINUTE_MS)
+    # Перший кошик — хвилини 0..4
+    assert out[0, 1:].tolist() == [0.0, 4.5, -0.5, 4.25, 5.0]
+
+
+def test_intraday_keeps_extended_hours_daily_uses_regular_session():
+    day = date(2024, 3, 5)
+    bars = minute_bars(day)
+
+    hourly = resample(bars, 1, "hour")
+    assert hourly[0, 0] == ny_ms(day, 4) and len(hourly) == 16
+
+    daily = resample(bars, 1, "day")
+    assert len(daily) == 1
+    assert daily[0, 0] == ny_ms(day, 0)
+    open_idx = (9 * 60 + 30) - 4 * 60
+    close_idx = 16 * 60 - 4 * 60 - 1
+    assert daily[0, 1] == open_idx
+    assert daily[0, 4] == close_idx + 0.25
+    assert daily[0, 5] == 390
+
+
+def test_daily_bar_honours_early_close():
+    day = date(2024, 11, 29)  # п'ятниця після Дня подяки, закриття о 13:00
+    daily = resample(minute_bars(day), 1, "day")
+    assert daily[0, 5] == (13 * 60) - (9 * 60 + 30)
+
+
+def test_day_buckets_follow_new_york_midnight_across_dst():
+    days = [date(2024, 3, 8), date(2024, 3, 11)]  # перехід на літній час 10 березня
+    bars = np.vstack([minute_bars(d, (9, 30), (16, 0)) for d in days])
+    daily = resample(bars, 1, "day")
+    assert daily[:, 0].tolist() == [ny_ms(d, 0) for d in days]
+
+
+def test_weekly_bucket_starts_on_sunday_like_polygon():
+    monday = date(2024, 3, 4)
+    bars = np.vstack([minute_bars(monday + timedelta(days=i), (9, 30), (16, 0)) for i in range(5)])
+    weekly = resample(bars, 1, "week")
+    assert len(weekly) == 1
+    assert weekly[0, 0] == ny_ms(monday - timedelta(days=1), 0)
+    assert weekly[0, 5] == 5 * 390
+
+
+def test_empty_input():
+    assert resample(np.empty((0, 6)), 5, "minute").shape == (0, 6)
+    # Лише премаркет — денних свічок немає
+    assert resample(minute_bars(date(2024, 3, 5), (4, 0), (9, 0)), 1, "day").shape == (0, 6)
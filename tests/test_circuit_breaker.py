@@ -0,0 +1,79 @@
+import pytest
+
+from app import circuit_breaker
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", window=60, min_calls=4, error_rate=0.5, rate_limit_trip=2, cooldown=30)
+
+
+def test_opens_on_error_rate_after_min_calls(clock):
+    breaker = make_breaker()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # лише 3 виклики з min_calls=4
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_opens_on_rate_limits_regardless_of_min_calls(clock):
+    breaker = make_breaker()
+    breaker.record_failure(rate_limited=True)
+    assert breaker.state == CLOSED
+    breaker.record_failure(rate_limited=True)
+    assert breaker.state == OPEN
+
+
+def test_old_events_leave_the_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 61
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_limited_probes_and_success_closes(clock):
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.record_failure(rate_limited=True)
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # half_open_probes=1
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.record_failure(rate_limited=True)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
@@ -0,0 +1,110 @@
+import json
+from datetime import date, datetime, time
+
+import numpy as np
+import pyarrow.dataset as ds
+import pytest
+
+from app import bar_cache, chart_data, dataset_export, history_archive
+from app.bar_cache import MINUTE_MS, NY_TZ, MinuteBarCache
+from app.history_store import HistoryStore
+
+RESULT = {"probability_value": 60, "confidence": 5}
+
+
+@pytest.fixture
+def env(workdir, monkeypatch):
+    store = HistoryStore(str(workdir / "history.db"))
+    for module in (dataset_export, history_archive):
+        monkeypatch.setattr(module, "get_store", lambda: store)
+    monkeypatch.setattr(history_archive, "ARCHIVE_DIR", workdir / "archive")
+    calls = {"bars": [], "bars_5m": []}
+    available = {"bars": set(), "bars_5m": set()}
+
+    def snapshot(table):
+        def fn(ticker, day):
+            calls[table].append((ticker, day))
+            if (ticker, day) not in available[table]:
+                return []
+            return [{"ticker": ticker, "date": day, "t": 0, "o": 1.0, "h": 1.0, "l": 1.0, "c": 1.0,
+                     "v": 1.0, "month": day[:7]}]
+        return fn
+
+    monkeypatch.setattr(dataset_export, "bar_snapshot", snapshot("bars"))
+    monkeypatch.setattr(dataset_export, "intraday_snapshot", snapshot("bars_5m"))
+    return store, workdir / "dataset", calls, available
+
+
+def table_pairs(path):
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table(columns=["ticker", "date"])
+    return sorted(zip(table.column("ticker").to_pylist(), table.column("date").to_pylist()))
+
+
+def test_bars_are_exported_once_even_after_rows_are_archived(env):
+    store, out, calls, available = env
+    available["bars"] |= {("AAPL", "2024-01-10")}
+    available["bars_5m"] |= {("AAPL", "2024-01-10")}
+    old = store.record("AAPL", "2024-01-10", RESULT, provider="gpt")
+    store._conn().execute("UPDATE analyses SET created_at = '2024-01-10T09:00:00' WHERE id = ?", (old,))
+    assert dataset_export.export(out) == {"predictions": 1, "feedback": 0, "bars": 1, "bars_5m": 1}
+
+    history_archive.archive(180, today=date(2024, 9, 1))
+    store.record("AAPL", "2024-01-10", RESULT, provider="gemini")
+    assert dataset_export.export(out) == {"predictions": 1, "feedback": 0, "bars": 0, "bars_5m": 0}
+    assert calls["bars"] == [("AAPL", "2024-01-10")]
+    assert table_pairs(out / "bars") == table_pairs(out / "bars_5m") == [("AAPL", "2024-01-10")]
+
+
+def test_pair_without_bars_is_retried_by_a_later_analysis(env):
+    store, out, calls, available = env
+    store.record("MSFT", "2024-03-05", RESULT, provider="gpt")
+    assert dataset_export.export(out)["bars"] == 0
+
+    available["bars"].add(("MSFT", "2024-03-05"))
+    store.record("MSFT", "2024-03-05", RESULT, provider="gemini")
+    assert dataset_export.export(out)["bars"] == 1
+    assert calls["bars"] == [("MSFT", "2024-03-05")] * 2
+
+
+def test_watermark_without_manifest_is_rebuilt_from_the_dataset(env):
+    store, out, calls, available = env
+    available["bars"].add(("AAPL", "2024-03-05"))
+    store.record("AAPL", "2024-03-05", RESULT, provider="gpt")
+    dataset_export.export(out, intraday=False)
+
+    path = out / dataset_export.WATERMARK_FILE
+    watermark = json.loads(path.read_text())
+    del watermark["exported"]
+    path.write_text(json.dumps(watermark))
+
+    store.record("AAPL", "2024-03-05", RESULT, provider="gemini")
+    assert dataset_export.export(out, intraday=False)["bars"] == 0
+    assert json.loads(path.read_text())["exported"]["bars"] == {"AAPL": ["2024-03-05"]}
+
+
+def test_intraday_snapshot_resamples_the_analysis_window(monkeypatch):
+    cache = MinuteBarCache()
+    monkeypatch.setattr(bar_cache, "minute_cache", cache)
+    requested = []
+
+    def ny_ms(day, hh):
+        return int(datetime.combine(day, time(hh), tzinfo=NY_TZ).timestamp() * 1000)
+
+    def backfill(ticker, start_date, end_date):
+        requested.append((start_date, end_date))
+        # Хвилини з розширеними годинами за 29 лютого та три сесії вікна
+        days = [date(2024, 2, 29), date(2024, 3, 1), date(2024, 3, 4), date(2024, 3, 5)]
+        t = np.concatenate([np.arange(ny_ms(d, 4), ny_ms(d, 20), MINUTE_MS, dtype=np.float64) for d in days])
+        cache.put(ticker, np.column_stack((t, t, t, t, t, np.ones(len(t)))), ny_ms(days[0], 0), ny_ms(days[-1], 20))
+
+    monkeypatch.setattr(chart_data, "backfill_minutes", backfill)
+    rows = dataset_export.intraday_snapshot("AAPL", "2024-03-05")
+
+    # Три сесії: 1, 4 і 5 березня (до 09:45), з 5-хвилинним кроком
+    assert requested[0][0] == "2024-03-01"
+    days = sorted({datetime.fromtimestamp(r["t"] / 1000, NY_TZ).date() for r in rows})
+    assert days == [date(2024, 3, 1), date(2024, 3, 4), date(2024, 3, 5)]
+    assert np.all(np.diff([r["t"] for r in rows if r["t"] >= rows[-1]["t"] - 3_600_000]) == 5 * MINUTE_MS)
+    last = datetime.fromtimestamp(rows[-1]["t"] / 1000, NY_TZ)
+    assert last.date() == date(2024, 3, 5) and last.time() == time(9, 45)
+    assert rows[-1]["v"] == 1  # хвилина 09:45 — лише одна свічка в останньому кошику
@@ -0,0 +1,123 @@
+import inspect
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import bar_cache, commands_analysis, feature_store, warehouse
+from app.feature_store import FeatureStore, feature_version
+
+DATE = "2024-03-05"
+
+
+@pytest.fixture(autouse=True)
+def fresh_version():
+    feature_version.cache_clear()
+    yield
+    feature_version.cache_clear()
+
+
+@pytest.mark.parametrize("module", [bar_cache, warehouse])
+def test_version_follows_bar_building_code(module, monkeypatch):
+    before = feature_version()
+    feature_version.cache_clear()
+    original = inspect.getsource
+
+    def edited(obj):
+        return original(obj) + ("\n# змінено" if obj is module else "")
+
+    monkeypatch.setattr(feature_store.inspect, "getsource", edited)
+    assert feature_version() != before
+
+
+def test_entries_of_an_old_version_are_dropped_on_open(tmp_path, monkeypatch):
+    path = str(tmp_path / "features.db")
+    monkeypatch.setattr(feature_store, "feature_version", lambda: "old")
+    FeatureStore(path).put("AAPL", DATE, "1d", "bars")
+    assert FeatureStore(path).get("AAPL", DATE, "1d") == "bars"
+
+    monkeypatch.setattr(feature_store, "feature_version", lambda: "new")
+    store = FeatureStore(path)
+    assert store.get("AAPL", DATE, "1d") is None
+    assert store._conn().execute("SELECT COUNT(*) FROM features").fetchone()[0] == 0
+
+
+def test_compute_runs_once_and_empty_results_are_not_stored(tmp_path):
+    store = FeatureStore(str(tmp_path / "features.db"))
+    calls = []
+
+    def compute(value):
+        def fn():
+            calls.append(value)
+            return value
+        return fn
+
+    assert store.get_or_compute("AAPL", DATE, "1d", compute("bars")) == "bars"
+    assert store.get_or_compute("AAPL", DATE, "1d", compute("other")) == "bars"
+    assert store.get_or_compute("MSFT", DATE, "1d", compute("")) == ""
+    assert store.get_or_compute("MSFT", DATE, "1d", compute("")) == ""
+    assert calls == ["bars", "", ""]
+
+
+def test_rejected_results_are_not_stored(tmp_path):
+    store = FeatureStore(str(tmp_path / "features.db"))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"sessions": 20}
+
+    for _ in range(2):
+        store.get_or_compute("AAPL", DATE, "1d", compute, storable=lambda value: value["sessions"] == 21)
+    assert len(calls) == 2
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    """_run_analysis зі сховищем ознак у tmp_path і підміненими джерелами даних та LLM."""
+    store = FeatureStore(str(tmp_path / "features.db"))
+    source = {"version": "a", "sessions": commands_analysis.DAILY_SESSIONS}
+    fetched = []
+
+    def bars(ticker, multiplier, timespan, sessions, end_date):
+        if timespan == "day":
+            fetched.append(source["version"])
+            n = source["sessions"]
+        else:
+            n = 10
+        t = np.arange(n, dtype=np.float64) * 86_400_000
+        return np.column_stack((t, np.ones((n, 4)) * 10, np.ones(n)))
+
+    monkeypatch.setattr(commands_analysis, "get_feature_store", lambda: store)
+    monkeypatch.setattr(commands_analysis, "fetch_market_bars", bars)
+    monkeypatch.setattr(commands_analysis, "daily_source_version", lambda ticker, sessions, end_date: source["version"])
+    monkeypatch.setattr(commands_analysis, "fetch_financial_prompt", lambda ticker, filing_date_to: "AAPL|fundamentals")
+    monkeypatch.setattr(commands_analysis, "analyze_ticker", lambda *args, **kwargs: SimpleNamespace(result={}))
+    monkeypatch.setattr(commands_analysis, "update_history", lambda *args: None)
+
+    def run():
+        commands_analysis._run_analysis("gpt", "analyze", "AAPL", DATE, user_id=1)
+
+    return run, source, fetched
+
+
+def test_daily_window_with_missing_sessions_is_not_stored(analysis):
+    run, source, fetched = analysis
+    source["sessions"] -= 1
+    run()
+    run()
+    assert len(fetched) == 2
+
+    source["sessions"] += 1
+    run()
+    run()
+    assert len(fetched) == 3
+
+
+def test_reingested_warehouse_invalidates_stored_daily_part(analysis):
+    run, source, fetched = analysis
+    run()
+    run()
+    source["version"] = "b"
+    run()
+    assert fetched == ["a", "b"]
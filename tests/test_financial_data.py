@@ -0,0 +1,101 @@
+import copy
+
+import pytest
+
+from app import financial_data
+from app.financial_data import CURATED_METRICS, extract_fundamentals, format_fundamentals
+from bench.stubs import synthetic_financials
+
+
+@pytest.fixture
+def quarters():
+    """Q1 2025 і Q4 2024 зі стабу Polygon financials."""
+    return copy.deepcopy(synthetic_financials("AAPL", limit=2)["results"])
+
+
+def value(item, section, key):
+    return item["financials"][section][key]["value"]
+
+
+def fields(line):
+    return [part.split(":", 1)[0] for part in line.split("|")[3:]]
+
+
+def test_qualified_keys_do_not_collide(quarters):
+    current = quarters[0]
+    # Однакова назва метрики в різних розділах звіту
+    current["financials"]["income_statement"]["equity"] = {"value": 1}
+    summary = extract_fundamentals(current)
+
+    assert summary["bs.equity"] == value(current, "balance_sheet", "equity")
+    assert "equity" not in summary and "is.equity" not in summary
+    prefixed = [key for key in summary if "." in key]
+    assert len(prefixed) == len(set(prefixed)) == len(CURATED_METRICS)
+
+
+def test_qoq_against_prior_quarter(quarters):
+    current, prior = quarters
+    summary = extract_fundamentals(current, prior)
+    revenue, prior_revenue = value(current, "income_statement", "revenues"), value(prior, "income_statement", "revenues")
+    assert summary["revenue_qoq"] == round((revenue - prior_revenue) / prior_revenue * 100, 2)
+
+
+def test_missing_prior_quarter_gives_no_qoq(quarters):
+    summary = extract_fundamentals(quarters[0])
+    assert summary["revenue_qoq"] is None and summary["net_income_qoq"] is None and summary["eps_qoq"] is None
+    assert summary["gross_margin"] is not None
+
+
+def test_zero_revenue_leaves_margins_empty(quarters):
+    current = quarters[0]
+    current["financials"]["income_statement"]["revenues"]["value"] = 0
+    summary = extract_fundamentals(current, quarters[1])
+    assert summary["gross_margin"] is None and summary["net_margin"] is None and summary["ocf_margin"] is None
+    assert summary["revenue_qoq"] == -100.0
+    assert "gross_margin:na" in format_fundamentals("AAPL", current, summary).split("|")
+
+
+def test_line_schema_is_fixed(quarters):
+    full = format_fundamentals("AAPL", quarters[0], extract_fundamentals(*quarters))
+    empty = format_fundamentals("AAPL", {}, extract_fundamentals({}))
+
+    assert full.startswith("AAPL|2025-03-31|Q1 2025|is.revenues:")
+    assert fields(full) == fields(empty)
+    assert empty.split("|")[:3] == ["AAPL", "", ""]
+    assert all(part.endswith(":na") for part in empty.split("|")[3:])
+
+
+def test_fmt_value_abbreviates():
+    assert financial_data._fmt_value(12_345_000_000) == "12.3B"
+    assert financial_data._fmt_value(-450_100_000) == "-450.1M"
+    assert financial_data._fmt_value(0.45) == "0.45"
+
+
+def prompt_with(results, monkeypatch):
+    monkeypatch.setattr(financial_data, "_request_financials", lambda params: results)
+    return dict(part.split(":", 1) for part in financial_data.fetch_financial_prompt("AAPL").split("|")[3:])
+
+
+def test_prior_quarter_is_matched_by_fiscal_period(quarters, monkeypatch):
+    current, prior = quarters
+    annual = {**copy.deepcopy(prior), "fiscal_period": "FY", "end_date": "2024-12-31"}
+    annual["financials"]["income_statement"]["revenues"]["value"] = 1
+    # За датою подання другим іде річний звіт, а не попередній квартал
+    line = prompt_with([current, annual, prior], monkeypatch)
+    assert line["revenue_qoq"] == financial_data._fmt_value(extract_fundamentals(current, prior)["revenue_qoq"])
+
+
+def test_prior_quarter_falls_back_to_end_date(quarters, monkeypatch):
+    current, prior = quarters
+    for item in quarters:
+        del item["fiscal_period"], item["fiscal_year"]
+    assert financial_data._prior_quarter(current, [prior]) is prior
+    assert prompt_with([current, prior], monkeypatch)["revenue_qoq"] != "na"
+
+
+def test_skipped_quarter_gives_no_qoq(quarters, monkeypatch):
+    current, older = quarters
+    older.update(fiscal_period="Q3", end_date="2024-09-30")
+    assert financial_data._prior_quarter(current, [older]) is None
+    line = prompt_with([current, older], monkeypatch)
+    assert line["revenue_qoq"] == line["net_income_qoq"] == line["eps_qoq"] == "na"
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import gemini_handler
+from app.gemini_handler import GeminiProvider
+from app.llm_provider import PromptParts
+
+
+class FakeGemini:
+    """Замінник клієнта google-genai: запам'ятовує створені кеші та конфіги запитів."""
+
+    def __init__(self):
+        self.created = []
+        self.configs = []
+        self.caches = SimpleNamespace(create=self._create)
+        self.models = SimpleNamespace(generate_content=self._generate)
+
+    def _create(self, model, config):
+        self.created.append(model)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    def _generate(self, model, contents, config):
+        self.configs.append(config)
+        cached = 5000 if "cached_content" in config else None
+        meta = SimpleNamespace(prompt_token_count=6000, candidates_token_count=10,
+                               cached_content_token_count=cached)
+        return SimpleNamespace(text="{}", usage_metadata=meta)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(gemini_handler, "clientGemini", fake)
+    return fake
+
+
+def test_short_prefix_is_sent_uncached_and_counted(client):
+    provider = GeminiProvider()
+    provider._complete(PromptParts("short prefix ", "body", ("p", "w")), "gemini-2.0-flash", "single")
+    assert client.created == []
+    assert "cached_content" not in client.configs[0]
+    assert provider.context_cache_stats() == {"cached": 0, "skipped": 1, "cached_tokens": 0}
+
+
+def test_model_without_explicit_caching_is_skipped(client):
+    provider = GeminiProvider()
+    prompt = PromptParts("x" * 40_000, "body", ("p", "w"))
+    provider._complete(prompt, "gemini-2.0-flash-lite", "single")
+    assert client.created == []
+    assert provider.context_cache_stats()["skipped"] == 1
+
+
+def test_long_prefix_creates_one_cache_per_version(client):
+    provider = GeminiProvider()
+    prompt = PromptParts("x" * 20_000, "body", ("p", "w"))  # ~5000 токенів
+    for _ in range(2):
+        provider._complete(prompt, "gemini-2.0-flash", "single")
+    assert client.created == ["gemini-2.0-flash"]
+    assert [c.get("cached_content") for c in client.configs] == ["cachedContents/1"] * 2
+    assert provider.context_cache_stats() == {"cached": 2, "skipped": 0, "cached_tokens": 10_000}
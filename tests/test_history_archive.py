@@ -0,0 +1,81 @@
+import gzip
+from datetime import date
+
+import pytest
+
+from app import history_archive
+from app.history_store import HistoryStore
+
+TODAY = date(2024, 9, 1)
+
+
+@pytest.fixture
+def store(workdir, monkeypatch):
+    store = HistoryStore(str(workdir / "history.db"))
+    monkeypatch.setattr(history_archive, "get_store", lambda: store)
+    monkeypatch.setattr(history_archive, "ARCHIVE_DIR", workdir / "archive")
+    return store
+
+
+def add(store, ticker, day, created_at, **result):
+    row_id = store.record(ticker, day, {"ticker": ticker, "probability_value": 60, "confidence": 5, **result},
+                          provider="gpt")
+    store._conn().execute("UPDATE analyses SET created_at = ? WHERE id = ?", (created_at, row_id))
+    return row_id
+
+
+def remaining(store):
+    return sorted(r["ticker"] for r in store.query(limit=100)[0])
+
+
+def test_retention_follows_when_the_analysis_was_recorded(store):
+    add(store, "OLD", "2024-01-10", "2024-01-10T09:00:00")
+    # Прогноз на давню дату, зроблений нещодавно (бектест) — лишається в таблиці
+    add(store, "BACKTEST", "2024-01-10", "2024-08-30T12:00:00")
+    add(store, "EDGE", "2024-03-04", "2024-03-05T00:00:00")
+
+    assert history_archive.archive(180, today=TODAY) == 1
+    assert remaining(store) == ["BACKTEST", "EDGE"]
+    assert [r["ticker"] for r in history_archive.read_archive()] == ["OLD"]
+
+
+def test_archive_is_append_only_and_slims_results(store):
+    add(store, "AAPL", "2024-01-10", "2024-01-10T09:00:00", recommendation="x" * 5000,
+        justification="j" * 1000)
+    history_archive.archive(180, today=TODAY)
+    add(store, "MSFT", "2024-01-20", "2024-01-20T09:00:00")
+    history_archive.archive(180, today=TODAY)
+
+    records = list(history_archive.read_archive(date_from="2024-01-01", date_to="2024-01-31"))
+    assert [r["ticker"] for r in records] == ["AAPL", "MSFT"]
+    assert "recommendation" not in records[0]["result"]
+    assert len(records[0]["result"]["justification"]) == history_archive.SLIM_TEXT_LIMIT
+    # Два переноси — два gzip-члени, що читаються як один потік
+    raw = history_archive.shard_path("2024-01").read_bytes()
+    assert raw.count(b"\x1f\x8b\x08") >= 2
+    assert len(gzip.decompress(raw).splitlines()) == 2
+
+
+def test_read_archive_skips_repeated_ids_and_filters(store):
+    add(store, "AAPL", "2024-01-10", "2024-01-10T09:00:00")
+    add(store, "MSFT", "2024-02-10", "2024-02-10T09:00:00")
+    rows = [dict(r) for r in store._conn().execute("SELECT * FROM analyses")]
+    history_archive.archive(180, today=TODAY)
+    # Збій після запису архіву, але до видалення: той самий рядок дописується вдруге
+    history_archive._append_shard("2024-01", [history_archive._archive_record(rows[0])])
+
+    assert [r["ticker"] for r in history_archive.read_archive()] == ["AAPL", "MSFT"]
+    assert [r["ticker"] for r in history_archive.read_archive(date_from="2024-02-01")] == ["MSFT"]
+    assert list(history_archive.read_archive(ticker="AAPL", provider="gemini")) == []
+
+
+def test_compact_archive_keeps_latest_with_earlier_feedback(store):
+    add(store, "AAPL", "2024-01-10", "2024-01-10T09:00:00", probability_value=40)
+    store.set_feedback("AAPL", "2024-01-10", "success")
+    add(store, "AAPL", "2024-01-10", "2024-01-10T10:00:00", probability_value=70)
+    history_archive.archive(180, today=TODAY)
+
+    assert history_archive.compact_archive("2024-01") == 1
+    (record,) = history_archive.read_archive()
+    assert record["result"]["probability_value"] == 70
+    assert record["feedback"] == "success"
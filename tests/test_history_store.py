@@ -0,0 +1,76 @@
+import pytest
+
+from app.history_store import HistoryStore
+
+
+def result(ticker, probability):
+    return {"ticker": ticker, "probability_value": probability, "confidence": 5}
+
+
+@pytest.fixture
+def store(workdir):
+    store = HistoryStore(str(workdir / "history.db"))
+    for day in ("2024-03-01", "2024-03-02", "2024-03-03"):
+        for ticker in ("AAPL", "MSFT", "NVDA"):
+            store.record(ticker, day, result(ticker, 50), provider="gpt" if ticker != "NVDA" else "gemini")
+    return store
+
+
+def all_pages(store, **filters):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = store.query(cursor=cursor, limit=4, **filters)
+        pages.append([(r["date"], r["ticker"]) for r in rows])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_row_once_newest_first(store):
+    pages = all_pages(store)
+    assert [len(p) for p in pages] == [4, 4, 1]
+    rows = [row for page in pages for row in page]
+    assert len(set(rows)) == 9
+    assert [d for d, _ in rows] == sorted((d for d, _ in rows), reverse=True)
+    # У межах дати новіші (більший id) першими
+    assert rows[:3] == [("2024-03-03", "NVDA"), ("2024-03-03", "MSFT"), ("2024-03-03", "AAPL")]
+
+
+def test_exact_page_boundary_has_no_empty_last_page(store):
+    rows, cursor = store.query(ticker="AAPL", limit=3)
+    assert len(rows) == 3 and cursor is None
+
+
+def test_rows_added_while_paging_do_not_shift_later_pages(store):
+    first, cursor = store.query(limit=4)
+    store.record("TSLA", "2024-03-03", result("TSLA", 70), provider="gpt")
+    rest = []
+    while cursor:
+        rows, cursor = store.query(cursor=cursor, limit=4)
+        rest += rows
+    seen = [r["id"] for r in first + rest]
+    assert len(seen) == len(set(seen)) == 9
+
+
+def test_filters_combine_with_cursor(store):
+    pages = all_pages(store, provider="gpt", date_from="2024-03-02")
+    rows = [row for page in pages for row in page]
+    assert rows == [("2024-03-03", "MSFT"), ("2024-03-03", "AAPL"), ("2024-03-02", "MSFT"), ("2024-03-02", "AAPL")]
+
+
+def test_next_page_is_an_index_range_not_a_scan(store):
+    conn = store._conn()
+    plan = " ".join(r["detail"] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM analyses WHERE ticker = ? AND (date < ? OR (date = ? AND id < ?))"
+        " ORDER BY date DESC, id DESC LIMIT 21", ("AAPL", "2024-03-03", "2024-03-03", 100)))
+    assert "analyses_ticker_date" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_feedback_goes_to_latest_analysis_and_compact_keeps_it(store):
+    store.record("AAPL", "2024-03-03", result("AAPL", 80), provider="gpt")
+    assert store.set_feedback("AAPL", "2024-03-03", "success")
+    assert store.compact() == 1
+    rows, _ = store.query(ticker="AAPL", date_from="2024-03-03")
+    assert len(rows) == 1
+    assert rows[0]["probability"] == 80 and rows[0]["feedback"] == "success"
+    assert store.aggregates(ticker="AAPL")[0]["hit_rate"] == 1.0
@@ -0,0 +1,92 @@
+import asyncio, json
+
+import numpy as np
+
+from app import chart_data, live_bars
+from app.bar_cache import MINUTE_MS, MinuteBarCache
+from app.live_bars import LiveBarService
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_least_recently_used_ticker_is_evicted():
+    service = LiveBarService(capacity=10, max_tickers=2)
+    assert service.watch(["aapl", "msft"]) == ["AAPL", "MSFT"]
+    service.window("AAPL", 0, 1)  # звернення робить AAPL свіжішим за MSFT
+    assert service.watch(["NVDA"]) == ["NVDA"]
+    assert service.is_watched("AAPL") and service.is_watched("NVDA")
+    assert not service.is_watched("MSFT")
+
+
+def test_tickers_of_one_call_do_not_evict_each_other():
+    service = LiveBarService(capacity=10, max_tickers=2)
+    assert service.watch(["A", "B", "C"]) == ["A", "B"]
+
+
+def test_evicted_tickers_are_unsubscribed():
+    service = LiveBarService(capacity=10, max_tickers=1)
+    service.watch(["AAPL"])
+    ws = FakeWS()
+    service._ws = ws
+    asyncio.run(service._resubscribe(["MSFT"], ["AAPL"]))
+    assert ws.sent == [{"action": "unsubscribe", "params": "AM.AAPL"},
+                       {"action": "subscribe", "params": "AM.MSFT"}]
+
+
+def test_only_one_process_holds_the_stream(workdir, monkeypatch):
+    first, second = LiveBarService(), LiveBarService()
+    assert first.acquire_lease()
+    assert not second.acquire_lease()
+    assert first.acquire_lease()  # продовження власної оренди
+
+    first.release_lease()
+    assert second.acquire_lease()
+
+    # Оренда процесу, що завершився без звільнення, спливає
+    monkeypatch.setattr(live_bars, "LIVE_LEASE_SECONDS", -1)
+    assert second.acquire_lease()
+    assert first.acquire_lease()
+
+
+def test_subscription_seeds_history_up_to_the_first_live_bar(monkeypatch):
+    cache = MinuteBarCache()
+    monkeypatch.setattr(chart_data, "minute_cache", cache)
+    tail_requests = []
+
+    def minutes(start_ms, end_ms):
+        t = np.arange(start_ms // MINUTE_MS * MINUTE_MS, end_ms + 1, MINUTE_MS, dtype=np.float64)
+        t = t[t >= start_ms]
+        return np.column_stack((t, t, t, t, t, np.ones(len(t))))
+
+    def ensure(ticker, start_ms, end_ms, covered_until=None):
+        cache.put(ticker, minutes(start_ms, end_ms), start_ms, end_ms)
+
+    def aggregates(ticker, multiplier, timespan, start_ms, end_ms):
+        tail_requests.append((start_ms, end_ms))
+        return minutes(start_ms, end_ms)
+
+    monkeypatch.setattr(chart_data, "_ensure_minutes", ensure)
+    monkeypatch.setattr(chart_data, "_get_aggregates", aggregates)
+    seeded = []
+    seed = chart_data.live_seed
+    monkeypatch.setattr(chart_data, "live_seed", lambda ticker, until: seeded.append(until) or seed(ticker, until))
+
+    service = LiveBarService()
+    service.watch(["AAPL"])
+    service._ws = FakeWS()
+    service.connected = True
+    asyncio.run(service._subscribe(["AAPL"]))
+
+    (since,) = seeded
+    assert service._buffers["AAPL"].covered_from < since - 60 * MINUTE_MS
+    # Останні 15 хвилин до підписки — з REST, без очікування покриття кешем
+    assert tail_requests and tail_requests[0][1] > since - 15 * MINUTE_MS
+    bars = service.window("AAPL", since - 30 * MINUTE_MS, since + MINUTE_MS)
+    assert bars is not None
+    assert np.all(np.diff(bars[:, 0]) == MINUTE_MS) and bars[-1, 0] == since - MINUTE_MS
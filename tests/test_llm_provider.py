@@ -0,0 +1,75 @@
+import threading, time
+
+import pytest
+
+from app import llm_provider, usage_manager
+from app.llm_provider import LLMProvider, PromptParts, parse_single
+
+RESPONSE = ('{"analysis": [{"ticker": "AAPL", "probability_value": 60, "confidence": 5,'
+            ' "justification": "j", "fundamental_impact": "f"}]}')
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name: str, delay: float, tokens: int):
+        super().__init__(f"{name}-model")
+        self.name = name
+        self.delay = delay
+        self.tokens = tokens
+        self.calls = 0
+
+    def _complete(self, prompt, model, kind):
+        self.calls += 1
+        time.sleep(self.delay)
+        return RESPONSE, self.tokens, 0
+
+
+@pytest.fixture
+def providers(workdir, monkeypatch):
+    slow, fast = FakeProvider("slow", 0.5, 1000), FakeProvider("fast", 0.01, 10)
+    monkeypatch.setattr(llm_provider, "_providers", {"slow": slow, "fast": fast})
+    monkeypatch.setattr(llm_provider, "HEDGE_PARTNERS", {"slow": "fast"})
+    monkeypatch.setattr(llm_provider, "HEDGE_DEFAULT_DELAY", 0.05)
+    return slow, fast
+
+
+def _run(user_id=7):
+    prompt = PromptParts("prefix ", "body", ("p", "w"))
+    return llm_provider.run_hedged("slow", prompt, "single", parse_single, user_id, "test")
+
+
+def _user_tokens(user_id) -> int:
+    return usage_manager.get_usage_totals(user_id)["daily"]
+
+
+def test_hedge_winner_is_charged_and_loser_is_not(providers):
+    slow, fast = providers
+    outcome = _run()
+    assert outcome.provider == "fast"
+
+    # Програлий запит завершується у фоні; чекаємо, поки він запише свої токени
+    deadline = time.monotonic() + 2
+    while _user_tokens(llm_provider.HEDGE_ACCOUNT) == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert _user_tokens(7) == 10
+    assert _user_tokens(llm_provider.HEDGE_ACCOUNT) == 1000
+    assert usage_manager._load_usage()["users"]["7"]["reserved"] == {}
+
+
+def test_hedges_are_capped(providers, monkeypatch):
+    slow, fast = providers
+    monkeypatch.setattr(llm_provider, "_hedge_slots", threading.BoundedSemaphore(1))
+    llm_provider._hedge_slots.acquire()
+
+    outcome = _run()
+    assert outcome.provider == "slow"
+    assert fast.calls == 0
+    assert _user_tokens(7) == 1000
+
+
+def test_loser_makes_no_new_attempts_after_winner():
+    race = llm_provider.HedgeRace()
+    assert race.claim("fast")
+    provider = FakeProvider("slow", 0, 1)
+    with pytest.raises(llm_provider.AnalysisError):
+        provider.run(PromptParts("p", "b", ("p", "w")), "single", parse_single, race=race)
+    assert provider.calls == 0
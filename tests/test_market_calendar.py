@@ -0,0 +1,77 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app import market_calendar as cal
+from app.market_calendar import NY_TZ
+
+
+@pytest.mark.parametrize("year, expected", [
+    (2023, {date(2023, 1, 2), date(2023, 1, 16), date(2023, 2, 20), date(2023, 4, 7), date(2023, 5, 29),
+            date(2023, 6, 19), date(2023, 7, 4), date(2023, 9, 4), date(2023, 11, 23), date(2023, 12, 25)}),
+    (2024, {date(2024, 1, 1), date(2024, 1, 15), date(2024, 2, 19), date(2024, 3, 29), date(2024, 5, 27),
+            date(2024, 6, 19), date(2024, 7, 4), date(2024, 9, 2), date(2024, 11, 28), date(2024, 12, 25)}),
+    (2025, {date(2025, 1, 1), date(2025, 1, 9), date(2025, 1, 20), date(2025, 2, 17), date(2025, 4, 18),
+            date(2025, 5, 26), date(2025, 6, 19), date(2025, 7, 4), date(2025, 9, 1), date(2025, 11, 27),
+            date(2025, 12, 25)}),
+])
+def test_holidays_match_published_nyse_calendar(year, expected):
+    assert cal.holidays(year) == expected
+
+
+@pytest.mark.parametrize("year, expected", [
+    (2022, {date(2022, 11, 25)}),                                         # 3 липня і 24 грудня — вихідні
+    (2023, {date(2023, 7, 3), date(2023, 11, 24)}),
+    (2024, {date(2024, 7, 3), date(2024, 11, 29), date(2024, 12, 24)}),
+    (2025, {date(2025, 7, 3), date(2025, 11, 28), date(2025, 12, 24)}),
+])
+def test_early_closes(year, expected):
+    assert cal.early_closes(year) == expected
+
+
+def test_weekend_holidays_are_observed_on_adjacent_weekdays():
+    assert not cal.is_session(date(2022, 6, 20))    # Juneteenth у неділю → понеділок
+    assert not cal.is_session(date(2022, 12, 26))   # Різдво в неділю → понеділок
+    assert not cal.is_session(date(2026, 7, 3))     # 4 липня в суботу → п'ятниця
+    # Новий рік у суботу не забирає 31 грудня попереднього року
+    assert cal.is_session(date(2021, 12, 31))
+
+
+def test_early_close_bounds_and_minutes():
+    open_, close = cal.session_bounds(date(2024, 11, 29))
+    assert (open_.hour, open_.minute, close.hour) == (9, 30, 13)
+    assert cal.close_minute(date(2024, 11, 29)) == 780
+    assert cal.close_minute(date(2024, 11, 27)) == 960
+
+
+def test_session_bounds_follow_daylight_saving():
+    before = cal.session_bounds(date(2024, 3, 8))[0].astimezone(timezone.utc)
+    after = cal.session_bounds(date(2024, 3, 11))[0].astimezone(timezone.utc)
+    assert (before.hour, after.hour) == (14, 13)
+
+
+def test_sessions_back_crosses_holidays_and_years():
+    assert cal.sessions_back(date(2024, 1, 3), 4) == [
+        date(2023, 12, 28), date(2023, 12, 29), date(2024, 1, 2), date(2024, 1, 3)]
+    # Кінець у вихідний — беруться сесії до нього
+    assert cal.sessions_back(date(2024, 3, 31), 2) == [date(2024, 3, 27), date(2024, 3, 28)]
+
+
+def test_sessions_between_and_neighbours():
+    assert cal.sessions_between(date(2024, 3, 28), date(2024, 4, 2)) == [
+        date(2024, 3, 28), date(2024, 4, 1), date(2024, 4, 2)]
+    assert cal.sessions_between(date(2024, 3, 30), date(2024, 3, 31)) == []
+    assert cal.previous_session(date(2024, 4, 1)) == date(2024, 3, 28)
+    assert cal.previous_session(date(2024, 4, 1), inclusive=True) == date(2024, 4, 1)
+    assert cal.next_session(date(2024, 12, 31)) == date(2025, 1, 2)
+    assert cal.next_session(date(2024, 12, 25), inclusive=True) == date(2024, 12, 26)
+
+
+def test_window_end_on_holiday_moves_to_previous_close():
+    good_friday = datetime(2024, 3, 29, 9, 45, tzinfo=NY_TZ)
+    end = cal.last_session_end(good_friday)
+    assert end == datetime(2024, 3, 28, 16, 0, tzinfo=NY_TZ)
+    assert cal.window_start(end, 3) == datetime(2024, 3, 26, 0, 0, tzinfo=NY_TZ)
+    # Робочий день не змінюється
+    monday = datetime(2024, 4, 1, 9, 45, tzinfo=NY_TZ)
+    assert cal.last_session_end(monday) == monday
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import BULK, INTERACTIVE, QueueFullError, Scheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def job(order, name, delay=0.01):
+    async def fn():
+        order.append(name)
+        await asyncio.sleep(delay)
+        return name
+    return fn
+
+
+def test_users_are_served_round_robin_within_a_lane():
+    async def main():
+        scheduler = Scheduler(max_workers=1, per_user_limit=1)
+        order = []
+        tasks = [asyncio.ensure_future(scheduler.submit("a", BULK, job(order, f"a{i}"))) for i in range(4)]
+        tasks += [asyncio.ensure_future(scheduler.submit("b", BULK, job(order, f"b{i}"))) for i in range(2)]
+        await asyncio.gather(*tasks)
+        return order
+
+    # a0 стартує одразу, a1 стоїть у черзі раніше за b; далі користувачі чергуються,
+    # і b не чекає на всі задачі a
+    assert run(main()) == ["a0", "a1", "b0", "a2", "b1", "a3"]
+
+
+def test_interactive_lane_goes_before_bulk():
+    async def main():
+        scheduler = Scheduler(max_workers=1, per_user_limit=5)
+        order = []
+        tasks = [asyncio.ensure_future(scheduler.submit("a", BULK, job(order, f"bulk{i}"))) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(scheduler.submit("b", INTERACTIVE, job(order, "interactive"))))
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["bulk0", "interactive", "bulk1", "bulk2"]
+
+
+def test_per_user_limit_leaves_workers_for_others():
+    async def main():
+        scheduler = Scheduler(max_workers=4, per_user_limit=2)
+        running = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        def tracked(user):
+            async def fn():
+                running[user] += 1
+                peak[user] = max(peak[user], running[user])
+                await asyncio.sleep(0.02)
+                running[user] -= 1
+            return fn
+
+        await asyncio.gather(*(scheduler.submit(u, BULK, tracked(u)) for u in "aaaaab"))
+        return peak
+
+    assert run(main()) == {"a": 2, "b": 1}
+
+
+def test_full_queue_rejects_new_jobs():
+    async def main():
+        scheduler = Scheduler(max_workers=1, max_queue=2, per_user_limit=1)
+        order = []
+        tasks = [asyncio.ensure_future(scheduler.submit("a", BULK, job(order, i, 0.05))) for i in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await scheduler.submit("b", INTERACTIVE, job(order, "late"))
+        await asyncio.gather(*tasks)
+
+    run(main())
+
+
+def test_errors_are_returned_to_the_caller_and_slots_are_freed():
+    async def main():
+        scheduler = Scheduler(max_workers=1)
+
+        async def boom():
+            raise ValueError("boom")
+
+        results = await scheduler.submit_many("a", BULK, [boom, job([], "ok")])
+        return results, scheduler.stats()
+
+    results, stats = run(main())
+    assert isinstance(results[0], ValueError) and results[1] == "ok"
+    assert stats["running"] == 0 and stats["queued"] == 0
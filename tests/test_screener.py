@@ -0,0 +1,115 @@
+import time
+from datetime import datetime, time as dtime, timezone
+
+import numpy as np
+import pytest
+
+from app import screener, warehouse
+from bench.stubs import synthetic_grouped, synthetic_snapshot
+
+NOW = datetime(2024, 3, 6, 14, 0, tzinfo=timezone.utc)
+UNIVERSE = ["AAPL", "AMD", "MSFT", "NVDA", "TSLA"]
+
+
+def panel_of(rows):
+    """Панель (sessions, tickers, 6) з рядків {тикер: (h, l, c, v)} по днях; відсутній тикер — NaN."""
+    tickers = sorted({t for day in rows for t in day})
+    panel = np.full((len(rows), len(tickers), 6), np.nan)
+    for i, day in enumerate(rows):
+        for ticker, (h, l, c, v) in day.items():
+            panel[i, tickers.index(ticker), 2:] = (h, l, c, v)
+    return np.array(tickers), panel
+
+
+def test_snapshot_arrays_follow_synthetic_snapshot():
+    items = synthetic_snapshot(NOW, UNIVERSE[::-1])
+    del items[0]["lastTrade"]             # TSLA: ціна з хвилинної свічки
+    items[1]["prevDay"] = {}               # NVDA: без попереднього дня
+    tickers, price, prev_close, volume = screener.snapshot_arrays(items)
+
+    assert tickers.tolist() == UNIVERSE
+    by_ticker = {item["ticker"]: item for item in items}
+    assert price.tolist() == [by_ticker[t]["min"]["c"] for t in UNIVERSE]
+    assert volume.tolist() == [by_ticker[t]["day"]["v"] for t in UNIVERSE]
+    assert np.isnan(prev_close[UNIVERSE.index("NVDA")])
+    assert prev_close[0] == by_ticker["AAPL"]["prevDay"]["c"]
+
+
+def test_metrics_on_a_hand_computed_panel():
+    panel_tickers, panel = panel_of([
+        {"AAA": (11, 9, 10, 100)},
+        {"AAA": (12, 10, 11, 200), "BBB": (21, 19, 20, 1000)},
+        {"AAA": (13, 10, 12, 300), "BBB": (22, 18, 19, 3000)},
+    ])
+    tickers = np.array(["AAA", "BBB", "CCC"])
+    price = np.array([12.6, 20.5, 11.0])
+    prev_close = np.array([12.0, np.nan, 10.0])
+    volume = np.array([400.0, 1000.0, 50.0])
+    m = screener.compute_metrics(tickers, price, prev_close, volume, panel_tickers, panel)
+
+    # AAA: TR = 2, 2, 3 → ATR 7/3; середній обсяг 200
+    assert m["gap"][0] == pytest.approx(5.0)
+    assert m["rvol"][0] == pytest.approx(2.0)
+    assert m["atr"][0] == pytest.approx(0.6 / (7 / 3))
+    assert m["score"][0] == pytest.approx(0.6 / (7 / 3) * np.sqrt(2))
+    # BBB: prevDay немає — попереднє закриття 19 з панелі; TR = 2, 4 → ATR 3
+    assert m["gap"][1] == pytest.approx(1.5 / 19 * 100)
+    assert m["atr"][1] == pytest.approx(0.5)
+    assert m["rvol"][1] == pytest.approx(0.5)
+    # CCC немає в панелі: геп рахується, решта — NaN
+    assert m["gap"][2] == pytest.approx(10.0)
+    assert np.isnan([m["rvol"][2], m["atr"][2], m["score"][2], m["avg_volume"][2]]).all()
+
+
+def test_metrics_without_history():
+    m = screener.compute_metrics(np.array(["AAA"]), np.array([11.0]), np.array([np.nan]), np.array([1.0]),
+                                 np.empty(0, dtype=str), np.empty((0, 0, 6)))
+    assert np.isnan(m["gap"][0]) and np.isnan(m["score"][0])
+
+
+@pytest.fixture
+def market(tmp_path, monkeypatch):
+    """Сховище з synthetic_grouped і snapshot з synthetic_snapshot для UNIVERSE."""
+    monkeypatch.setattr(warehouse, "WAREHOUSE_DIR", tmp_path / "daily")
+    monkeypatch.setattr(warehouse, "_loaded", warehouse.OrderedDict())
+    monkeypatch.setattr(warehouse, "_empty_until", {})
+    monkeypatch.setattr(warehouse, "_splits_state", None)
+    monkeypatch.setattr(warehouse, "_splits", {})
+    monkeypatch.setattr(warehouse, "_request_splits", lambda start, end: [])
+    monkeypatch.setattr(warehouse, "_request_grouped", lambda day: synthetic_grouped(
+        datetime.combine(day, dtime(0), tzinfo=timezone.utc), UNIVERSE))
+    items = synthetic_snapshot(NOW, UNIVERSE)
+    monkeypatch.setattr(screener, "_request_snapshot", lambda: items)
+    return items
+
+
+def test_screen_ranks_and_filters(market):
+    end = screener.market_calendar.previous_session(datetime.now(screener.NY_TZ).date())
+    days = screener.market_calendar.sessions_back(end, screener.LOOKBACK_SESSIONS)
+    warehouse.ingest_days(days)
+
+    rows = screener.screen(sort="gap", top=3, min_avg_volume=0)
+    gaps = [abs(row["gap"]) for row in rows]
+    assert len(rows) == 3 and gaps == sorted(gaps, reverse=True)
+    all_rows = screener.screen(sort="gap", top=10, min_avg_volume=0)
+    assert [row["ticker"] for row in all_rows[:3]] == [row["ticker"] for row in rows]
+    assert sorted(row["ticker"] for row in all_rows) == UNIVERSE
+
+    # Фільтр ціни відкидає тикери, дешевші за поріг
+    cheapest = min(all_rows, key=lambda row: row["price"])
+    filtered = screener.screen(sort="gap", top=10, min_price=cheapest["price"] + 0.01, min_avg_volume=0)
+    assert cheapest["ticker"] not in [row["ticker"] for row in filtered]
+    assert screener.screen(sort="gap", min_avg_volume=10 ** 9) == []
+
+
+def test_screen_does_not_fill_the_warehouse_inline(market):
+    with pytest.raises(warehouse.WarehouseMissError):
+        screener.screen()
+
+    end = screener.market_calendar.previous_session(datetime.now(screener.NY_TZ).date())
+    start = screener.market_calendar.sessions_back(end, screener.LOOKBACK_SESSIONS)[0]
+    deadline = time.monotonic() + 5
+    while warehouse.missing_days(start, end) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert warehouse.missing_days(start, end) == []
+    assert len(screener.screen(min_avg_volume=0)) == len(UNIVERSE)
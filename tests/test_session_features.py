@@ -0,0 +1,87 @@
+from datetime import date, datetime, time
+
+import numpy as np
+
+from app import session_features
+from app.bar_cache import MINUTE_MS, NY_TZ
+from app.session_features import AFTER_HOURS, OUTSIDE, PREMARKET, REGULAR, day_features, features_for, segment
+
+
+def ny_ms(day: date, hh: int, mm: int = 0) -> int:
+    return int(datetime.combine(day, time(hh, mm), tzinfo=NY_TZ).timestamp() * 1000)
+
+
+def flat_bars(day: date, start=(4, 0), end=(20, 0), price=100.0, volume=1.0) -> np.ndarray:
+    """Хвилинні свічки [start, end) за Нью-Йорком з незмінною ціною."""
+    t = np.arange(ny_ms(day, *start), ny_ms(day, *end), MINUTE_MS, dtype=np.float64)
+    n = len(t)
+    return np.column_stack((t, np.full(n, price), np.full(n, price), np.full(n, price), np.full(n, price),
+                            np.full(n, volume)))
+
+
+MONDAY, TUESDAY = date(2024, 3, 4), date(2024, 3, 5)
+
+
+def test_segment_labels_session_boundaries():
+    day = MONDAY
+    times = [(3, 59), (4, 0), (9, 29), (9, 30), (15, 59), (16, 0), (19, 59), (20, 0)]
+    bars = np.array([[ny_ms(day, *hm), 1, 1, 1, 1, 1] for hm in times], dtype=np.float64)
+    labels, days, minute = segment(bars)
+    assert labels.tolist() == [OUTSIDE, PREMARKET, PREMARKET, REGULAR, REGULAR, AFTER_HOURS, AFTER_HOURS, OUTSIDE]
+    assert len(set(days.tolist())) == 1
+    assert minute[3] == 9 * 60 + 30
+
+
+def test_early_close_moves_after_hours_start():
+    day = date(2024, 11, 29)
+    features = day_features(flat_bars(day))
+    assert features["rth_v"] == (13 * 60) - (9 * 60 + 30)
+    assert features["ah_v"] == 7 * 60
+
+
+def test_premarket_gap_and_relative_volume_before_the_open():
+    bars = np.vstack((flat_bars(MONDAY, price=100.0), flat_bars(TUESDAY, end=(9, 0), price=105.0, volume=2.0)))
+    features = day_features(bars)
+    assert features["date"] == "2024-03-05"
+    assert features["prev_close"] == 100.0
+    assert features["rth_o"] is None and features["pm_c"] == 105.0
+    assert features["gap_pct"] == 5.0
+    # Премаркет до 08:59 порівнюється з тим самим проміжком попереднього дня
+    assert features["pm_rvol"] == 2.0
+    assert features["or_h"] is None
+
+
+def test_opening_range_and_gap_use_regular_open():
+    tuesday = flat_bars(TUESDAY, price=110.0)
+    regular = tuesday[:, 0] >= ny_ms(TUESDAY, 9, 30)
+    tuesday[regular, 1] = 108.0
+    first = np.flatnonzero(regular)[:15]
+    tuesday[first, 2] = 112.0
+    tuesday[first, 3] = 107.0
+    bars = np.vstack((flat_bars(MONDAY, price=100.0), tuesday))
+    features = day_features(bars)
+    assert features["gap_pct"] == 8.0
+    assert (features["or_h"], features["or_l"]) == (112.0, 107.0)
+    assert features["or_range_pct"] == round((112 / 107 - 1) * 100, 2)
+
+
+def test_explicit_day_ignores_later_bars():
+    bars = np.vstack((flat_bars(MONDAY), flat_bars(TUESDAY, price=105.0)))
+    monday = day_features(bars, MONDAY)
+    assert monday["date"] == "2024-03-04" and monday["rth_c"] == 100.0
+    assert monday["prev_close"] is None and monday["gap_pct"] is None and monday["pm_rvol"] is None
+    assert day_features(bars, date(2024, 3, 6)) is None
+
+
+def test_features_are_cached_per_last_bar(monkeypatch):
+    monkeypatch.setattr(session_features, "_cache", session_features.OrderedDict())
+    bars = flat_bars(MONDAY)
+    first = features_for("AAPL", bars)
+    assert features_for("AAPL", bars) is first
+    assert features_for("AAPL", bars[:-1]) is not first
+
+
+def test_format_skips_missing_values():
+    line = session_features.format_features({"date": "2024-03-05", "gap_pct": 1.5, "or_h": None})
+    assert line == "date:2024-03-05|gap_pct:1.5"
+    assert session_features.format_features(None) == ""
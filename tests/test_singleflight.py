@@ -0,0 +1,129 @@
+import asyncio, threading, time
+
+import pytest
+
+from app.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_with_same_key_run_once():
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def fn():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    assert flight.shared == 4
+
+
+def test_error_is_shared_and_key_is_released():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait()
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # Після завершення ключ вільний: наступний виклик виконує функцію заново
+    assert flight.do("k", lambda: 42) == 42
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight("test")
+    assert [flight.do(k, lambda k=k: k) for k in ("a", "b")] == ["a", "b"]
+    assert flight.shared == 0
+
+
+def test_async_waiters_share_one_task():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["done"] * 3
+    assert calls == [1]
+    assert flight.shared == 2
+
+
+def test_async_cancelled_waiter_does_not_cancel_shared_task():
+    flight = AsyncSingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("k", work))
+        second = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_analysis_key_is_computed_off_the_event_loop(monkeypatch):
+    from types import SimpleNamespace
+
+    from app import commands_analysis
+
+    threads = []
+
+    def key(*args):
+        threads.append(threading.current_thread())
+        return args
+
+    monkeypatch.setattr(commands_analysis, "analysis_key", key)
+    monkeypatch.setattr(commands_analysis, "check_analysis_budget", lambda *args: None)
+    monkeypatch.setattr(commands_analysis, "_run_analysis", lambda *args: {"ticker": "AAPL"})
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=reply_text), effective_user=SimpleNamespace(id=1))
+    context = SimpleNamespace(args=["aapl", "2024-03-05"])
+    asyncio.run(commands_analysis.make_analyze_command("gpt", "analyze_gpt")(update, context))
+
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+    assert "AAPL" in replies[-1]
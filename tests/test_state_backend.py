@@ -0,0 +1,111 @@
+import asyncio, multiprocessing, threading
+
+import pytest
+
+from app import state_backend
+from app.state_backend import Document, RedisBackend, SQLiteBackend
+from bench import resp_stub
+
+THREADS = 8
+INCREMENTS = 25
+
+
+@pytest.fixture
+def redis_url():
+    """Заглушка RESP у фоновому потоці зі своїм event loop."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(resp_stub.serve(port=0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{port}/0"
+
+    async def shutdown():
+        server.close()
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "state.db"))
+    else:
+        backend = RedisBackend(request.getfixturevalue("redis_url"))
+    state_backend.set_backend(backend)
+    yield backend
+    state_backend.set_backend(None)
+
+
+def _increment(data):
+    data["n"] = data.get("n", 0) + 1
+
+
+def test_concurrent_updates_are_not_lost(backend):
+    doc = Document("counter", default=dict)
+
+    def worker():
+        for _ in range(INCREMENTS):
+            doc.update(_increment)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert doc.read()["n"] == THREADS * INCREMENTS
+    assert backend.version("counter") == THREADS * INCREMENTS
+
+
+def test_failed_update_leaves_document_unchanged(backend):
+    doc = Document("doc", default=dict)
+    doc.update(lambda data: data.update(a=1))
+
+    def fail(data):
+        data["a"] = 2
+        raise ValueError("abort")
+
+    with pytest.raises(ValueError):
+        doc.update(fail)
+    assert doc.read() == {"a": 1}
+    assert backend.version("doc") == 1
+
+
+def test_cached_copy_is_refreshed_after_another_writer(backend):
+    reader, writer = Document("doc", default=dict), Document("doc", default=dict)
+    writer.update(lambda data: data.update(a=1))
+    assert reader.read() == {"a": 1}
+    writer.update(lambda data: data.update(a=2))
+    assert reader.read() == {"a": 2}
+
+    # read() віддає копію — зміни викликача не псують кеш
+    reader.read()["a"] = 3
+    assert reader.read() == {"a": 2}
+
+
+def _process_worker(path: str) -> None:
+    state_backend.set_backend(SQLiteBackend(path))
+    doc = Document("counter", default=dict)
+    for _ in range(INCREMENTS):
+        doc.update(_increment)
+
+
+def test_sqlite_updates_from_several_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_process_worker, args=(path,)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    state_backend.set_backend(SQLiteBackend(path))
+    try:
+        assert Document("counter", default=dict).read()["n"] == 4 * INCREMENTS
+    finally:
+        state_backend.set_backend(None)
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from google.genai import errors as genai_errors
+
+from app import transport
+from app.gemini_handler import GeminiProvider
+
+
+def _record_error(cassette, provider, exc):
+    def method(**kwargs):
+        raise exc
+
+    with pytest.raises(type(exc)):
+        transport.RecordingTransport(cassette).call_llm(provider, ("models", "generate_content"), method, {"model": "m"})
+
+
+def _replay_error(path, provider):
+    replay = transport.ReplayTransport(transport.Cassette(path))
+    with pytest.raises(Exception) as info:
+        replay.call_llm(provider, ("models", "generate_content"), None, {"model": "m"})
+    return info.value
+
+
+def test_replayed_gemini_429_is_rate_limit(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    error = genai_errors.ClientError(429, {"error": {"code": 429, "message": "quota", "status": "RESOURCE_EXHAUSTED"}})
+    _record_error(transport.Cassette(path), "gemini", error)
+
+    replayed = _replay_error(path, "gemini")
+    assert isinstance(replayed, genai_errors.ClientError)
+    assert replayed.code == 429
+    assert replayed.status == "RESOURCE_EXHAUSTED"
+    assert GeminiProvider().is_rate_limit(replayed)
+
+
+def test_replayed_openai_error_keeps_status_code(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    _record_error(transport.Cassette(path), "openai", openai.RateLimitError("slow down", response=response, body=None))
+
+    replayed = _replay_error(path, "openai")
+    assert isinstance(replayed, openai.RateLimitError)
+    assert replayed.status_code == 429
+
+
+def test_unknown_error_class_falls_back_with_attributes():
+    exc = transport._rebuild_error({"module": "no.such.module", "type": "Boom", "message": "x", "attrs": {"code": 429}})
+    assert isinstance(exc, RuntimeError)
+    assert exc.code == 429
+
+
+def test_cassette_replays_same_key_in_order_then_repeats_last(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    cassette = transport.Cassette(path)
+    for status in (429, 200):
+        cassette.append({"kind": "http", "key": "GET u?a=1", "status": status, "body": "{}"})
+
+    replay = transport.ReplayTransport(transport.Cassette(path))
+    statuses = [replay.http_get("u", {"a": 1, "apiKey": "secret"}).status_code for _ in range(3)]
+    assert statuses == [429, 200, 200]
+
+
+def test_secret_params_are_not_part_of_key():
+    assert "secret" not in transport._http_key("u", {"apiKey": "secret", "a": 1})
+    with pytest.raises(transport.CassetteMissError):
+        transport.ReplayTransport(transport.Cassette("/nonexistent.jsonl.gz")).http_get("u")
+
+
+def test_replayed_gemini_response_with_empty_usage(tmp_path, monkeypatch):
+    from google.genai import types
+
+    from app import gemini_handler
+    from app.llm_provider import PromptParts
+
+    live = types.GenerateContentResponse(
+        candidates=[], usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=12))
+    fake = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **kwargs: live))
+    monkeypatch.setattr(gemini_handler, "clientGemini", transport.wrap_client("gemini", lambda: fake))
+    prompt = PromptParts("prefix ", "body", ("p", "w"))
+    path = str(tmp_path / "cassette.jsonl.gz")
+
+    try:
+        transport.set_transport(transport.RecordingTransport(transport.Cassette(path)))
+        recorded = GeminiProvider()._complete(prompt, "gemini-2.0-flash", "single")
+        transport.set_transport(transport.ReplayTransport(transport.Cassette(path)))
+        replayed = GeminiProvider()._complete(prompt, "gemini-2.0-flash", "single")
+    finally:
+        transport.set_transport(None)
+    assert recorded == replayed == (None, 12, None)
@@ -0,0 +1,166 @@
+import time
+from datetime import date
+
+import numpy as np
+import pytest
+
+from app import warehouse
+
+
+@pytest.fixture
+def grouped(tmp_path, monkeypatch):
+    """Сховище в tmp_path і замінник grouped daily, що запам'ятовує запитані дні."""
+    monkeypatch.setattr(warehouse, "WAREHOUSE_DIR", tmp_path / "daily")
+    monkeypatch.setattr(warehouse, "_loaded", warehouse.OrderedDict())
+    monkeypatch.setattr(warehouse, "_empty_until", {})
+    monkeypatch.setattr(warehouse, "_splits_state", None)
+    monkeypatch.setattr(warehouse, "_splits", {})
+    monkeypatch.setattr(warehouse, "_request_splits", lambda start, end: [])
+    calls = []
+    responses = {}
+
+    def request(day):
+        calls.append(day)
+        return responses.get(day, [{"T": "AAPL", "o": 1, "h": 2, "l": 0.5, "c": 1.5, "v": 100},
+                                   {"T": "MSFT", "o": 3, "h": 4, "l": 2.5, "c": 3.5, "v": 200}])
+
+    monkeypatch.setattr(warehouse, "_request_grouped", request)
+    return calls, responses
+
+
+def test_weekends_and_holidays_make_no_request(grouped):
+    calls, _ = grouped
+    assert warehouse.ingest_range(date(2024, 3, 29), date(2024, 4, 1)) == 1  # Страсна п'ятниця, вихідні, понеділок
+    assert calls == [date(2024, 4, 1)]
+
+
+def test_empty_session_response_is_not_persisted_and_retried(grouped, monkeypatch):
+    calls, responses = grouped
+    day = date(2024, 3, 5)
+    responses[day] = []
+
+    assert warehouse.ingest_day(day)
+    assert not warehouse.partition_path(day).exists()
+    # Одразу після порожньої відповіді день не запитується знову
+    assert not warehouse.ingest_day(day)
+    assert calls == [day]
+
+    monkeypatch.setattr(warehouse, "_empty_until", {})
+    del responses[day]
+    assert warehouse.ingest_day(day)
+    assert warehouse.partition_path(day).exists()
+
+
+def test_legacy_empty_session_partition_is_refetched(grouped):
+    calls, _ = grouped
+    day = date(2024, 3, 5)
+    warehouse._write_partition(day, [])
+    assert warehouse._load_partition(day) is None
+    assert not warehouse.partition_path(day).exists()
+    assert warehouse.missing_days(day, day) == [day]
+
+
+def test_daily_bars_ingests_few_missing_days_inline(grouped):
+    calls, _ = grouped
+    bars = warehouse.daily_bars("MSFT", date(2024, 3, 4), date(2024, 3, 6))
+    assert len(bars) == 3
+    assert bars[:, 4].tolist() == [3.5] * 3
+    assert sorted(calls) == [date(2024, 3, 4), date(2024, 3, 5), date(2024, 3, 6)]
+
+
+def test_daily_bars_backfills_large_gaps_in_background(grouped):
+    calls, _ = grouped
+    start, end = date(2024, 2, 1), date(2024, 2, 29)
+    with pytest.raises(warehouse.WarehouseMissError):
+        warehouse.daily_bars("AAPL", start, end)
+
+    deadline = time.monotonic() + 5
+    while warehouse.missing_days(start, end) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert warehouse.missing_days(start, end) == []
+    assert len(warehouse.daily_bars("AAPL", start, end)) == 20  # 21 будній день мінус День президентів
+
+
+def test_load_panel_aligns_tickers_across_days(grouped):
+    _, responses = grouped
+    responses[date(2024, 3, 4)] = [{"T": "AAPL", "o": 1, "h": 1, "l": 1, "c": 1, "v": 1}]
+    tickers, values = warehouse.load_panel(date(2024, 3, 5), 2)
+    assert tickers.tolist() == ["AAPL", "MSFT"]
+    assert values.shape == (2, 2, 6)
+    assert np.isnan(values[0, 1, 4]) and values[1, 1, 4] == 3.5
+
+
+@pytest.fixture
+def split(grouped, monkeypatch):
+    """AAPL 4:1 з 6 березня 2024: grouped daily без поправки дає ціни 400 до спліту і 100 після."""
+    _, responses = grouped
+    before = {"T": "AAPL", "o": 400, "h": 404, "l": 396, "c": 400, "v": 1000}
+    after = {"T": "AAPL", "o": 100, "h": 101, "l": 99, "c": 100, "v": 4000}
+    for day in (date(2024, 3, 4), date(2024, 3, 5)):
+        responses[day] = [before]
+    for day in (date(2024, 3, 6), date(2024, 3, 7), date(2024, 3, 8)):
+        responses[day] = [after]
+    warehouse.ingest_range(date(2024, 3, 4), date(2024, 3, 8))
+    requested = []
+
+    def request(start, end):
+        requested.append((start, end))
+        return [{"ticker": "AAPL", "execution_date": "2024-03-06", "split_from": 1, "split_to": 4}]
+
+    monkeypatch.setattr(warehouse, "_request_splits", request)
+    return requested
+
+
+def test_split_in_the_middle_of_the_window_is_adjusted_on_read(split):
+    bars = warehouse.daily_bars("AAPL", date(2024, 3, 4), date(2024, 3, 8))
+    assert bars[:, 4].tolist() == [100.0] * 5
+    assert bars[:, 2].tolist() == [101.0] * 5
+    assert bars[:, 5].tolist() == [4000.0] * 5
+
+    tickers, values = warehouse.load_panel(date(2024, 3, 8), 5)
+    assert tickers.tolist() == ["AAPL"]
+    assert values[:, 0, 4].tolist() == [100.0] * 5
+    # Партиції на диску лишаються без поправки, а кеш — незмінним
+    assert warehouse._load_partition(date(2024, 3, 4))[1][0, 4] == 400.0
+
+
+def test_splits_are_synced_once_a_day_and_extended_back(split):
+    warehouse.daily_bars("AAPL", date(2024, 3, 6), date(2024, 3, 8))
+    warehouse.daily_bars("AAPL", date(2024, 3, 4), date(2024, 3, 8))
+    warehouse.daily_bars("AAPL", date(2024, 3, 5), date(2024, 3, 8))
+    today = warehouse.datetime.now(warehouse.NY_TZ).date()
+    assert split == [(date(2024, 3, 6), today), (date(2024, 3, 4), date(2024, 3, 5))]
+
+    # Перелік зберігається поруч зі сховищем і читається новим процесом без запитів
+    warehouse._splits_state, warehouse._splits = None, {}
+    bars = warehouse.daily_bars("AAPL", date(2024, 3, 4), date(2024, 3, 8), ingest=False)
+    assert bars[:, 4].tolist() == [100.0] * 5
+    assert len(split) == 2
+
+
+def test_failed_split_sync_falls_back_to_per_ticker_aggregates(grouped, monkeypatch):
+    def fail(start, end):
+        raise RuntimeError("503")
+
+    monkeypatch.setattr(warehouse, "_request_splits", fail)
+    with pytest.raises(warehouse.WarehouseMissError):
+        warehouse.daily_bars("AAPL", date(2024, 3, 4), date(2024, 3, 5))
+
+
+def test_source_version_follows_reingestion_and_new_splits(grouped, monkeypatch):
+    start, end = date(2024, 3, 4), date(2024, 3, 6)
+    warehouse.ingest_range(start, end)
+    version = warehouse.source_version("AAPL", start, end)
+    assert warehouse.source_version("AAPL", start, end) == version
+    assert warehouse.source_version("MSFT", start, end) == version
+
+    warehouse.ingest_day(date(2024, 3, 5), force=True)
+    reingested = warehouse.source_version("AAPL", start, end)
+    assert reingested != version
+
+    monkeypatch.setattr(warehouse, "_request_splits", lambda first, last: [
+        {"ticker": "AAPL", "execution_date": "2024-03-05", "split_from": 1, "split_to": 2}])
+    warehouse.sync_splits(start)
+    assert warehouse.source_version("AAPL", start, end) != reingested
+    # Спліт іншого тикера не змінює відбиток
+    assert warehouse.source_version("MSFT", start, end) == reingested